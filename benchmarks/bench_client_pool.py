@@ -0,0 +1,74 @@
+"""
+连接池基准测试：对比每次新建客户端与复用长连接客户端的请求耗时
+
+用法:
+    python benchmarks/bench_client_pool.py --provider Groq --requests 10
+
+对提供商的 /models 端点依次发送请求。新建客户端的每次请求都要重新进行
+DNS 解析、TCP 连接与 TLS 握手，两者平均耗时之差即为每次请求节省的连接建立时间。
+"""
+import argparse
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import httpx
+import src.config.config
+from src.api.client_pool import _use_http2, _connection_limits
+
+
+def _timed_get(client, url, headers):
+    start = time.perf_counter()
+    try:
+        client.get(url, headers=headers, timeout=10)
+    except httpx.HTTPError as e:
+        print(f"  请求失败: {e}")
+    return time.perf_counter() - start
+
+
+def bench_fresh(url, headers, count, http2):
+    """每次请求都新建客户端（旧实现的行为）"""
+    timings = []
+    for _ in range(count):
+        with httpx.Client(http2=http2) as client:
+            timings.append(_timed_get(client, url, headers))
+    return timings
+
+
+def bench_pooled(url, headers, count, http2):
+    """复用同一个长连接客户端，首个请求用于建立连接，不计入统计"""
+    timings = []
+    with httpx.Client(http2=http2, limits=_connection_limits()) as client:
+        _timed_get(client, url, headers)
+        for _ in range(count):
+            timings.append(_timed_get(client, url, headers))
+    return timings
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark pooled vs per-request provider clients")
+    parser.add_argument("--provider", default="Groq", choices=list(src.config.config.PROVIDERS_CONFIG.keys()))
+    parser.add_argument("--requests", type=int, default=10)
+    args = parser.parse_args()
+
+    provider = src.config.config.PROVIDERS_CONFIG[args.provider]
+    url = f"{provider.base_url.rstrip('/')}/models"
+    headers = {"Authorization": f"Bearer {provider.api_key}"} if provider.api_key else {}
+    http2 = _use_http2(provider.base_url)
+
+    print(f"目标: {url} (HTTP/2: {http2}, 请求数: {args.requests})")
+    fresh = bench_fresh(url, headers, args.requests, http2)
+    pooled = bench_pooled(url, headers, args.requests, http2)
+
+    fresh_ms = statistics.mean(fresh) * 1000
+    pooled_ms = statistics.mean(pooled) * 1000
+    print(f"新建客户端: 平均 {fresh_ms:.1f} ms, 中位数 {statistics.median(fresh) * 1000:.1f} ms")
+    print(f"复用连接池: 平均 {pooled_ms:.1f} ms, 中位数 {statistics.median(pooled) * 1000:.1f} ms")
+    print(f"每次请求节省的连接建立时间: {fresh_ms - pooled_ms:.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
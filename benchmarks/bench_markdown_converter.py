@@ -0,0 +1,120 @@
+"""
+Markdown 转换器基准测试：对比每次调用新建 Markdown 实例与复用同一转换器的耗时
+
+用法:
+    python benchmarks/bench_markdown_converter.py --repeat 5
+
+以一篇典型的流式回答（段落、列表、表格、代码块）为样本，按每帧增加 --chunk 个字符
+模拟流式输出，用增量渲染器逐帧渲染。每帧至少转换一次未结束的尾部文本，
+两种方式的平均耗时之差即为每次转换节省的 Markdown 实例构建开销。
+"""
+import argparse
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import src.gui.markdown_viewer as markdown_viewer
+from src.gui.markdown_viewer import IncrementalMarkdownRenderer
+
+SAMPLE_ANSWER = """## 思路
+
+先统计每个单词出现的次数，再按次数从高到低排序，取前 **k** 个。
+时间复杂度为 `O(n log n)`，对大多数输入已经足够。
+
+1. 读取文本并转为小写
+2. 按非字母字符切分
+3. 使用 `Counter` 计数
+
+| 方法 | 时间复杂度 | 额外空间 |
+|---|---|---|
+| 排序 | O(n log n) | O(n) |
+| 堆 | O(n log k) | O(k) |
+
+```python
+import re
+from collections import Counter
+
+
+def top_words(text, k=10):
+    words = re.findall(r"[a-z']+", text.lower())
+    return Counter(words).most_common(k)
+```
+
+> 如果文本很大，可以逐行读取并累计计数，避免一次性载入内存。
+
+- 使用堆可以把复杂度降到 `O(n log k)`
+- 需要稳定排序时，按 (次数, 单词) 排序
+"""
+
+
+class _ConversionCounter:
+    """包装转换器获取函数，统计转换次数"""
+
+    def __init__(self, get_converter):
+        self.get_converter = get_converter
+        self.calls = 0
+
+    def __call__(self):
+        self.calls += 1
+        return self.get_converter()
+
+
+def stream_render(text, chunk):
+    """按每帧 chunk 个字符模拟流式输出并逐帧渲染，最后一帧作为输出结束后的渲染，返回最终 HTML"""
+    renderer = IncrementalMarkdownRenderer()
+    html = ""
+    for end in range(chunk, len(text) + chunk, chunk):
+        html = renderer.render(text[:end], end < len(text))
+    return html
+
+
+def bench(get_converter, text, chunk, repeat):
+    """
+    使用给定的转换器获取函数重复模拟流式渲染
+
+    返回:
+    - (每次流式渲染的耗时列表, 每次流式渲染的转换次数, 最终 HTML)
+    """
+    original = markdown_viewer._get_converter
+    counter = _ConversionCounter(get_converter)
+    markdown_viewer._get_converter = counter
+    try:
+        timings = []
+        html = ""
+        for _ in range(repeat):
+            start = time.perf_counter()
+            html = stream_render(text, chunk)
+            timings.append(time.perf_counter() - start)
+    finally:
+        markdown_viewer._get_converter = original
+    return timings, counter.calls // repeat, html
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark per-call vs reused Markdown converters")
+    parser.add_argument("--chunk", type=int, default=8, help="每帧新增的字符数")
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    # 预热：首次导入 Pygments 词法分析器等开销不计入统计
+    stream_render(SAMPLE_ANSWER, len(SAMPLE_ANSWER))
+
+    print(f"样本: {len(SAMPLE_ANSWER)} 个字符, 每帧 {args.chunk} 个字符, 重复 {args.repeat} 次")
+    # 每次转换都新建 Markdown 实例（旧实现的行为）
+    fresh, fresh_calls, fresh_html = bench(markdown_viewer._build_converter, SAMPLE_ANSWER, args.chunk, args.repeat)
+    reused, reused_calls, reused_html = bench(markdown_viewer._get_converter, SAMPLE_ANSWER, args.chunk, args.repeat)
+    if fresh_html != reused_html:
+        print("警告: 两种方式的渲染结果不一致")
+
+    fresh_ms = statistics.mean(fresh) * 1000
+    reused_ms = statistics.mean(reused) * 1000
+    print(f"每次新建转换器: 平均 {fresh_ms:.1f} ms, 中位数 {statistics.median(fresh) * 1000:.1f} ms ({fresh_calls} 次转换)")
+    print(f"复用转换器:     平均 {reused_ms:.1f} ms, 中位数 {statistics.median(reused) * 1000:.1f} ms ({reused_calls} 次转换)")
+    print(f"每次转换节省: {(fresh_ms - reused_ms) / fresh_calls * 1000:.0f} µs")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,23 +1,29 @@
-import openai
 import base64
 import json
-from src.config.config import get_provider_info
-from PyQt6.QtWidgets import QApplication
+from src.api.cancellation import StreamCancelled
+from src.api.errors import ContextLimitExceeded, StreamInterrupted
+from src.api.resume import stream_with_resume
+from src.api.engine import OpenAICompatibleProvider, stream_provider
+from src.api.hedge import find_hedge_group, stream_hedged, format_win_rates
+from src.api.draft import draft_model_for, stream_with_draft
+from src.api.scheduler import run_scheduled
+from src.api.token_budget import estimate_tokens, input_limit, request_budget, trim_history
+from src.api.response_cache import make_cache_key, lookup_response, store_response
+from src.api.history import update_history, SUMMARY_PREFIX
+from src.api.prompt_layout import layout_enabled, stable_system_prompt
+from src.api.circuit_breaker import (
+    call_with_breaker, stream_with_failover, provider_name_of, is_circuit_open, has_failover
+)
 from src.gui.lang import STRINGS
 import src.config.config
-from src.api.gemini_api import fetch_gemini_response, fetch_gemini_response_with_history, get_auxiliary_mode_prompt
+from src.api.gemini_api import (
+    fetch_gemini_response, fetch_gemini_response_with_history, get_auxiliary_mode_prompt, stream_gemini_messages
+)
+from src.api.map_reduce import run_map_reduce
 
 
-def _get_openai_client(model_name):
-    provider_info = get_provider_info(model_name)
-    if (provider_info):
-        client = openai.OpenAI(
-            base_url=provider_info.base_url,
-            api_key=provider_info.api_key
-        )
-        clean_model_name = model_name[model_name.index("]") + 2:]
-        return client, clean_model_name
-    return openai.OpenAI(), model_name
+DEFAULT_SYSTEM_PROMPT = "You are a helpful assistant analyzing transcripts from meetings or conversations."
+
 
 def encode_image_to_base64(image_path):
     """Encode an image file to base64 string"""
@@ -27,7 +33,156 @@ def encode_image_to_base64(image_path):
     with open(image_path, "rb") as image_file:
         return base64.b64encode(image_file.read()).decode('utf-8')
 
-def fetch_model_response(prompt, content_area, model_name, temperature, image_paths=None):
+def _estimate_messages_tokens(messages):
+    """估算消息列表的 token 数，图片部分不计入"""
+    total = 0
+    for message in messages:
+        content = message.get("content")
+        if isinstance(content, str):
+            total += estimate_tokens(content)
+        elif isinstance(content, list):
+            total += sum(estimate_tokens(part.get("text")) for part in content if part.get("type") == "text")
+    return total
+
+def _stream_chat_completion(params, model_name, content_area, cancel_token=None):
+    """
+    发送 OpenAI 兼容的流式请求并把增量文本追加到输出区域
+
+    请求经过 scheduler：按提供商的 RPM/TPM 限制排队，暂时性错误自动重试。
+
+    参数:
+    - params: 请求参数（不含 model）
+    - model_name: 带提供商前缀的模型名称
+    - content_area: 输出对象，需提供 append_text 方法
+    - cancel_token: 可选的取消令牌
+
+    返回:
+    - str: 完整回复文本
+    """
+    return run_scheduled(
+        provider_name_of(model_name),
+        _estimate_messages_tokens(params["messages"]),
+        lambda sink: _request_chat_completion(params, model_name, sink, cancel_token),
+        content_area,
+        cancel_token
+    )
+
+def _request_chat_completion(params, model_name, content_area, cancel_token=None):
+    """在 provider engine 上发送单次 OpenAI 兼容的流式请求，返回完整回复文本"""
+    return stream_provider(OpenAICompatibleProvider(model_name, params), content_area, cancel_token)
+
+def _check_context_limit(messages, model_name):
+    """输入超出模型的上下文窗口时直接报错，不发送注定失败的请求"""
+    tokens = _estimate_messages_tokens(messages)
+    limit = input_limit(model_name)
+    if tokens > limit:
+        raise ContextLimitExceeded(model_name, tokens, limit)
+
+def _continuation_params(params, partial):
+    """续传请求的参数：在原消息之后附加已输出的部分回复与续写提示"""
+    if not partial:
+        return params
+    messages = list(params["messages"]) + [
+        {"role": "assistant", "content": partial},
+        {"role": "user", "content": src.config.config.STREAM_RESUME_PROMPT},
+    ]
+    return dict(params, messages=messages)
+
+def _stream_openai_compatible(params, model_name, content_area, cancel_token=None):
+    """
+    发送 OpenAI 兼容的流式请求
+
+    启用对冲请求且模型属于对冲组时，同时向组内各提供商发送请求，采用最先返回 token 的结果；
+    否则按故障转移链依次尝试，熔断器打开的提供商直接跳过。
+    输入超出模型上下文窗口时抛出 ContextLimitExceeded，不发送请求。
+    """
+    _check_context_limit(params["messages"], model_name)
+    lang = getattr(content_area, 'current_lang', 'zh')
+    group_name, models = None, None
+    if src.config.config.ENABLE_HEDGED_REQUESTS:
+        group_name, models = find_hedge_group(model_name)
+    if not models or len(models) < 2:
+        # 中途断开时带着已输出的部分回复续传，续传请求同样可以转移到故障转移链中的其他模型
+        full_response, used_model = stream_with_resume(
+            model_name,
+            lambda resume_model, partial, resume_sink, resume_token: stream_with_failover(
+                resume_model,
+                lambda candidate, sink, token: _stream_chat_completion(
+                    _continuation_params(params, partial), candidate, sink, token
+                ),
+                resume_sink,
+                resume_token
+            ),
+            content_area,
+            cancel_token
+        )
+        if used_model != model_name:
+            content_area.set_status(STRINGS[lang]['failover_switched'].format(model_name, used_model))
+        return full_response
+
+    # 熔断中的提供商不参与对冲；全部熔断时仍全部发送，由熔断器给出错误
+    available = [m for m in models if not is_circuit_open(m)] or models
+    full_response, winner = stream_hedged(
+        available,
+        lambda candidate, sink, token: call_with_breaker(
+            provider_name_of(candidate),
+            lambda: _stream_chat_completion(params, candidate, sink, token)
+        ),
+        content_area,
+        cancel_token,
+        group_name
+    )
+    if winner:
+        content_area.set_status(STRINGS[lang]['hedge_winner'].format(winner, format_win_rates(group_name)))
+    return full_response
+
+def _stream_answer(params, model_name, content_area, cancel_token=None):
+    """
+    流式输出面向用户的回答
+
+    启用草稿-正式回答模式时，同一请求同时发送给 DRAFT_MODEL，草稿先行显示；
+    包含图片的请求不使用草稿，快速模型通常不支持图像输入。
+    """
+    draft_model = draft_model_for(model_name)
+    has_image = any(isinstance(message["content"], list) for message in params["messages"])
+    if not draft_model or has_image:
+        return _stream_openai_compatible(params, model_name, content_area, cancel_token)
+    return stream_with_draft(
+        draft_model,
+        model_name,
+        lambda candidate, sink, token: _stream_openai_compatible(params, candidate, sink, token),
+        content_area,
+        cancel_token
+    )
+
+def _use_gemini_native(model_name):
+    """Gemini 模型使用原生 SDK；熔断中且配置了故障转移链时改走 OpenAI 兼容路径进行转移"""
+    return "[Gemini]" in model_name and not (has_failover(model_name) and is_circuit_open(model_name))
+
+def stream_messages(model_name, messages, temperature, content_area, cancel_token=None):
+    """
+    发送纯文本消息列表 [(role, content), ...] 的流式请求，供内部流水线使用
+
+    与 fetch_* 函数不同，不添加附加模式提示词，不使用响应缓存，失败时直接抛出异常。
+    """
+    if _use_gemini_native(model_name):
+        return stream_gemini_messages(model_name, messages, temperature, content_area, cancel_token)
+    params = {
+        "messages": [{"role": role, "content": content} for role, content in messages],
+        "stream": True,
+        "temperature": float(temperature),
+        "top_p": 1
+    }
+    return _stream_openai_compatible(params, model_name, content_area, cancel_token)
+
+def _replay_cached_response(cached_response, content_area):
+    """把缓存的回复一次性输出到输出区域，并在状态栏提示命中缓存"""
+    lang = getattr(content_area, 'current_lang', 'zh')
+    content_area.append_text(cached_response)
+    content_area.set_status(STRINGS[lang]['response_cache_hit'])
+    return cached_response
+
+def fetch_model_response(prompt, content_area, model_name, temperature, image_paths=None, cancel_token=None, comparison=False):
     """
     从API获取模型的回复
     
@@ -37,6 +192,8 @@ def fetch_model_response(prompt, content_area, model_name, temperature, image_pa
     - model_name: 使用的模型名称
     - temperature: 温度参数
     - image_paths: 可选的图片路径列表
+    - cancel_token: 可选的取消令牌
+    - comparison: 多模型对比中的单个请求，不使用响应缓存、草稿、对冲与故障转移，测得模型本身的耗时
     """
     try:
         # 首先清空输出
@@ -46,14 +203,26 @@ def fetch_model_response(prompt, content_area, model_name, temperature, image_pa
         aux_mode = src.config.config.CURRENT_AUXILIARY_MODE
         aux_prompt = get_auxiliary_mode_prompt(aux_mode)
         
-        # 如果启用了附加模式，将附加提示词添加到prompt后面
-        if aux_prompt and prompt:
+        # 如果启用了附加模式，将附加提示词添加到prompt后面；
+        # 提示缓存友好布局下附加提示词与预定义前缀放入系统提示，位于易变的用户消息之前
+        system_prompt = ""
+        if layout_enabled():
+            system_prompt = stable_system_prompt()
+            final_prompt = prompt
+        elif aux_prompt and prompt:
             final_prompt = f"{prompt}\n\n{aux_prompt}"
         else:
             final_prompt = prompt
         
-        # 检查是否为Gemini模型
-        if "[Gemini]" in model_name:
+        # 温度为 0 的确定性请求优先使用本地响应缓存
+        cache_messages = ([("system", system_prompt)] if system_prompt else []) + [("user", final_prompt)]
+        cache_key = None if comparison else make_cache_key(model_name, temperature, cache_messages, image_paths)
+        cached_response = lookup_response(cache_key)
+        if cached_response is not None:
+            return _replay_cached_response(cached_response, content_area)
+        
+        # 检查是否为Gemini模型；对比请求不转移到其他提供商，始终使用原生 SDK
+        if ("[Gemini]" in model_name) if comparison else _use_gemini_native(model_name):
             # 使用Gemini API
             return fetch_gemini_response(
                 final_prompt, 
@@ -61,7 +230,11 @@ def fetch_model_response(prompt, content_area, model_name, temperature, image_pa
                 model_name, 
                 temperature, 
                 image_paths=image_paths, 
-                use_search=src.config.config.ENABLE_GEMINI_SEARCH
+                use_search=src.config.config.ENABLE_GEMINI_SEARCH,
+                system_instruction=system_prompt,
+                cancel_token=cancel_token,
+                cache_key=cache_key,
+                resume=not comparison
             )
         
         # 以下是原始的OpenAI API处理逻辑
@@ -102,7 +275,10 @@ def fetch_model_response(prompt, content_area, model_name, temperature, image_pa
         # 根据是否包含图像来决定是否添加系统消息
         messages = []
         if not has_image:
-            messages.append({"role": "system", "content": ""})
+            messages.append({"role": "system", "content": system_prompt})
+        elif system_prompt:
+            # 不添加系统消息时，稳定部分放在用户消息最前面
+            user_message["content"].insert(0, {"type": "text", "text": system_prompt})
         
         messages.append(user_message)
 
@@ -113,31 +289,21 @@ def fetch_model_response(prompt, content_area, model_name, temperature, image_pa
             "top_p": 1
         }
 
-        client, model_name = _get_openai_client(model_name)
-        params["model"] = model_name
-
-        # Special handling for specific providers
-        if model_name.startswith("cerebras"):
-            params["max_completion_tokens"] = 8192
-
-        stream = client.chat.completions.create(**params)
-        
-        # 存储完整回复内容用于更新历史记录
-        full_response = ""
-        
-        for chunk in stream:
-            delta = chunk.choices[0].delta.content or ""
-            full_response += delta
-            # 使用content_area的append_text方法添加文本，支持Markdown渲染
-            content_area.append_text(delta)
+        if comparison:
+            # 对比请求直接发送给所选模型，不经过对冲、故障转移与续传，结果与耗时均属于该模型本身
+            _check_context_limit(params["messages"], model_name)
+            full_response = _stream_chat_completion(params, model_name, content_area, cancel_token)
+        else:
+            full_response = _stream_answer(params, model_name, content_area, cancel_token)
+        store_response(cache_key, model_name, full_response)
             
         # 如果启用了连续对话功能，需要记录对话历史
-        if hasattr(content_area.parent.parent, 'content_area') and src.config.config.ENABLE_CONTINUOUS_DIALOGUE:
+        if src.config.config.ENABLE_CONTINUOUS_DIALOGUE and hasattr(content_area, 'parent') and hasattr(content_area.parent.parent, 'content_area'):
             dialogue_history = content_area.parent.parent.content_area.dialogue_history
             
             # 如果历史记录为空，添加系统消息
             if not dialogue_history and prompt:
-                dialogue_history.append(("system", "You are a helpful assistant analyzing transcripts from meetings or conversations."))
+                dialogue_history.append(("system", DEFAULT_SYSTEM_PROMPT))
             
             # 添加用户消息
             if prompt:
@@ -157,15 +323,24 @@ def fetch_model_response(prompt, content_area, model_name, temperature, image_pa
             
         return full_response
 
+    except StreamCancelled:
+        # 请求已被取消（用户停止或被新请求替代），不记录历史也不显示错误
+        return ""
+
     except Exception as e:
-        main_window = QApplication.instance().activeWindow()
-        lang = main_window.current_lang if main_window else 'zh'
+        # 在工作线程中运行时不能访问窗口对象，语言由输出对象提供
+        lang = getattr(content_area, 'current_lang', 'zh')
         error_message = f"{STRINGS[lang]['model_call_error']}{str(e)}"
-        content_area.clear_output()
-        content_area.append_text(error_message)
+        if isinstance(e, StreamInterrupted):
+            # 保留已输出的部分回复，在其后附上错误信息
+            content_area.append_text(f"\n\n{error_message}")
+        else:
+            content_area.clear_output()
+            content_area.append_text(error_message)
         return error_message
 
-def fetch_model_response_with_history(prompt, content_area, model_name, temperature, history, image_paths=None):
+def fetch_model_response_with_history(prompt, content_area, model_name, temperature, history, image_paths=None, cancel_token=None,
+                                      transcript_parts=None):
     """
     从API获取模型的回复，支持连续对话
     
@@ -176,6 +351,9 @@ def fetch_model_response_with_history(prompt, content_area, model_name, temperat
     - temperature: 温度参数
     - history: 对话历史记录 [(role, content), ...]
     - image_paths: 可选的图片路径列表
+    - cancel_token: 可选的取消令牌
+    - transcript_parts: 可选，本次对话中依次发送过的转录文本（含本轮）；Gemini 原生接口据此把
+      转录文本作为可缓存的前缀单独发送，其他接口的转录文本已包含在历史与 prompt 中
     """
     try:
         # 首先清空输出
@@ -185,14 +363,28 @@ def fetch_model_response_with_history(prompt, content_area, model_name, temperat
         aux_mode = src.config.config.CURRENT_AUXILIARY_MODE
         aux_prompt = get_auxiliary_mode_prompt(aux_mode)
         
-        # 如果启用了附加模式，将附加提示词添加到prompt后面
-        if aux_prompt and prompt:
+        # 如果启用了附加模式，将附加提示词添加到prompt后面；
+        # 提示缓存友好布局下附加提示词与预定义前缀放入系统提示，位于历史消息之前
+        system_prompt = ""
+        if layout_enabled():
+            system_prompt = stable_system_prompt()
+            final_prompt = prompt
+        elif aux_prompt and prompt:
             final_prompt = f"{prompt}\n\n{aux_prompt}"
         else:
             final_prompt = prompt
         
+        # 温度为 0 的确定性请求优先使用本地响应缓存
+        cache_messages = ([("system", system_prompt)] if system_prompt else []) + list(history or []) + [("user", final_prompt)]
+        cache_key = make_cache_key(model_name, temperature, cache_messages, image_paths)
+        cached_response = lookup_response(cache_key)
+        if cached_response is not None:
+            _replay_cached_response(cached_response, content_area)
+            update_history(history, prompt, cached_response, model_name)
+            return cached_response
+        
         # 检查是否为Gemini模型
-        if "[Gemini]" in model_name:
+        if _use_gemini_native(model_name):
             # 使用Gemini API
             return fetch_gemini_response_with_history(
                 final_prompt, 
@@ -201,7 +393,12 @@ def fetch_model_response_with_history(prompt, content_area, model_name, temperat
                 temperature, 
                 history,
                 image_paths=image_paths, 
-                use_search=src.config.config.ENABLE_GEMINI_SEARCH
+                use_search=src.config.config.ENABLE_GEMINI_SEARCH,
+                system_instruction=system_prompt,
+                cancel_token=cancel_token,
+                cache_key=cache_key,
+                history_prompt=prompt,
+                transcript_parts=transcript_parts
             )
         
         # 以下是原始的OpenAI API处理逻辑
@@ -209,11 +406,26 @@ def fetch_model_response_with_history(prompt, content_area, model_name, temperat
         messages = []
         
         # 添加系统消息
-        if not history or history[0][0] != "system":
-            messages.append({"role": "system", "content": "You are a helpful assistant analyzing transcripts from meetings or conversations."})
+        history_messages = list(history)
+        if (history_messages and history_messages[0][0] == "system"
+                and not history_messages[0][1].startswith(SUMMARY_PREFIX)):
+            base_system = history_messages.pop(0)[1]
+        else:
+            base_system = DEFAULT_SYSTEM_PROMPT
+        if system_prompt:
+            # 稳定部分合并进首条系统消息，历史消息与本轮输入依次追加在其后
+            base_system = stable_system_prompt(base_system)
+        messages.append({"role": "system", "content": base_system})
+
+        # 对话历史超出 token 预算时省略较早的消息，优先保证本轮输入完整
+        history_budget = request_budget(model_name) - estimate_tokens(base_system) - estimate_tokens(final_prompt)
+        history_messages, dropped = trim_history(history_messages, history_budget)
+        if dropped:
+            lang = getattr(content_area, 'current_lang', 'zh')
+            content_area.set_status(STRINGS[lang]['history_trimmed'].format(dropped))
         
         # 添加历史消息
-        for role, content in history:
+        for role, content in history_messages:
             if role in ["system", "user", "assistant"]:
                 messages.append({"role": role, "content": content})
         
@@ -259,67 +471,66 @@ def fetch_model_response_with_history(prompt, content_area, model_name, temperat
             "top_p": 1
         }
 
-        client, model_name = _get_openai_client(model_name)
-        params["model"] = model_name
-
-        # 特殊处理特定提供商
-        if model_name.startswith("cerebras"):
-            params["max_completion_tokens"] = 8192
-
-        stream = client.chat.completions.create(**params)
-        
-        # 存储完整回复内容用于更新历史记录
-        full_response = ""
-        
-        for chunk in stream:
-            delta = chunk.choices[0].delta.content or ""
-            full_response += delta
-            # 使用content_area的append_text方法添加文本，支持Markdown渲染
-            content_area.append_text(delta)
+        full_response = _stream_answer(params, model_name, content_area, cancel_token)
+        store_response(cache_key, model_name, full_response)
             
         # 更新对话历史
-        if history is not None:
-            # 添加用户消息（如果有）
-            if prompt:  # 注意这里保存原始的prompt，不包含附加提示词
-                history.append(("user", prompt))
-                
-            # 添加助手消息
-            if full_response:
-                history.append(("assistant", full_response))
-                
-            # 如果历史太长，保留最近的消息
-            max_history = src.config.config.MAX_CONTEXT_MESSAGES
-            if len(history) > max_history:
-                if src.config.config.SUMMARIZE_CONTEXT:
-                    # 保留系统消息，但创建一个早期消息的摘要
-                    system_msg = None
-                    if history[0][0] == "system":
-                        system_msg = history[0]
-                        
-                    # 创建摘要的内容
-                    summary = "Previous conversation summary:\n"
-                    for i, (role, content) in enumerate(history[:len(history) - max_history + 2]):
-                        if i == 0 and role == "system":
-                            continue  # 跳过系统消息
-                        summary += f"{role}: {content[:100]}...\n"
-                    
-                    # 重建历史记录
-                    new_history = []
-                    if system_msg:
-                        new_history.append(system_msg)
-                    new_history.append(("system", summary))
-                    new_history.extend(history[-(max_history-2):])
-                    history[:] = new_history
-                else:
-                    # 简单地保留最近的消息
-                    history[:] = history[-max_history:]
+        update_history(history, prompt, full_response, model_name)
         
         return full_response
                 
+    except StreamCancelled:
+        # 请求已被取消（用户停止或被新请求替代），不记录历史也不显示错误
+        return ""
+
     except Exception as e:
-        main_window = QApplication.instance().activeWindow()
-        lang = main_window.current_lang if main_window else 'zh'
+        # 在工作线程中运行时不能访问窗口对象，语言由输出对象提供
+        lang = getattr(content_area, 'current_lang', 'zh')
         error_message = f"{STRINGS[lang]['model_call_error']}{str(e)}"
+        if isinstance(e, StreamInterrupted):
+            # 保留已输出的部分回复，在其后附上错误信息
+            content_area.append_text(f"\n\n{error_message}")
+        else:
+            content_area.clear_output()
+            content_area.append_text(error_message)
+        return error_message
+
+def fetch_map_reduce_response(transcript, content_area, model_name, temperature, context="", cancel_token=None):
+    """
+    对超出模型 token 预算的转录文本进行分段汇总
+
+    参数:
+    - transcript: 转录文本
+    - content_area: ContentArea实例，用于显示汇总结果
+    - model_name: 使用的模型名称
+    - temperature: 温度参数
+    - context: 其他输入（用户前缀、后缀、OCR 文本），随汇总请求一起发送
+    - cancel_token: 可选的取消令牌
+    """
+    try:
         content_area.clear_output()
-        content_area.append_text(error_message)
+        # 任务说明为预定义前缀与附加模式提示词
+        instructions = stable_system_prompt()
+        return run_map_reduce(
+            transcript,
+            content_area,
+            model_name,
+            instructions,
+            lambda candidate, messages, sink, token: stream_messages(candidate, messages, temperature, sink, token),
+            context=context,
+            cancel_token=cancel_token
+        )
+
+    except StreamCancelled:
+        return ""
+
+    except Exception as e:
+        lang = getattr(content_area, 'current_lang', 'zh')
+        error_message = f"{STRINGS[lang]['model_call_error']}{str(e)}"
+        if isinstance(e, StreamInterrupted):
+            # 保留已输出的部分回复，在其后附上错误信息
+            content_area.append_text(f"\n\n{error_message}")
+        else:
+            content_area.clear_output()
+            content_area.append_text(error_message)
         return error_message
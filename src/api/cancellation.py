@@ -0,0 +1,115 @@
+import socket
+import threading
+from contextlib import contextmanager
+
+
+class StreamCancelled(Exception):
+    """流式请求已被取消"""
+
+
+class CancelToken:
+    """
+    流式请求的取消令牌
+
+    调用 cancel() 后会立即执行所有已注册的关闭函数（例如关闭底层 HTTP 响应），
+    使服务端尽快停止生成；流式循环也会在下一个数据块处检查并退出。
+    可在任意线程中调用 cancel()。
+    """
+
+    def __init__(self):
+        self._event = threading.Event()
+        self._lock = threading.Lock()
+        self._closers = []
+
+    @property
+    def is_cancelled(self):
+        return self._event.is_set()
+
+    def cancel(self):
+        """取消请求并关闭已注册的资源"""
+        with self._lock:
+            if self._event.is_set():
+                return
+            self._event.set()
+            closers, self._closers = self._closers, []
+        for closer in closers:
+            try:
+                closer()
+            except Exception:
+                pass
+
+    def register(self, closer):
+        """注册取消时需要调用的关闭函数，若已取消则立即调用"""
+        with self._lock:
+            if not self._event.is_set():
+                self._closers.append(closer)
+                return
+        try:
+            closer()
+        except Exception:
+            pass
+
+    def wait(self, timeout):
+        """
+        等待指定秒数，期间被取消则提前返回
+
+        返回:
+        - bool: 是否已被取消
+        """
+        return self._event.wait(timeout)
+
+    def raise_if_cancelled(self):
+        if self._event.is_set():
+            raise StreamCancelled()
+
+
+_local = threading.local()
+
+
+@contextmanager
+def bind_cancel_token(token):
+    """在当前线程中绑定取消令牌，期间收到的 HTTP 响应都会注册到该令牌上"""
+    previous = getattr(_local, "token", None)
+    _local.token = token
+    try:
+        yield token
+    finally:
+        _local.token = previous
+
+
+def current_cancel_token():
+    """返回当前线程绑定的取消令牌"""
+    return getattr(_local, "token", None)
+
+
+def abort_response(response):
+    """
+    中止仍在读取中的 HTTP 响应
+
+    在其他线程中直接 close() 无法唤醒阻塞在读取上的线程，因此关闭底层套接字：
+    读取线程会立即收到连接错误并自行清理，服务端也随即检测到断开并停止生成。
+    已正常结束的响应连接已回到连接池，不做处理。
+    """
+    if response.is_closed:
+        return
+    network_stream = response.extensions.get("network_stream")
+    sock = network_stream.get_extra_info("socket") if network_stream is not None else None
+    if sock is None:
+        response.close()
+        return
+    try:
+        sock.shutdown(socket.SHUT_RDWR)
+    except OSError:
+        pass
+
+
+def track_response(response):
+    """
+    httpx 的 response 事件钩子
+
+    响应头到达时把该响应注册到当前线程的取消令牌上，
+    取消时直接断开连接，服务端随即停止生成。
+    """
+    token = current_cancel_token()
+    if token is not None:
+        token.register(lambda: abort_response(response))
@@ -0,0 +1,204 @@
+import threading
+import time
+from src.config.config import get_provider_info
+import src.config.config
+from src.api.cancellation import StreamCancelled
+from src.api.errors import RateLimitExceeded, is_provider_failure
+from src.api.sinks import TrackingSink
+
+
+class CircuitOpenError(Exception):
+    """提供商的熔断器处于打开状态，请求未发送"""
+
+    def __init__(self, provider_name, retry_in):
+        self.provider_name = provider_name
+        self.retry_in = retry_in
+        super().__init__(f"Circuit open for provider {provider_name}, retry in {retry_in:.0f}s")
+
+
+class CircuitBreaker:
+    """
+    单个提供商的熔断器
+
+    - closed: 正常放行，连续失败达到 CIRCUIT_BREAKER_FAILURE_THRESHOLD 次后打开
+    - open: 直接拒绝请求，CIRCUIT_BREAKER_COOLDOWN 秒后进入半开状态
+    - half_open: 只放行一个试探请求，成功则关闭，失败则重新打开
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, name):
+        self.name = name
+        self._lock = threading.Lock()
+        self._state = self.CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._probe_in_flight = False
+
+    @property
+    def state(self):
+        with self._lock:
+            return self._state
+
+    def _cooldown_remaining(self):
+        return self._opened_at + src.config.config.CIRCUIT_BREAKER_COOLDOWN - time.monotonic()
+
+    def is_open(self):
+        """熔断器是否会拒绝下一个请求（不占用半开状态的试探机会）"""
+        with self._lock:
+            if self._state == self.OPEN:
+                return self._cooldown_remaining() > 0
+            return self._state == self.HALF_OPEN and self._probe_in_flight
+
+    def allow_request(self):
+        """
+        判断是否放行请求
+
+        返回:
+        - bool: 放行时为 True；半开状态下放行的请求即为试探请求
+        """
+        with self._lock:
+            if self._state == self.CLOSED:
+                return True
+            if self._state == self.OPEN:
+                if self._cooldown_remaining() > 0:
+                    return False
+                self._state = self.HALF_OPEN
+                self._probe_in_flight = False
+            if self._probe_in_flight:
+                return False
+            self._probe_in_flight = True
+            return True
+
+    def retry_in(self):
+        """距离下一次允许试探请求的秒数"""
+        with self._lock:
+            return max(0.0, self._cooldown_remaining()) if self._state == self.OPEN else 0.0
+
+    def record_success(self):
+        with self._lock:
+            self._state = self.CLOSED
+            self._failures = 0
+            self._probe_in_flight = False
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            self._probe_in_flight = False
+            if self._state == self.HALF_OPEN or self._failures >= src.config.config.CIRCUIT_BREAKER_FAILURE_THRESHOLD:
+                self._state = self.OPEN
+                self._opened_at = time.monotonic()
+
+    def release(self):
+        """请求被取消、结果未知时归还半开状态的试探机会"""
+        with self._lock:
+            self._probe_in_flight = False
+
+
+_breakers = {}
+_breakers_lock = threading.Lock()
+
+
+def get_breaker(provider_name):
+    """获取提供商对应的熔断器，不存在时创建"""
+    with _breakers_lock:
+        breaker = _breakers.get(provider_name)
+        if breaker is None:
+            breaker = _breakers[provider_name] = CircuitBreaker(provider_name)
+        return breaker
+
+
+def provider_name_of(model_name):
+    """返回模型所属提供商名称，未知提供商返回 None"""
+    provider_info = get_provider_info(model_name or "")
+    return provider_info.name if provider_info else None
+
+
+def is_circuit_open(model_name):
+    """模型所属提供商的熔断器是否处于打开状态"""
+    provider_name = provider_name_of(model_name)
+    return provider_name is not None and get_breaker(provider_name).is_open()
+
+
+def call_with_breaker(provider_name, fn):
+    """
+    在提供商熔断器的保护下执行请求
+
+    参数:
+    - provider_name: 提供商名称，为 None 时直接执行
+    - fn: 无参函数，执行实际请求
+
+    返回:
+    - fn 的返回值
+
+    熔断器打开时不发送请求，直接抛出 CircuitOpenError。
+    本地速率限制拒绝的请求（RateLimitExceeded）未发送，不计为提供商的失败。
+    """
+    if provider_name is None:
+        return fn()
+    breaker = get_breaker(provider_name)
+    if not breaker.allow_request():
+        raise CircuitOpenError(provider_name, breaker.retry_in())
+    try:
+        result = fn()
+    except (StreamCancelled, RateLimitExceeded):
+        breaker.release()
+        raise
+    except Exception as e:
+        if is_provider_failure(e):
+            breaker.record_failure()
+        else:
+            breaker.release()
+        raise
+    breaker.record_success()
+    return result
+
+
+def failover_chain(model_name):
+    """返回模型的故障转移链，所选模型排在首位"""
+    chain = src.config.config.FAILOVER_CHAINS.get(model_name, [])
+    return [model_name] + [m for m in chain if m != model_name]
+
+
+def has_failover(model_name):
+    return bool(src.config.config.FAILOVER_CHAINS.get(model_name))
+
+
+def stream_with_failover(model_name, stream_fn, content_area, cancel_token=None):
+    """
+    依次尝试故障转移链中的模型，直到某个模型成功
+
+    参数:
+    - model_name: 所选模型
+    - stream_fn: stream_fn(model_name, content_area, cancel_token) -> str，执行单个流式请求
+    - content_area: 输出对象
+    - cancel_token: 可选的取消令牌
+
+    返回:
+    - (full_response, used_model)
+
+    熔断器打开的提供商直接跳过；只有在尚未输出任何文本前失败才会转移，
+    已经输出部分内容后的失败直接抛出，避免把两个模型的回复拼接在一起。
+    """
+    last_error = None
+    for candidate in failover_chain(model_name):
+        if cancel_token:
+            cancel_token.raise_if_cancelled()
+        sink = TrackingSink(content_area)
+        try:
+            result = call_with_breaker(
+                provider_name_of(candidate),
+                lambda: stream_fn(candidate, sink, cancel_token)
+            )
+            return result, candidate
+        except CircuitOpenError as e:
+            last_error = e
+        except StreamCancelled:
+            raise
+        except Exception as e:
+            if sink.has_output or not is_provider_failure(e):
+                raise
+            last_error = e
+    raise last_error
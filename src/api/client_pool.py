@@ -0,0 +1,133 @@
+import os
+import threading
+import httpx
+import openai
+from google import genai
+from google.genai import types
+from src.config.config import get_provider_info
+import src.config.config
+from src.api.cancellation import track_response
+from src.api.metrics import mark_response_headers
+
+try:
+    import h2  # noqa: F401  httpx 的 HTTP/2 支持依赖 h2
+    HTTP2_AVAILABLE = True
+except ImportError:
+    HTTP2_AVAILABLE = False
+
+# 按提供商名称缓存的异步客户端: {provider_name: (base_url, api_key, client, http_client)}
+# 异步客户端只在 provider engine 的事件循环中使用
+_openai_clients = {}
+# Gemini 原生 SDK 客户端: (api_key, client)，异步请求通过 client.aio 发送
+_gemini_client = None
+_lock = threading.Lock()
+
+
+def _use_http2(base_url):
+    """仅对 https 端点启用 HTTP/2，服务端不支持时会通过 ALPN 自动回退到 HTTP/1.1"""
+    return HTTP2_AVAILABLE and bool(base_url) and base_url.startswith("https://")
+
+
+def _connection_limits():
+    return httpx.Limits(
+        max_connections=src.config.config.HTTP_MAX_CONNECTIONS,
+        max_keepalive_connections=src.config.config.HTTP_MAX_KEEPALIVE_CONNECTIONS,
+        keepalive_expiry=src.config.config.HTTP_KEEPALIVE_EXPIRY
+    )
+
+
+def _build_openai_client(base_url, api_key):
+    http_client = openai.DefaultAsyncHttpxClient(
+        http2=_use_http2(base_url),
+        limits=_connection_limits(),
+        event_hooks={"response": [mark_response_headers]}
+    )
+    # 重试由 scheduler 统一处理（遵守 Retry-After 并计入速率限制），关闭 SDK 自带的重试
+    client = openai.AsyncOpenAI(base_url=base_url, api_key=api_key, http_client=http_client, max_retries=0)
+    return client, http_client
+
+
+def get_async_openai_client(model_name):
+    """
+    获取模型对应提供商的长连接异步客户端
+
+    客户端按 PROVIDERS_CONFIG 中的提供商缓存，只有在 base_url 或 api_key
+    发生变化时才重新创建，从而复用已建立的 TCP/TLS 连接。
+
+    返回:
+    - (client, clean_model_name)
+    """
+    client, _, clean_model_name = _get_pooled_entry(model_name)
+    return client, clean_model_name
+
+
+def get_async_http_client(model_name):
+    """获取模型对应提供商连接池所使用的 httpx 异步客户端及其 base_url"""
+    _, http_client, _ = _get_pooled_entry(model_name)
+    provider_info = get_provider_info(model_name)
+    return http_client, provider_info.base_url if provider_info else None
+
+
+def _get_pooled_entry(model_name):
+    provider_info = get_provider_info(model_name)
+    if provider_info:
+        key = provider_info.name
+        base_url = provider_info.base_url
+        api_key = provider_info.api_key
+        clean_model_name = model_name[model_name.index("]") + 2:]
+    else:
+        # 未知提供商，使用 openai 默认配置
+        key = None
+        base_url = None
+        api_key = os.environ.get("OPENAI_API_KEY")
+        clean_model_name = model_name
+
+    with _lock:
+        cached = _openai_clients.get(key)
+        if cached and cached[0] == base_url and cached[1] == api_key:
+            return cached[2], cached[3], clean_model_name
+
+        # 旧客户端可能仍被进行中的请求使用，不主动关闭，由垃圾回收释放
+        client, http_client = _build_openai_client(base_url, api_key)
+        _openai_clients[key] = (base_url, api_key, client, http_client)
+    return client, http_client, clean_model_name
+
+
+def get_gemini_client():
+    """获取 Gemini 原生 SDK 的长连接客户端，API Key 变化时重新创建"""
+    global _gemini_client
+    api_key = os.environ.get("GEMINI_API_KEY")
+
+    with _lock:
+        cached = _gemini_client
+        if cached and cached[0] == api_key:
+            return cached[1]
+
+        client_args = {
+            "http2": HTTP2_AVAILABLE,
+            "limits": _connection_limits()
+        }
+        # 同步客户端（上传图片）注册取消钩子；异步客户端（流式请求）记录响应头到达时间
+        sync_client_args = dict(client_args, event_hooks={"response": [track_response]})
+        async_client_args = dict(client_args, event_hooks={"response": [mark_response_headers]})
+        client = genai.Client(
+            api_key=api_key,
+            http_options=types.HttpOptions(client_args=sync_client_args, async_client_args=async_client_args)
+        )
+        _gemini_client = (api_key, client)
+    return client
+
+
+async def aclose_all():
+    """在 provider engine 的事件循环中关闭所有缓存的客户端及其连接池"""
+    global _gemini_client
+    with _lock:
+        clients = [entry[2] for entry in _openai_clients.values()]
+        _openai_clients.clear()
+        gemini_client = _gemini_client[1] if _gemini_client else None
+        _gemini_client = None
+    for client in clients:
+        await client.close()
+    if gemini_client is not None:
+        await gemini_client.aio.aclose()
+        gemini_client.close()
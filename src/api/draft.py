@@ -0,0 +1,221 @@
+import threading
+import time
+import src.config.config
+from src.api.cancellation import CancelToken, StreamCancelled
+from src.api.errors import StreamInterrupted
+from src.api.metrics import record_draft_refine
+from src.gui.lang import STRINGS
+
+
+def draft_model_for(model_name):
+    """
+    返回为所选模型提供草稿的快速模型
+
+    仅在启用 ENABLE_DRAFT_REFINE 且 DRAFT_MODEL 与所选模型不同时返回，否则返回 None
+    """
+    draft_model = src.config.config.DRAFT_MODEL
+    if not src.config.config.ENABLE_DRAFT_REFINE or not draft_model or draft_model == model_name:
+        return None
+    return draft_model
+
+
+class _Tier:
+    """草稿或正式回答单路请求的状态与计时"""
+
+    def __init__(self, model_name, started_at):
+        self.model_name = model_name
+        self.started_at = started_at
+        self.first_token_at = None
+        self.finished_at = None
+        self.text = ""
+        self.error = None
+
+    def mark_token(self):
+        if self.first_token_at is None:
+            self.first_token_at = time.perf_counter()
+
+    def elapsed_ms(self, at):
+        return (at - self.started_at) * 1000 if at is not None else None
+
+
+class _DraftSink:
+    """草稿的输出对象：在被正式回答替换之前直接输出到输出区域，替换后收到 StreamCancelled 并退出"""
+
+    def __init__(self, run):
+        self.run = run
+        self.current_lang = run.lang
+
+    def append_text(self, text):
+        if not text:
+            return
+        run = self.run
+        with run.lock:
+            if run.swapped:
+                raise StreamCancelled()
+            first = not run.draft.text
+            run.draft.mark_token()
+            run.draft.text += text
+            run.content_area.append_text(text)
+        if first:
+            run.content_area.set_status(
+                STRINGS[run.lang]['draft_streaming'].format(run.draft.model_name, run.refined.model_name)
+            )
+
+    def clear_output(self):
+        run = self.run
+        with run.lock:
+            if not run.swapped:
+                run.draft.text = ""
+                run.content_area.clear_output()
+
+    def set_status(self, message, is_error=False):
+        # 草稿的耗时、故障转移等状态不显示，避免覆盖正式回答的状态
+        pass
+
+
+class _RefinedSink:
+    """
+    正式回答的输出对象
+
+    DRAFT_REFINE_SWAP 为 "start" 时，正式回答的第一个 token 到达即替换草稿并继续流式输出；
+    为 "complete" 时先缓存正式回答，完成后一次性替换草稿。
+    """
+
+    def __init__(self, run):
+        self.run = run
+        self.current_lang = run.lang
+        self.last_status = None
+
+    def append_text(self, text):
+        if not text:
+            return
+        run = self.run
+        run.refined.mark_token()
+        if run.swap_on_start:
+            run.swap()
+            run.content_area.append_text(text)
+        run.refined.text += text
+
+    def clear_output(self):
+        run = self.run
+        run.refined.text = ""
+        if run.swapped:
+            run.content_area.clear_output()
+
+    def set_status(self, message, is_error=False):
+        self.last_status = message
+        self.run.content_area.set_status(message, is_error)
+
+
+class _DraftRun:
+    def __init__(self, draft_model, model_name, content_area, cancel_token):
+        self.content_area = content_area
+        self.lang = getattr(content_area, 'current_lang', 'zh')
+        self.swap_on_start = src.config.config.DRAFT_REFINE_SWAP == "start"
+        self.lock = threading.Lock()
+        self.swapped = False
+        started_at = time.perf_counter()
+        self.draft = _Tier(draft_model, started_at)
+        self.refined = _Tier(model_name, started_at)
+        self.draft_token = CancelToken()
+        self.refined_token = CancelToken()
+        if cancel_token:
+            cancel_token.register(self.draft_token.cancel)
+            cancel_token.register(self.refined_token.cancel)
+
+    def swap(self, text=None):
+        """
+        用正式回答替换草稿：停止草稿请求并清空输出区域
+
+        参数:
+        - text: 可选，替换后立即输出的完整正式回答
+        """
+        with self.lock:
+            if not self.swapped:
+                self.swapped = True
+                self.draft_token.cancel()
+                self.content_area.clear_output()
+            if text:
+                self.content_area.append_text(text)
+
+
+def stream_with_draft(draft_model, model_name, stream_fn, content_area, cancel_token=None):
+    """
+    草稿-正式回答模式：同时向快速模型与所选模型发送同一请求
+
+    快速模型的草稿立即流式输出，所选模型的回答开始（DRAFT_REFINE_SWAP = "start"）
+    或完成（"complete"）时替换草稿。两路请求的首个 token 与完成时间记录到指标数据库。
+
+    参数:
+    - draft_model: 提供草稿的快速模型
+    - model_name: 所选模型
+    - stream_fn: stream_fn(model_name, content_area, cancel_token) -> str，执行单个流式请求
+    - content_area: 输出对象
+    - cancel_token: 可选的取消令牌
+
+    返回:
+    - str: 所选模型的完整回答
+
+    草稿失败时忽略；正式回答在替换草稿之前失败时，保留已输出的草稿并抛出 StreamInterrupted。
+    """
+    run = _DraftRun(draft_model, model_name, content_area, cancel_token)
+
+    def run_draft():
+        try:
+            stream_fn(draft_model, _DraftSink(run), run.draft_token)
+            run.draft.finished_at = time.perf_counter()
+        except StreamCancelled:
+            pass
+        except Exception as e:
+            # 草稿只是正式回答到达之前的占位，失败时不影响正式回答
+            run.draft.error = e
+
+    draft_thread = threading.Thread(target=run_draft, daemon=True, name="draft")
+    draft_thread.start()
+
+    refined_sink = _RefinedSink(run)
+    try:
+        full_response = stream_fn(model_name, refined_sink, run.refined_token)
+        run.refined.finished_at = time.perf_counter()
+    except StreamCancelled:
+        run.draft_token.cancel()
+        draft_thread.join()
+        raise
+    except Exception as e:
+        if run.swapped:
+            raise
+        # 正式回答尚未替换草稿：等草稿输出完毕后保留草稿，并在其后显示错误
+        draft_thread.join()
+        with run.lock:
+            run.swapped = True
+            draft_text = run.draft.text
+        if draft_text:
+            raise StreamInterrupted(draft_text, e) from e
+        raise
+    run.swap(None if run.swap_on_start else full_response)
+    draft_thread.join()
+
+    if cancel_token:
+        cancel_token.raise_if_cancelled()
+
+    draft_ttft = run.draft.elapsed_ms(run.draft.first_token_at)
+    refined_ttft = run.refined.elapsed_ms(run.refined.first_token_at)
+    refined_total = run.refined.elapsed_ms(run.refined.finished_at)
+    record_draft_refine({
+        "draft_model": draft_model,
+        "model": model_name,
+        "swap": src.config.config.DRAFT_REFINE_SWAP,
+        "draft_ttft_ms": draft_ttft,
+        "draft_total_ms": run.draft.elapsed_ms(run.draft.finished_at),
+        "ttft_ms": refined_ttft,
+        "total_ms": refined_total,
+    })
+
+    def ms(value):
+        return f"{value:.0f}" if value is not None else "-"
+
+    summary = STRINGS[run.lang]['draft_refined'].format(
+        draft_model, ms(draft_ttft), model_name, ms(refined_ttft), refined_total / 1000
+    )
+    content_area.set_status(" | ".join(part for part in (summary, refined_sink.last_status) if part))
+    return full_response
@@ -0,0 +1,345 @@
+import asyncio
+import concurrent.futures
+import threading
+from collections import namedtuple
+import openai
+import src.config.config
+from src.config.config import get_provider_info
+from src.api.cancellation import StreamCancelled
+from src.api.client_pool import get_async_openai_client, get_gemini_client, aclose_all
+from src.api.metrics import RequestTimer, bind_timer, finish_request
+from src.api.usage import record_usage
+from src.api.token_budget import estimate_tokens
+from src.api.repetition import RepetitionDetector
+from src.gui.lang import STRINGS
+
+# 流式请求产生的事件：增量文本，以及（通常在最后一个事件中）token 用量
+StreamEvent = namedtuple("StreamEvent", ["delta", "usage"])
+# thinking_tokens 为思考过程消耗的 token，按输出计费但不显示
+Usage = namedtuple("Usage", ["prompt_tokens", "completion_tokens", "cached_tokens", "thinking_tokens"])
+
+
+class AsyncProvider:
+    """
+    异步提供商接口
+
+    stream() 返回异步迭代器，依次产生 StreamEvent；
+    取消通过 asyncio 任务取消实现，迭代器在 finally 中释放连接。
+    """
+
+    def __init__(self, model_name):
+        self.model_name = model_name
+
+    def stream(self):
+        raise NotImplementedError
+
+
+# 拒绝 stream_options 参数（返回 400）的提供商，本次运行中不再发送
+_stream_usage_rejected = set()
+
+
+class OpenAICompatibleProvider(AsyncProvider):
+    """OpenAI 兼容接口的提供商，基于 openai.AsyncOpenAI"""
+
+    def __init__(self, model_name, params):
+        """
+        参数:
+        - model_name: 带提供商前缀的模型名称
+        - params: chat.completions.create 的参数（不含 model）
+        """
+        super().__init__(model_name)
+        self.params = params
+
+    async def stream(self):
+        client, clean_model_name = get_async_openai_client(self.model_name)
+        params = dict(self.params, model=clean_model_name)
+
+        # Special handling for specific providers
+        if clean_model_name.startswith("cerebras"):
+            params["max_completion_tokens"] = 8192
+
+        # 请求在流的最后一个数据块中返回 token 用量
+        provider_info = get_provider_info(self.model_name)
+        if (provider_info is not None and provider_info.stream_usage
+                and provider_info.name not in _stream_usage_rejected):
+            params["stream_options"] = {"include_usage": True}
+
+        try:
+            stream = await client.chat.completions.create(**params)
+        except openai.BadRequestError:
+            if "stream_options" not in params:
+                raise
+            # 不支持 stream_options 的服务端：去掉该参数重试，之后的请求不再发送
+            _stream_usage_rejected.add(provider_info.name)
+            del params["stream_options"]
+            stream = await client.chat.completions.create(**params)
+        try:
+            async for chunk in stream:
+                usage = None
+                if getattr(chunk, "usage", None):
+                    details = getattr(chunk.usage, "prompt_tokens_details", None)
+                    usage = Usage(
+                        chunk.usage.prompt_tokens or 0,
+                        chunk.usage.completion_tokens or 0,
+                        (getattr(details, "cached_tokens", 0) or 0) if details else 0,
+                        0
+                    )
+                delta = (chunk.choices[0].delta.content or "") if chunk.choices else ""
+                if delta or usage:
+                    yield StreamEvent(delta, usage)
+        finally:
+            await stream.close()
+
+
+class GeminiProvider(AsyncProvider):
+    """Gemini 原生 SDK 的提供商，基于 genai.Client(...).aio"""
+
+    def __init__(self, model_name, contents, config):
+        """
+        参数:
+        - model_name: 带提供商前缀的模型名称
+        - contents: 消息内容列表
+        - config: GenerateContentConfig
+        """
+        super().__init__(model_name)
+        self.contents = contents
+        self.config = config
+        # 在调用线程中获取客户端：缺少 API Key 时 SDK 在构造阶段抛出异常，
+        # 若在事件循环中构造，未完成的客户端被回收时会在循环中留下无人处理的关闭任务
+        self.client = get_gemini_client()
+
+    async def stream(self):
+        clean_model_name = self.model_name[self.model_name.index("]") + 2:]
+        response_stream = await self.client.aio.models.generate_content_stream(
+            model=clean_model_name,
+            contents=self.contents,
+            config=self.config,
+        )
+        try:
+            async for chunk in response_stream:
+                usage = None
+                # 每个数据块都带有累计用量，最后一个为最终值
+                metadata = getattr(chunk, "usage_metadata", None)
+                if metadata:
+                    usage = Usage(
+                        metadata.prompt_token_count or 0,
+                        metadata.candidates_token_count or 0,
+                        metadata.cached_content_token_count or 0,
+                        metadata.thoughts_token_count or 0
+                    )
+                delta = (chunk.text or "") if hasattr(chunk, "text") else ""
+                if delta or usage:
+                    yield StreamEvent(delta, usage)
+        finally:
+            await response_stream.aclose()
+
+
+class ProviderEngine:
+    """
+    在后台线程的 asyncio 事件循环上执行所有提供商请求
+
+    - 多个请求在同一个事件循环中并发执行，总数受 ENGINE_MAX_CONCURRENCY 限制
+    - CancelToken 取消时直接取消对应的 asyncio 任务，连接随即关闭
+    - 首个数据块与相邻数据块之间分别受 ENGINE_FIRST_TOKEN_TIMEOUT / ENGINE_IDLE_TIMEOUT 限制
+    - 事件经有界队列（STREAM_QUEUE_MAX_SIZE）交给调用线程，调用方消费不及时会让请求暂停读取
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._loop = None
+        self._thread = None
+        self._semaphore = None
+
+    def _ensure_loop(self):
+        with self._lock:
+            if self._loop is None:
+                self._loop = asyncio.new_event_loop()
+                self._semaphore = asyncio.Semaphore(src.config.config.ENGINE_MAX_CONCURRENCY)
+                self._thread = threading.Thread(
+                    target=self._run_loop, args=(self._loop,), daemon=True, name="provider-engine"
+                )
+                self._thread.start()
+            return self._loop
+
+    @staticmethod
+    def _run_loop(loop):
+        asyncio.set_event_loop(loop)
+        loop.run_forever()
+
+    def submit(self, coro, cancel_token=None):
+        """
+        在事件循环中执行协程
+
+        返回:
+        - concurrent.futures.Future；cancel_token 取消时协程随之取消
+        """
+        future = asyncio.run_coroutine_threadsafe(coro, self._ensure_loop())
+        if cancel_token:
+            cancel_token.register(future.cancel)
+        return future
+
+    def run(self, coro, cancel_token=None):
+        """在事件循环中执行协程并阻塞等待结果，取消时抛出 StreamCancelled"""
+        future = self.submit(coro, cancel_token)
+        try:
+            return future.result()
+        except (concurrent.futures.CancelledError, asyncio.CancelledError):
+            raise StreamCancelled()
+
+    async def _produce(self, provider, queue, finished, timer):
+        try:
+            with bind_timer(timer):
+                async with self._semaphore:
+                    iterator = provider.stream().__aiter__()
+                    timeout = src.config.config.ENGINE_FIRST_TOKEN_TIMEOUT
+                    try:
+                        while True:
+                            try:
+                                event = await asyncio.wait_for(anext(iterator), timeout)
+                            except StopAsyncIteration:
+                                break
+                            except asyncio.TimeoutError:
+                                raise TimeoutError(f"No data from {provider.model_name} within {timeout}s")
+                            if event.delta:
+                                timer.mark_token(event.delta)
+                                timeout = src.config.config.ENGINE_IDLE_TIMEOUT
+                            await queue.put(event)
+                    finally:
+                        await iterator.aclose()
+        finally:
+            finished.set()
+
+    @staticmethod
+    async def _next_batch(queue, finished):
+        """取出队列中所有已到达的事件，队列为空时等待；请求结束且队列已空时返回 None"""
+        if queue.empty() and not finished.is_set():
+            getter = asyncio.ensure_future(queue.get())
+            waiter = asyncio.ensure_future(finished.wait())
+            await asyncio.wait({getter, waiter}, return_when=asyncio.FIRST_COMPLETED)
+            waiter.cancel()
+            if getter.done():
+                batch = [getter.result()]
+            else:
+                getter.cancel()
+                batch = []
+        else:
+            batch = []
+        while not queue.empty():
+            batch.append(queue.get_nowait())
+        if not batch and finished.is_set():
+            return None
+        return batch
+
+    def iter_events(self, provider, cancel_token=None, timer=None):
+        """
+        在调用线程中同步迭代提供商的流式事件
+
+        参数:
+        - provider: AsyncProvider 实例
+        - cancel_token: 可选的取消令牌
+        - timer: 可选的 RequestTimer，记录响应头与首个 token 的时间
+
+        请求失败时抛出原始异常，被取消时抛出 StreamCancelled。
+        调用方提前停止迭代时请求随之取消。
+        """
+        loop = self._ensure_loop()
+        queue = asyncio.Queue(maxsize=src.config.config.STREAM_QUEUE_MAX_SIZE)
+        finished = asyncio.Event()
+        producer = self.submit(
+            self._produce(provider, queue, finished, timer or RequestTimer(provider.model_name)),
+            cancel_token
+        )
+        try:
+            while True:
+                batch = asyncio.run_coroutine_threadsafe(self._next_batch(queue, finished), loop).result()
+                if batch is None:
+                    break
+                yield from batch
+            producer.result()
+        except (concurrent.futures.CancelledError, asyncio.CancelledError):
+            raise StreamCancelled()
+        finally:
+            if not producer.done():
+                producer.cancel()
+
+    def shutdown(self, timeout=2):
+        """关闭所有客户端并停止事件循环"""
+        with self._lock:
+            loop, thread = self._loop, self._thread
+            self._loop = self._thread = None
+        if loop is None:
+            return
+        try:
+            asyncio.run_coroutine_threadsafe(aclose_all(), loop).result(timeout)
+        except Exception:
+            pass
+        loop.call_soon_threadsafe(loop.stop)
+        thread.join(timeout)
+
+
+engine = ProviderEngine()
+
+
+def stream_provider(provider, content_area, cancel_token=None):
+    """
+    执行一次流式请求，把增量文本追加到输出区域，并记录 token 用量与耗时
+
+    参数:
+    - provider: AsyncProvider 实例
+    - content_area: 输出对象，需提供 append_text 方法
+    - cancel_token: 可选的取消令牌
+
+    返回:
+    - str: 完整回复文本
+    """
+    timer = RequestTimer(provider.model_name)
+    full_response = ""
+    usage = None
+    detector = RepetitionDetector() if src.config.config.ENABLE_REPETITION_DETECTION else None
+    note = None
+    events = engine.iter_events(provider, cancel_token, timer)
+    try:
+        for event in events:
+            if cancel_token and cancel_token.is_cancelled:
+                raise StreamCancelled()
+            if event.usage:
+                usage = event.usage
+            if event.delta:
+                full_response += event.delta
+                # 使用content_area的append_text方法添加文本，支持Markdown渲染
+                content_area.append_text(event.delta)
+                if detector and detector.feed(event.delta):
+                    # 回复陷入循环重复：停止请求，只保留重复内容的第一次出现
+                    full_response = full_response[:-detector.repeated_chars]
+                    content_area.clear_output()
+                    content_area.append_text(full_response)
+                    note = STRINGS[getattr(content_area, 'current_lang', 'zh')]['repetition_aborted']
+                    content_area.set_status(note)
+                    break
+    finally:
+        # 提前停止迭代时立即取消请求
+        events.close()
+
+    if cancel_token:
+        cancel_token.raise_if_cancelled()
+    if usage is not None:
+        record_usage(
+            provider.model_name,
+            usage.prompt_tokens,
+            usage.completion_tokens + usage.thinking_tokens,
+            usage.cached_tokens
+        )
+    finish_request(
+        timer,
+        usage.completion_tokens if usage is not None else estimate_tokens(full_response),
+        content_area,
+        usage.prompt_tokens if usage is not None else 0,
+        usage.cached_tokens if usage is not None else 0,
+        note
+    )
+    return full_response
+
+
+def shutdown_engine():
+    """关闭 provider engine，在程序退出前调用"""
+    engine.shutdown()
@@ -0,0 +1,86 @@
+import email.utils
+import time
+import httpx
+import openai
+from google.genai import errors as genai_errors
+
+
+class RateLimitExceeded(Exception):
+    """请求需要等待速率限制的时间超过 RATE_LIMIT_MAX_WAIT，未发送"""
+
+    def __init__(self, provider_name, wait_seconds):
+        self.provider_name = provider_name
+        self.wait_seconds = wait_seconds
+        super().__init__(f"Rate limit for provider {provider_name} requires waiting {wait_seconds:.0f}s")
+
+
+class ContextLimitExceeded(Exception):
+    """请求的输入超出模型的上下文窗口，未发送"""
+
+    def __init__(self, model_name, tokens, limit):
+        self.model_name = model_name
+        self.tokens = tokens
+        self.limit = limit
+        super().__init__(f"Request for {model_name} needs about {tokens} input tokens, the limit is {limit}")
+
+
+class StreamInterrupted(Exception):
+    """流式回复在输出部分内容后中断，续传次数用尽或无法续传"""
+
+    def __init__(self, partial, error):
+        self.partial = partial
+        self.error = error
+        super().__init__(str(error))
+
+
+def is_provider_failure(error):
+    """
+    判断异常是否说明提供商暂时不可用（可重试、计入熔断器）
+
+    超时、连接错误、429 与 5xx 计为失败；其余 4xx（参数错误、鉴权失败等）
+    与请求本身有关，重试或换一个提供商也不会成功，不计入。
+    本地速率限制拒绝（RateLimitExceeded）可以转移到其他提供商，但请求未发送，熔断器不计入。
+    """
+    if isinstance(error, RateLimitExceeded):
+        return True
+    if isinstance(error, (openai.APITimeoutError, openai.APIConnectionError)):
+        return True
+    if isinstance(error, openai.APIStatusError):
+        return error.status_code == 429 or error.status_code >= 500
+    if isinstance(error, genai_errors.APIError):
+        return error.code == 429 or (error.code or 0) >= 500
+    return isinstance(error, (httpx.TimeoutException, httpx.TransportError, TimeoutError, ConnectionError))
+
+
+def retry_after_seconds(error):
+    """
+    从错误响应的 Retry-After（或 retry-after-ms）响应头中读取需要等待的秒数
+
+    返回:
+    - float: 等待秒数，响应中没有该信息时返回 None
+    """
+    response = getattr(error, "response", None)
+    headers = getattr(response, "headers", None)
+    if not headers:
+        return None
+
+    retry_after_ms = headers.get("retry-after-ms")
+    if retry_after_ms:
+        try:
+            return max(0.0, float(retry_after_ms) / 1000)
+        except ValueError:
+            pass
+
+    retry_after = headers.get("retry-after")
+    if not retry_after:
+        return None
+    try:
+        return max(0.0, float(retry_after))
+    except ValueError:
+        pass
+    # Retry-After 也可能是 HTTP 日期
+    try:
+        retry_at = email.utils.parsedate_to_datetime(retry_after).timestamp()
+    except (TypeError, ValueError):
+        return None
+    return max(0.0, retry_at - time.time())
@@ -1,10 +1,33 @@
 import os
 import base64
-from google import genai
 from google.genai import types
 import src.config.config
+from src.gui.lang import STRINGS
+from src.api.client_pool import get_gemini_client
+from src.api.cancellation import StreamCancelled, bind_cancel_token
+from src.api.circuit_breaker import call_with_breaker
+from src.api.scheduler import run_scheduled
+from src.api.token_budget import estimate_tokens, history_reserve, request_budget, trim_history, trim_transcript
+from src.api.response_cache import store_response
+from src.api.engine import GeminiProvider, stream_provider
+from src.api.errors import StreamInterrupted
+from src.api.resume import stream_with_resume
+from src.api.gemini_cache import prepare_context_cache, transcript_content
+from src.api.history import update_history, SUMMARY_PREFIX
+
+# 去掉转录文本后没有其他内容的用户消息改用此提示
+_CONTINUE_PROMPT = "Please continue analyzing based on the transcript and our previous conversation."
+
 
 # 辅助函数定义
+def _strip_transcript(text, transcript_parts):
+    """去掉消息中已作为转录文本块单独发送的部分，只保留问题"""
+    for part in transcript_parts:
+        if part and part in text:
+            text = text.replace(part, "", 1)
+    return text.strip()
+
+
 def get_auxiliary_mode_prompt(mode):
     """
     根据选定的附加模式返回相应的提示词
@@ -47,8 +70,84 @@ def encode_image_to_base64(image_path):
     with open(image_path, "rb") as image_file:
         return base64.b64encode(image_file.read()).decode('utf-8')
 
+def _stream_gemini_contents(model_name, contents, generate_content_config, content_area, cancel_token=None,
+                            resume=True):
+    """
+    发送 Gemini 流式请求并把增量文本追加到输出区域
+
+    请求在 provider engine 上通过异步 SDK 执行，受 Gemini 提供商熔断器保护，
+    熔断器打开时直接抛出 CircuitOpenError；并经过 scheduler 按 RPM/TPM 限制排队，暂时性错误自动重试；
+    resume 为 True 时，输出部分内容后连接中断会自动续传。
+
+    返回:
+    - str: 完整回复文本
+    """
+    estimated_tokens = sum(
+        estimate_tokens(part.text)
+        for content in contents
+        for part in (content.parts or [])
+        if part.text
+    )
+
+    def attempt(resume_model, partial, resume_sink, resume_token):
+        # 续传时在原消息之后附加已输出的部分回复与续写提示
+        request_contents = contents
+        if partial:
+            request_contents = list(contents) + [
+                types.Content(role="model", parts=[types.Part.from_text(text=partial)]),
+                types.Content(role="user", parts=[types.Part.from_text(text=src.config.config.STREAM_RESUME_PROMPT)]),
+            ]
+        provider = GeminiProvider(resume_model, request_contents, generate_content_config)
+        text = call_with_breaker(
+            "Gemini",
+            lambda: run_scheduled(
+                "Gemini",
+                estimated_tokens + estimate_tokens(partial),
+                lambda sink: stream_provider(provider, sink, resume_token),
+                resume_sink,
+                resume_token
+            )
+        )
+        return text, resume_model
+
+    if not resume:
+        return attempt(model_name, "", content_area, cancel_token)[0]
+    full_response, _ = stream_with_resume(model_name, attempt, content_area, cancel_token)
+    return full_response
+
+def stream_gemini_messages(model_name, messages, temperature, content_area, cancel_token=None):
+    """
+    发送纯文本消息列表的 Gemini 流式请求，供内部流水线（如分段汇总）使用
+
+    参数:
+    - model_name: 使用的模型名称
+    - messages: 消息列表 [(role, content), ...]，system 消息作为系统指令
+    - temperature: 温度参数
+    - content_area: 输出对象
+    - cancel_token: 可选的取消令牌
+
+    返回:
+    - str: 完整回复文本；请求失败时抛出异常
+    """
+    system_instruction = "\n\n".join(content for role, content in messages if role == "system")
+    contents = [
+        types.Content(role="model" if role == "assistant" else "user", parts=[types.Part.from_text(text=content)])
+        for role, content in messages
+        if role in ("user", "assistant")
+    ]
+    generate_content_config = types.GenerateContentConfig(
+        temperature=float(temperature),
+        top_p=0.95,
+        top_k=40,
+        max_output_tokens=8192,
+        response_mime_type="text/plain",
+        system_instruction=[types.Part.from_text(text=system_instruction)] if system_instruction else None,
+    )
+    return _stream_gemini_contents(model_name, contents, generate_content_config, content_area, cancel_token)
+
 def fetch_gemini_response(prompt, content_area, model_name, temperature, 
-                          image_paths=None, use_search=False, system_instruction=""):
+                          image_paths=None, use_search=False, system_instruction="", cancel_token=None, cache_key=None,
+                          resume=True):
     """
     从Gemini API获取模型的回复
     
@@ -60,6 +159,9 @@ def fetch_gemini_response(prompt, content_area, model_name, temperature,
     - image_paths: 可选的图片路径列表
     - use_search: 是否启用Google搜索功能
     - system_instruction: 系统指令
+    - cancel_token: 可选的取消令牌
+    - cache_key: 可选的响应缓存键，请求成功后保存回复
+    - resume: 连接中断时是否自动续传；多模型对比不续传，测得模型本身的耗时
     """
     try:
         search_reminder_text = "注意：搜索工具已启用，必须结合搜索获取的最新信息来回答。"
@@ -79,8 +181,9 @@ def fetch_gemini_response(prompt, content_area, model_name, temperature,
         aux_mode = src.config.config.CURRENT_AUXILIARY_MODE
         aux_prompt = get_auxiliary_mode_prompt(aux_mode)
         
-        # 如果启用了附加模式，将附加提示词添加到prompt后面
-        if aux_prompt and prompt:
+        # 如果启用了附加模式，将附加提示词添加到prompt后面；
+        # 提示缓存友好布局下附加提示词已由调用方放入系统指令
+        if aux_prompt and prompt and not src.config.config.PREFIX_CACHE_FRIENDLY_LAYOUT:
             base_user_prompt  = f"{prompt}\n\n{aux_prompt}"
         else:
             base_user_prompt  = prompt
@@ -93,7 +196,7 @@ def fetch_gemini_response(prompt, content_area, model_name, temperature,
             final_prompt = base_user_prompt
         
         # 设置API客户端
-        client = genai.Client(api_key=os.environ.get("GEMINI_API_KEY"))
+        client = get_gemini_client()
         
         # 提取真实的模型名称（去掉前缀）
         clean_model_name = model_name[model_name.index("]") + 2:]
@@ -127,8 +230,9 @@ def fetch_gemini_response(prompt, content_area, model_name, temperature,
         if image_paths and isinstance(image_paths, list):
             for img_path in image_paths:
                 if os.path.exists(img_path):
-                    # 使用 files.upload 上传图片
-                    uploaded_file = client.files.upload(file=img_path)
+                    # 使用 files.upload 上传图片，期间绑定取消令牌使上传可被中止
+                    with bind_cancel_token(cancel_token):
+                        uploaded_file = client.files.upload(file=img_path)
                     # 使用 from_uri 引用上传的图片
                     image_part = types.Part.from_uri(
                         file_uri=uploaded_file.uri,
@@ -166,35 +270,35 @@ def fetch_gemini_response(prompt, content_area, model_name, temperature,
         if use_search:
             generate_content_config.tools = [types.Tool(google_search=types.GoogleSearch())]
         
-        # 发送请求并获取响应流
-        response_stream = client.models.generate_content_stream(
-            model=clean_model_name,
-            contents=contents,
-            config=generate_content_config,
+        # 发送请求并处理流式响应
+        full_response = _stream_gemini_contents(
+            model_name, contents, generate_content_config, content_area, cancel_token, resume
         )
-        
-        # 存储完整回复
-        full_response = ""
-        
-        # 处理流式响应
-        for chunk in response_stream:
-            if hasattr(chunk, 'text'):
-                delta = chunk.text or ""
-                full_response += delta
-                # 使用content_area的append_text方法添加文本，支持Markdown渲染
-                content_area.append_text(delta)
+        store_response(cache_key, model_name, full_response)
                 
         # 返回完整的响应文本（用于对话历史记录）
         return full_response
                 
+    except StreamCancelled:
+        # 请求已被取消，不显示错误
+        return ""
+
     except Exception as e:
+        # 上传图片时被取消，连接中断导致的错误不显示
+        if cancel_token and cancel_token.is_cancelled:
+            return ""
         error_message = f"Gemini API调用错误：{str(e)}"
-        content_area.clear_output()
-        content_area.append_text(error_message)
+        if isinstance(e, StreamInterrupted):
+            # 保留已输出的部分回复，在其后附上错误信息
+            content_area.append_text(f"\n\n{error_message}")
+        else:
+            content_area.clear_output()
+            content_area.append_text(error_message)
         return error_message
 
 def fetch_gemini_response_with_history(prompt, content_area, model_name, temperature, 
-                                       history, image_paths=None, use_search=False, system_instruction=""):
+                                       history, image_paths=None, use_search=False, system_instruction="", cancel_token=None, cache_key=None,
+                                       history_prompt=None, transcript_parts=None):
     """
     从Gemini API获取模型的回复，支持连续对话
     
@@ -207,6 +311,11 @@ def fetch_gemini_response_with_history(prompt, content_area, model_name, tempera
     - image_paths: 可选的图片路径列表
     - use_search: 是否启用Google搜索功能
     - system_instruction: 系统指令
+    - cancel_token: 可选的取消令牌
+    - cache_key: 可选的响应缓存键，请求成功后保存回复
+    - history_prompt: 写入对话历史的用户消息，提供时请求成功后更新 history
+    - transcript_parts: 可选，本次对话中依次发送过的转录文本（含本轮）；提供时转录文本作为
+      对话开头的单独消息发送并可放入上下文缓存，历史与本轮消息中只保留问题
     """
     try:
         search_reminder_text = "注意：搜索工具已启用，必须结合搜索获取的最新信息来回答。"
@@ -224,8 +333,9 @@ def fetch_gemini_response_with_history(prompt, content_area, model_name, tempera
         aux_mode = src.config.config.CURRENT_AUXILIARY_MODE
         aux_prompt = get_auxiliary_mode_prompt(aux_mode)
         
-        # 如果启用了附加模式，将附加提示词添加到prompt后面
-        if aux_prompt and prompt:
+        # 如果启用了附加模式，将附加提示词添加到prompt后面；
+        # 提示缓存友好布局下附加提示词已由调用方放入系统指令
+        if aux_prompt and prompt and not src.config.config.PREFIX_CACHE_FRIENDLY_LAYOUT:
             base_user_prompt = f"{prompt}\n\n{aux_prompt}"
         else:
             base_user_prompt = prompt
@@ -239,20 +349,52 @@ def fetch_gemini_response_with_history(prompt, content_area, model_name, tempera
 
         
         # 设置API客户端
-        client = genai.Client(api_key=os.environ.get("GEMINI_API_KEY"))
+        client = get_gemini_client()
         
         # 提取真实的模型名称（去掉前缀）
         clean_model_name = model_name[model_name.index("]") + 2:]
         
         # 构建历史消息
         contents = []
-        
-        # 添加系统指令和历史消息
-        has_system = False
-        for role, content in history:
+        system_text = system_instruction if system_instruction else "你是一个专业的助手，分析会议或对话记录"
+        cache_name = None
+
+        if transcript_parts:
+            # 累积的转录文本作为稳定前缀放在最前面（可整体缓存），之后是去掉转录文本的问答历史与本轮问题
+            final_prompt = _strip_transcript(final_prompt, transcript_parts) or _CONTINUE_PROMPT
+            turns = [
+                (role, (_strip_transcript(content, transcript_parts) or _CONTINUE_PROMPT) if role == "user" else content)
+                for role, content in (history or []) if role != "system" or content.startswith(SUMMARY_PREFIX)
+            ]
+            # 转录文本与对话历史共用预算：先为历史预留一部分，转录文本超出其余部分时省略较早的内容
+            budget = request_budget(model_name) - estimate_tokens(system_text) - estimate_tokens(final_prompt)
+            transcript, _ = trim_transcript(
+                "\n".join(transcript_parts), budget - history_reserve(turns, budget)
+            )
+            sent_history, dropped = trim_history(turns, budget - estimate_tokens(transcript))
+
+            # 搜索工具不能与缓存同时使用，启用搜索时照常发送完整转录文本
+            cached_chars = 0
+            if not use_search:
+                cache_name, cached_chars = prepare_context_cache(model_name, system_text, transcript)
+            uncached = transcript[cached_chars:].lstrip("\n")
+            if uncached.strip():
+                contents.append(transcript_content(uncached))
+        else:
+            # 对话历史超出 token 预算时省略较早的消息，优先保证本轮输入完整
+            history_budget = (request_budget(model_name) - estimate_tokens(system_instruction)
+                              - estimate_tokens(final_prompt))
+            sent_history, dropped = trim_history(history, history_budget)
+        if dropped:
+            lang = getattr(content_area, 'current_lang', 'zh')
+            content_area.set_status(STRINGS[lang]['history_trimmed'].format(dropped))
+
+        # 添加历史消息
+        for role, content in sent_history:
             if role == "system":
-                has_system = True
-                # 系统指令已经在配置中设置，这里不需要添加到messages中
+                # 滚动摘要作为历史开头的用户消息发送；系统指令已经在配置中设置，不需要添加到messages中
+                if content.startswith(SUMMARY_PREFIX):
+                    contents.append(types.Content(role="user", parts=[types.Part.from_text(text=content)]))
                 continue
             
             if role == "user":
@@ -273,8 +415,9 @@ def fetch_gemini_response_with_history(prompt, content_area, model_name, tempera
         if image_paths and isinstance(image_paths, list):
             for img_path in image_paths:
                 if os.path.exists(img_path):
-                    # 使用 files.upload 上传图片
-                    uploaded_file = client.files.upload(file=img_path)
+                    # 使用 files.upload 上传图片，期间绑定取消令牌使上传可被中止
+                    with bind_cancel_token(cancel_token):
+                        uploaded_file = client.files.upload(file=img_path)
                     # 使用 from_uri 引用上传的图片
                     image_part = types.Part.from_uri(
                         file_uri=uploaded_file.uri,
@@ -298,9 +441,14 @@ def fetch_gemini_response_with_history(prompt, content_area, model_name, tempera
             max_output_tokens=8192,
             response_mime_type="text/plain",
             system_instruction=[
-                types.Part.from_text(text=system_instruction if system_instruction else "你是一个专业的助手，分析会议或对话记录")
+                types.Part.from_text(text=system_text)
             ],
         )
+
+        # 系统指令与已缓存的转录文本由上下文缓存提供
+        if cache_name:
+            generate_content_config.cached_content = cache_name
+            generate_content_config.system_instruction = None
         
         # 如果是gemini-2.5-flash-preview模型，添加thinking_config
         if clean_model_name.startswith("gemini-2.5-flash-preview") and src.config.config.GEMINI_THINKING_BUDGET >= 0:
@@ -312,29 +460,30 @@ def fetch_gemini_response_with_history(prompt, content_area, model_name, tempera
         if use_search:
             generate_content_config.tools = [types.Tool(google_search=types.GoogleSearch())]
         
-        # 发送请求并获取响应流
-        response_stream = client.models.generate_content_stream(
-            model=clean_model_name,
-            contents=contents,
-            config=generate_content_config,
+        # 发送请求并处理流式响应
+        full_response = _stream_gemini_contents(
+            model_name, contents, generate_content_config, content_area, cancel_token
         )
-        
-        # 存储完整回复
-        full_response = ""
-        
-        # 处理流式响应
-        for chunk in response_stream:
-            if hasattr(chunk, 'text'):
-                delta = chunk.text or ""
-                full_response += delta
-                # 使用content_area的append_text方法添加文本，支持Markdown渲染
-                content_area.append_text(delta)
+        store_response(cache_key, model_name, full_response)
+        if history_prompt is not None:
+            update_history(history, history_prompt, full_response, model_name)
                 
         # 返回完整的响应文本（用于更新对话历史记录）
         return full_response
                 
+    except StreamCancelled:
+        # 请求已被取消，不显示错误
+        return ""
+
     except Exception as e:
+        # 上传图片时被取消，连接中断导致的错误不显示
+        if cancel_token and cancel_token.is_cancelled:
+            return ""
         error_message = f"Gemini API调用错误：{str(e)}"
-        content_area.clear_output()
-        content_area.append_text(error_message)
+        if isinstance(e, StreamInterrupted):
+            # 保留已输出的部分回复，在其后附上错误信息
+            content_area.append_text(f"\n\n{error_message}")
+        else:
+            content_area.clear_output()
+            content_area.append_text(error_message)
         return error_message
\ No newline at end of file
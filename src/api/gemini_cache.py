@@ -0,0 +1,174 @@
+import hashlib
+import threading
+import time
+from google.genai import types
+import src.config.config
+from src.api.client_pool import get_gemini_client
+from src.api.engine import engine
+from src.api.token_budget import estimate_tokens
+
+# 连续对话中转录文本块的开头
+TRANSCRIPT_HEADER = "Transcript:\n"
+# 缓存剩余时间少于该秒数时不再使用，避免请求途中过期
+_EXPIRY_MARGIN = 30
+
+
+def transcript_content(text):
+    """把转录文本包装为一条用户消息"""
+    return types.Content(role="user", parts=[types.Part.from_text(text=TRANSCRIPT_HEADER + text)])
+
+
+def _fingerprint(clean_model_name, system_instruction):
+    digest = hashlib.sha256()
+    digest.update(clean_model_name.encode("utf-8"))
+    digest.update(b"\0")
+    digest.update((system_instruction or "").encode("utf-8"))
+    return digest.hexdigest()
+
+
+class GeminiContextCache:
+    """
+    连续对话的 Gemini 显式上下文缓存（client.caches）
+
+    系统指令与会话中累积的转录文本作为稳定前缀缓存，每轮请求通过 cached_content 引用，
+    只发送缓存之后新增的转录文本、问答历史与本轮问题。对话历史的裁剪或压缩不影响缓存。
+    缓存的创建、刷新与删除都在 provider engine 的事件循环中异步执行，不阻塞请求：
+    - 前缀与缓存一致且未过期时复用，剩余 TTL 不足一半时在后台刷新
+    - 缓存之后新增的转录文本超过 GEMINI_CACHE_REBUILD_TOKENS，或模型、系统指令变化时在后台重建，
+      重建完成前照常使用旧缓存（若仍可用）并发送其后的部分
+    - 前缀不足 GEMINI_CACHE_MIN_TOKENS 时不使用缓存
+    同一时间只保留一个缓存，也最多只有一个创建任务。
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._name = None
+        # 缓存对应的模型与系统指令的指纹，以及已缓存的转录文本
+        self._fingerprint = None
+        self._transcript = ""
+        self._expires_at = 0.0
+        self._building = False
+        self._refreshing = False
+        # clear() 时递增，之前发起的创建任务完成后不再安装
+        self._generation = 0
+
+    def prepare(self, model_name, system_instruction, transcript):
+        """
+        为本次请求查找可用的缓存，必要时在后台创建或刷新，不等待结果
+
+        参数:
+        - model_name: 带提供商前缀的模型名称
+        - system_instruction: 系统指令文本
+        - transcript: 会话中累积的完整转录文本
+
+        返回:
+        - (cache_name, cached_chars): 可用时返回缓存名称与其已包含的转录文本长度（transcript 的前缀），
+          否则返回 (None, 0)
+        """
+        if not src.config.config.ENABLE_GEMINI_CONTEXT_CACHE or not transcript:
+            return None, 0
+        clean_model_name = model_name[model_name.index("]") + 2:]
+        fingerprint = _fingerprint(clean_model_name, system_instruction)
+
+        with self._lock:
+            now = time.time()
+            usable = (self._name is not None and now < self._expires_at - _EXPIRY_MARGIN
+                      and self._fingerprint == fingerprint and transcript.startswith(self._transcript))
+            uncached = transcript[len(self._transcript):] if usable else transcript
+
+            if (not self._building
+                    and estimate_tokens(system_instruction or "") + estimate_tokens(transcript)
+                    >= src.config.config.GEMINI_CACHE_MIN_TOKENS
+                    and (not usable or estimate_tokens(uncached) >= src.config.config.GEMINI_CACHE_REBUILD_TOKENS)):
+                self._building = True
+                engine.submit(self._create(clean_model_name, fingerprint, system_instruction, transcript,
+                                           self._generation))
+            elif (usable and not self._refreshing
+                    and self._expires_at - now < src.config.config.GEMINI_CACHE_TTL / 2):
+                self._refreshing = True
+                engine.submit(self._refresh(self._name))
+
+            if not usable:
+                return None, 0
+            return self._name, len(self._transcript)
+
+    async def _create(self, clean_model_name, fingerprint, system_instruction, transcript, generation):
+        client = get_gemini_client()
+        ttl = src.config.config.GEMINI_CACHE_TTL
+        config = types.CreateCachedContentConfig(
+            contents=[transcript_content(transcript)],
+            system_instruction=system_instruction or None,
+            ttl=f"{ttl}s",
+        )
+        try:
+            cached = await client.aio.caches.create(model=clean_model_name, config=config)
+        except Exception:
+            # 模型不支持缓存、前缀过短等情况：本次不使用缓存，保留旧缓存等待过期
+            with self._lock:
+                self._building = False
+            return
+
+        with self._lock:
+            self._building = False
+            if generation != self._generation:
+                # 创建期间对话已被重置
+                stale = cached.name
+            else:
+                stale = self._name
+                self._name = cached.name
+                self._fingerprint = fingerprint
+                self._transcript = transcript
+                self._expires_at = time.time() + ttl
+        if stale:
+            await self._delete(client, stale)
+
+    async def _refresh(self, name):
+        client = get_gemini_client()
+        ttl = src.config.config.GEMINI_CACHE_TTL
+        try:
+            await client.aio.caches.update(name=name, config=types.UpdateCachedContentConfig(ttl=f"{ttl}s"))
+        except Exception:
+            # 刷新失败时沿用原过期时间，过期后自动重建
+            return
+        finally:
+            with self._lock:
+                self._refreshing = False
+        with self._lock:
+            if self._name == name:
+                self._expires_at = time.time() + ttl
+
+    @staticmethod
+    async def _delete(client, name):
+        """删除缓存；删除失败时缓存到期后由服务端清理"""
+        try:
+            await client.aio.caches.delete(name=name)
+        except Exception:
+            pass
+
+    def clear(self):
+        """丢弃当前缓存并在服务端删除"""
+        with self._lock:
+            name = self._name
+            self._name = None
+            self._fingerprint = None
+            self._transcript = ""
+            self._expires_at = 0.0
+            self._generation += 1
+        if name:
+            try:
+                engine.submit(self._delete(get_gemini_client(), name))
+            except Exception:
+                pass
+
+
+_context_cache = GeminiContextCache()
+
+
+def prepare_context_cache(model_name, system_instruction, transcript):
+    """为连续对话请求查找 Gemini 上下文缓存，参见 GeminiContextCache.prepare"""
+    return _context_cache.prepare(model_name, system_instruction, transcript)
+
+
+def clear_context_cache():
+    """重置对话上下文时调用，删除当前的 Gemini 上下文缓存"""
+    _context_cache.clear()
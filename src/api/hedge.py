@@ -0,0 +1,203 @@
+import json
+import os
+import sys
+import threading
+import src.config.config
+from src.api.cancellation import CancelToken, StreamCancelled
+
+_stats_lock = threading.Lock()
+
+
+def find_hedge_group(model_name):
+    """
+    查找模型所在的对冲组
+
+    返回:
+    - (group_name, models): 组名以及组内模型列表（所选模型排在首位），未找到时返回 (None, None)
+    """
+    for group_name, models in src.config.config.HEDGE_GROUPS.items():
+        if model_name in models:
+            ordered = [model_name] + [m for m in models if m != model_name]
+            return group_name, ordered
+    return None, None
+
+
+class _RaceSink:
+    """
+    对冲请求中单个候选模型的输出对象
+
+    第一个产生非空文本的候选模型获胜，其输出转发到真正的输出区域；
+    其余候选模型在下一次输出时收到 StreamCancelled 并退出。
+    """
+
+    def __init__(self, race, model_name):
+        self.race = race
+        self.model_name = model_name
+        self.current_lang = getattr(race.content_area, 'current_lang', 'zh')
+
+    def append_text(self, text):
+        if not text:
+            return
+        if not self.race.claim(self.model_name):
+            raise StreamCancelled()
+        self.race.content_area.append_text(text)
+
+    def clear_output(self):
+        # 只有获胜者的输出显示在输出区域中
+        if self.race.winner == self.model_name:
+            self.race.content_area.clear_output()
+
+    def set_status(self, message, is_error=False):
+        pass
+
+
+class _Race:
+    def __init__(self, content_area, models, cancel_token):
+        self.content_area = content_area
+        self.lock = threading.Lock()
+        self.winner = None
+        self.winner_decided = threading.Event()
+        self.tokens = {model: CancelToken() for model in models}
+        self.results = {}
+        self.errors = {}
+        if cancel_token:
+            # 整个对冲请求被取消时，取消所有候选模型
+            for token in self.tokens.values():
+                cancel_token.register(token.cancel)
+
+    def claim(self, model_name):
+        """尝试成为获胜者，成功后取消其余候选模型"""
+        with self.lock:
+            if self.winner is None:
+                self.winner = model_name
+                self.winner_decided.set()
+                losers = [token for model, token in self.tokens.items() if model != model_name]
+            else:
+                return self.winner == model_name
+        for token in losers:
+            token.cancel()
+        return True
+
+
+def stream_hedged(models, stream_fn, content_area, cancel_token=None, group_name=None):
+    """
+    把同一请求发送给对冲组中的多个模型，最先产生 token 的模型获胜
+
+    参数:
+    - models: 候选模型列表，按顺序依次错开 HEDGE_STAGGER_SECONDS 秒启动
+    - stream_fn: stream_fn(model_name, content_area, cancel_token) -> str，执行单个流式请求
+    - content_area: 输出对象
+    - cancel_token: 可选的取消令牌
+    - group_name: 对冲组名，用于统计胜率
+
+    返回:
+    - (full_response, winner_model)
+    """
+    race = _Race(content_area, models, cancel_token)
+    stagger = src.config.config.HEDGE_STAGGER_SECONDS
+
+    def run(index, model_name):
+        # 错开启动；若在等待期间已有模型获胜则不再发送请求
+        if index and race.winner_decided.wait(stagger * index):
+            return
+        token = race.tokens[model_name]
+        if token.is_cancelled:
+            return
+        try:
+            race.results[model_name] = stream_fn(model_name, _RaceSink(race, model_name), token)
+        except StreamCancelled:
+            pass
+        except Exception as e:
+            race.errors[model_name] = e
+
+    threads = [
+        threading.Thread(target=run, args=(index, model_name), daemon=True, name=f"hedge-{index}")
+        for index, model_name in enumerate(models)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    if cancel_token:
+        cancel_token.raise_if_cancelled()
+
+    if race.winner is None or race.winner not in race.results:
+        # 获胜者中途失败或所有候选模型都失败
+        error = race.errors.get(race.winner) or next(iter(race.errors.values()), None)
+        if error:
+            raise error
+        return "", race.winner
+
+    record_race(group_name, models, race.winner)
+    return race.results[race.winner], race.winner
+
+
+def _stats_path():
+    return os.path.join(src.config.config.DATA_DIR, "hedge_stats.json")
+
+
+def _load_stats():
+    try:
+        with open(_stats_path(), 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def record_race(group_name, models, winner):
+    """记录一次对冲请求的结果"""
+    if not group_name:
+        return
+    with _stats_lock:
+        stats = _load_stats()
+        group_stats = stats.setdefault(group_name, {})
+        for model_name in models:
+            entry = group_stats.setdefault(model_name, {"races": 0, "wins": 0})
+            entry["races"] += 1
+            if model_name == winner:
+                entry["wins"] += 1
+        try:
+            os.makedirs(src.config.config.DATA_DIR, exist_ok=True)
+            with open(_stats_path(), 'w', encoding='utf-8') as f:
+                json.dump(stats, f, ensure_ascii=False, indent=2)
+        except OSError:
+            pass
+
+
+def get_win_rates(group_name):
+    """
+    获取对冲组内各模型的胜率
+
+    返回:
+    - list: [(model_name, wins, races, win_rate), ...]，按胜率从高到低排序
+    """
+    with _stats_lock:
+        group_stats = _load_stats().get(group_name, {})
+    rates = []
+    for model_name, entry in group_stats.items():
+        races = entry.get("races", 0)
+        wins = entry.get("wins", 0)
+        rates.append((model_name, wins, races, wins / races if races else 0.0))
+    rates.sort(key=lambda item: item[3], reverse=True)
+    return rates
+
+
+def format_win_rates(group_name):
+    """生成用于状态栏显示的胜率摘要"""
+    return " / ".join(
+        f"{model_name[1:model_name.index(']')] if model_name.startswith('[') else model_name} {rate:.0%}"
+        for model_name, _, _, rate in get_win_rates(group_name)
+    )
+
+
+if __name__ == "__main__":
+    # 用法: python -m src.api.hedge  输出所有对冲组的胜率
+    stats = _load_stats()
+    if not stats:
+        print("No hedged requests recorded yet.")
+        sys.exit(0)
+    for name in stats:
+        print(f"[{name}]")
+        for model_name, wins, races, rate in get_win_rates(name):
+            print(f"  {model_name:<50} {wins:>5}/{races:<5} {rate:6.1%}")
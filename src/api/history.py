@@ -0,0 +1,142 @@
+import threading
+import src.config.config
+from src.api.sinks import CollectingSink
+
+# 滚动摘要消息的开头，用于在历史中识别摘要
+SUMMARY_PREFIX = "Previous conversation summary:\n"
+
+# 保护对话历史的修改：请求线程追加消息，后台摘要线程替换已摘要的消息
+_lock = threading.Lock()
+# 正在后台生成摘要的历史（按 id 记录），同一历史同时只运行一个摘要任务
+_pending = set()
+
+
+def update_history(history, prompt, full_response, model_name=None):
+    """
+    把本轮的用户消息与助手回复追加到对话历史，超出 MAX_CONTEXT_MESSAGES 时压缩
+
+    参数:
+    - model_name: 本轮对话使用的模型；未配置 ROLLING_SUMMARY_MODEL 时用它生成滚动摘要，
+      对话内容不会发送给其他提供商
+    """
+    if history is None:
+        return
+    with _lock:
+        # 添加用户消息（如果有）
+        if prompt:  # 注意这里保存原始的prompt，不包含附加提示词
+            history.append(("user", prompt))
+
+        # 添加助手消息
+        if full_response:
+            history.append(("assistant", full_response))
+
+        # 如果历史太长，保留最近的消息
+        max_history = src.config.config.MAX_CONTEXT_MESSAGES
+        if len(history) <= max_history:
+            return
+        summary_model = src.config.config.ROLLING_SUMMARY_MODEL or model_name
+        if src.config.config.SUMMARIZE_CONTEXT and summary_model:
+            # 在后台把超出的消息合并进滚动摘要，摘要完成前这些消息仍保留在历史中
+            _schedule_summary(history, max_history, summary_model)
+            # 摘要持续失败或跟不上时，丢弃最早的消息，避免历史无限增长
+            if len(history) > max_history * 2:
+                system_msg, summary_msg, body = _split_history(history)
+                history[:] = [msg for msg in (system_msg, summary_msg) if msg] + body[-max_history:]
+        elif src.config.config.SUMMARIZE_CONTEXT:
+            # 保留系统消息，但创建一个早期消息的摘要
+            system_msg = None
+            if history[0][0] == "system":
+                system_msg = history[0]
+
+            # 创建摘要的内容
+            summary = SUMMARY_PREFIX
+            for i, (role, content) in enumerate(history[:len(history) - max_history + 2]):
+                if i == 0 and role == "system":
+                    continue  # 跳过系统消息
+                summary += f"{role}: {content[:100]}...\n"
+
+            # 重建历史记录
+            new_history = []
+            if system_msg:
+                new_history.append(system_msg)
+            new_history.append(("system", summary))
+            new_history.extend(history[-(max_history-2):])
+            history[:] = new_history
+        else:
+            # 简单地保留最近的消息
+            history[:] = history[-max_history:]
+
+
+def _split_history(history):
+    """
+    返回:
+    - (开头的系统消息或 None, 滚动摘要消息或 None, 其余消息)
+    """
+    index = 0
+    system_msg = summary_msg = None
+    if index < len(history) and history[index][0] == "system" and not history[index][1].startswith(SUMMARY_PREFIX):
+        system_msg = history[index]
+        index += 1
+    if index < len(history) and history[index][0] == "system" and history[index][1].startswith(SUMMARY_PREFIX):
+        summary_msg = history[index]
+        index += 1
+    return system_msg, summary_msg, history[index:]
+
+
+def _schedule_summary(history, max_history, summary_model):
+    """在后台线程中生成滚动摘要；调用方需持有 _lock"""
+    if id(history) in _pending:
+        # 上一次摘要尚未完成，完成后由下一轮对话再次触发
+        return
+    system_msg, summary_msg, body = _split_history(history)
+    # 保留最近的消息（与系统消息、摘要合计不超过 MAX_CONTEXT_MESSAGES），其余合并进摘要
+    keep = max(2, max_history - 1 - (1 if system_msg else 0))
+    evicted = body[:-keep]
+    # 不在一问一答之间截断
+    if evicted and evicted[-1][0] == "user":
+        evicted = evicted[:-1]
+    if not evicted:
+        return
+    _pending.add(id(history))
+    threading.Thread(
+        target=_fold_into_summary,
+        args=(history, summary_msg, evicted, summary_model),
+        daemon=True,
+        name="rolling-summary"
+    ).start()
+
+
+def _fold_into_summary(history, summary_msg, evicted, summary_model):
+    """调用 summary_model 把移出的消息合并进摘要，并替换历史中对应的消息"""
+    try:
+        # 在函数内导入，避免与 api 模块循环导入
+        from src.api.api import stream_messages
+        previous = summary_msg[1][len(SUMMARY_PREFIX):] if summary_msg else ""
+        turns = "\n\n".join(f"{role}: {content}" for role, content in evicted)
+        sink = CollectingSink()
+        stream_messages(
+            summary_model,
+            [
+                ("system", src.config.config.ROLLING_SUMMARY_PROMPT),
+                ("user", f"Existing summary:\n{previous or '(none)'}\n\nNew turns:\n{turns}")
+            ],
+            0,
+            sink
+        )
+        summary = sink.text.strip()
+    except Exception:
+        # 摘要失败时保留原消息，下一轮对话再次尝试
+        summary = ""
+
+    with _lock:
+        _pending.discard(id(history))
+        if not summary:
+            return
+        # 摘要期间历史可能已被重置或修改，只在原消息仍在原位时替换
+        system_msg, current_summary, body = _split_history(history)
+        if current_summary is not summary_msg or body[:len(evicted)] != evicted:
+            return
+        new_history = [system_msg] if system_msg else []
+        new_history.append(("system", SUMMARY_PREFIX + summary))
+        new_history.extend(body[len(evicted):])
+        history[:] = new_history
@@ -0,0 +1,205 @@
+import hashlib
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import src.config.config
+from src.api.cancellation import CancelToken
+from src.api.circuit_breaker import provider_name_of
+from src.api.sinks import CollectingSink
+from src.api.response_cache import lookup_response, store_response
+from src.api.token_budget import estimate_tokens, request_budget
+from src.gui.lang import STRINGS
+
+# 按提供商限制分段请求的并发数: {provider_name: (limit, semaphore)}
+_semaphores = {}
+_semaphores_lock = threading.Lock()
+
+
+def _provider_semaphore(model_name):
+    limit = src.config.config.MAP_REDUCE_PROVIDER_CONCURRENCY
+    name = provider_name_of(model_name)
+    with _semaphores_lock:
+        entry = _semaphores.get(name)
+        # 配置修改后重新创建
+        if entry is None or entry[0] != limit:
+            entry = _semaphores[name] = (limit, threading.Semaphore(limit))
+        return entry[1]
+
+
+def should_map_reduce(model_name, transcript, reserved_tokens=0):
+    """
+    判断是否对转录文本使用分段汇总
+
+    仅在启用 ENABLE_MAP_REDUCE、当前附加模式属于 MAP_REDUCE_MODES，
+    且转录文本超出所选模型的 token 预算时使用。
+
+    参数:
+    - model_name: 所选模型
+    - transcript: 转录文本
+    - reserved_tokens: 请求中其余部分（系统提示、前缀、后缀等）占用的 token 数
+    """
+    if not src.config.config.ENABLE_MAP_REDUCE or not transcript:
+        return False
+    if src.config.config.CURRENT_AUXILIARY_MODE not in src.config.config.MAP_REDUCE_MODES:
+        return False
+    return estimate_tokens(transcript) > request_budget(model_name) - reserved_tokens
+
+
+def split_chunks(text, chunk_tokens, overlap_tokens):
+    """
+    按行把文本切分为相互重叠的分段
+
+    从开头依次贪心切分，文本在末尾增长时，之前的完整分段保持不变，
+    重新运行时可以直接使用缓存的分段结果。
+
+    参数:
+    - text: 待切分的文本
+    - chunk_tokens: 每段的 token 上限
+    - overlap_tokens: 相邻分段重叠的 token 数
+
+    返回:
+    - list: 分段文本列表
+    """
+    lines = []
+    for line in text.split("\n"):
+        # 超长的单行按字符切开，保证每段都不超过上限
+        cost = estimate_tokens(line)
+        if cost > chunk_tokens:
+            step = max(1, len(line) * chunk_tokens // cost)
+            lines.extend(line[i:i + step] for i in range(0, len(line), step))
+        else:
+            lines.append(line)
+
+    chunks = []
+    start = 0
+    while start < len(lines):
+        end = start
+        used = 0
+        while end < len(lines) and (end == start or used + estimate_tokens(lines[end]) <= chunk_tokens):
+            used += estimate_tokens(lines[end])
+            end += 1
+        chunks.append("\n".join(lines[start:end]))
+        if end >= len(lines):
+            break
+        # 下一段从本段末尾约 overlap_tokens 处开始，且至少前进一行
+        next_start = end
+        overlap = 0
+        while next_start - 1 > start and overlap + estimate_tokens(lines[next_start - 1]) <= overlap_tokens:
+            next_start -= 1
+            overlap += estimate_tokens(lines[next_start])
+        start = next_start
+    return [chunk for chunk in chunks if chunk.strip()]
+
+
+def _chunk_key(model_name, system_prompt, chunk):
+    """分段结果的缓存键；未启用响应缓存时返回 None，结果既不读取也不写入磁盘"""
+    if not src.config.config.ENABLE_RESPONSE_CACHE:
+        return None
+    payload = "\0".join(("map_reduce", model_name, system_prompt, chunk))
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def _map(model_name, system_prompt, chunks, stream_fn, content_area, cancel_token):
+    """
+    并行处理所有分段，已缓存的分段直接使用缓存结果
+
+    返回:
+    - list: 与 chunks 一一对应的处理结果
+    """
+    lang = getattr(content_area, 'current_lang', 'zh')
+    results = [None] * len(chunks)
+    keys = [_chunk_key(model_name, system_prompt, chunk) for chunk in chunks]
+    for index, key in enumerate(keys):
+        results[index] = lookup_response(key)
+    pending = [index for index, result in enumerate(results) if result is None]
+    cached = len(chunks) - len(pending)
+    progress = {"done": cached}
+    progress_lock = threading.Lock()
+    content_area.set_status(STRINGS[lang]['map_reduce_progress'].format(cached, len(chunks), cached))
+    if not pending:
+        return results
+
+    # 任一分段失败时取消其余分段；外部取消时一并取消
+    token = CancelToken()
+    if cancel_token:
+        cancel_token.register(token.cancel)
+    semaphore = _provider_semaphore(model_name)
+
+    def run(index):
+        with semaphore:
+            token.raise_if_cancelled()
+            sink = CollectingSink(lang)
+            stream_fn(model_name, [("system", system_prompt), ("user", chunks[index])], sink, token)
+        text = sink.text
+        store_response(keys[index], model_name, text)
+        with progress_lock:
+            progress["done"] += 1
+            content_area.set_status(
+                STRINGS[lang]['map_reduce_progress'].format(progress["done"], len(chunks), cached)
+            )
+        return index, text
+
+    workers = min(len(pending), src.config.config.MAP_REDUCE_PROVIDER_CONCURRENCY)
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="map-reduce") as executor:
+        futures = [executor.submit(run, index) for index in pending]
+        error = None
+        for future in futures:
+            try:
+                index, text = future.result()
+                results[index] = text
+            except Exception as e:
+                if error is None:
+                    error = e
+                    token.cancel()
+    if cancel_token:
+        cancel_token.raise_if_cancelled()
+    if error is not None:
+        raise error
+    return results
+
+
+def run_map_reduce(transcript, content_area, model_name, instructions, stream_fn, context="", cancel_token=None):
+    """
+    分段汇总：把转录文本切分后并行处理各段，再把各段结果汇总并流式输出
+
+    参数:
+    - transcript: 转录文本
+    - content_area: 输出对象，汇总结果流式追加到这里
+    - model_name: 所选模型，用于汇总；分段处理使用 MAP_REDUCE_MODEL（未配置时同为所选模型）
+    - instructions: 任务说明（附加模式的提示词）
+    - stream_fn: stream_fn(model_name, messages, content_area, cancel_token) -> str，执行单个流式请求
+    - context: 附加在汇总请求中的其他输入（用户前缀、后缀、OCR 文本）
+    - cancel_token: 可选的取消令牌
+
+    返回:
+    - str: 汇总结果
+    """
+    lang = getattr(content_area, 'current_lang', 'zh')
+    map_model = src.config.config.MAP_REDUCE_MODEL or model_name
+    map_prompt = src.config.config.MAP_REDUCE_MAP_PROMPT.format(instructions=instructions)
+    reduce_prompt = src.config.config.MAP_REDUCE_REDUCE_PROMPT.format(instructions=instructions)
+    chunk_tokens = min(
+        src.config.config.MAP_REDUCE_CHUNK_TOKENS,
+        request_budget(map_model) - estimate_tokens(map_prompt)
+    )
+
+    chunks = split_chunks(transcript, chunk_tokens, src.config.config.MAP_REDUCE_OVERLAP_TOKENS)
+    notes = _map(map_model, map_prompt, chunks, stream_fn, content_area, cancel_token)
+
+    # 各段结果合计仍超出汇总模型的预算时，把结果再分段合并，最多 MAP_REDUCE_MAX_LEVELS 层
+    reduce_budget = request_budget(model_name) - estimate_tokens(reduce_prompt) - estimate_tokens(context)
+    for _ in range(src.config.config.MAP_REDUCE_MAX_LEVELS):
+        if len(notes) < 2 or sum(estimate_tokens(note) for note in notes) <= reduce_budget:
+            break
+        notes = _map(
+            map_model,
+            map_prompt,
+            split_chunks("\n\n".join(notes), chunk_tokens, 0),
+            stream_fn,
+            content_area,
+            cancel_token
+        )
+
+    content_area.set_status(STRINGS[lang]['map_reduce_reducing'].format(len(notes)))
+    parts = [context] if context else []
+    parts.extend(f"[{index + 1}/{len(notes)}]\n{note.strip()}" for index, note in enumerate(notes))
+    return stream_fn(model_name, [("system", reduce_prompt), ("user", "\n\n".join(parts))], content_area, cancel_token)
@@ -0,0 +1,271 @@
+import contextvars
+import math
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+import src.config.config
+from src.config.config import get_provider_info
+from src.gui.lang import STRINGS
+
+_lock = threading.Lock()
+# (数据库路径, 连接)，DATA_DIR 变化时重新打开
+_connection = None
+_current_timer = contextvars.ContextVar("request_timer", default=None)
+
+
+class RequestTimer:
+    """
+    记录单次流式请求的各阶段耗时
+
+    - connect_ms: 从发出请求到收到响应头（包含建立连接与服务端排队）
+    - ttft_ms: 从发出请求到收到第一个非空 token
+    - tokens_per_sec: 第一个 token 之后的输出速率
+    - total_ms: 从发出请求到流结束
+    """
+
+    def __init__(self, model_name):
+        self.model_name = model_name
+        self.started_at = time.perf_counter()
+        self.headers_at = None
+        self.first_token_at = None
+
+    def mark_headers(self):
+        if self.headers_at is None:
+            self.headers_at = time.perf_counter()
+
+    def mark_token(self, text):
+        if text and self.first_token_at is None:
+            self.first_token_at = time.perf_counter()
+
+    def finish(self, completion_tokens):
+        """
+        结束计时
+
+        参数:
+        - completion_tokens: 输出 token 数
+
+        返回:
+        - dict: 各项指标，未收到的阶段为 None
+        """
+        ended_at = time.perf_counter()
+        tokens_per_sec = None
+        if self.first_token_at is not None and completion_tokens and ended_at > self.first_token_at:
+            tokens_per_sec = completion_tokens / (ended_at - self.first_token_at)
+        return {
+            "model": self.model_name,
+            "connect_ms": _elapsed_ms(self.started_at, self.headers_at),
+            "ttft_ms": _elapsed_ms(self.started_at, self.first_token_at),
+            "tokens_per_sec": tokens_per_sec,
+            "total_ms": _elapsed_ms(self.started_at, ended_at),
+        }
+
+
+def _elapsed_ms(start, end):
+    return (end - start) * 1000 if end is not None else None
+
+
+@contextmanager
+def bind_timer(timer):
+    """在当前上下文（线程或 asyncio 任务）中绑定请求计时器，期间收到的响应头由连接池的钩子记录"""
+    reset_token = _current_timer.set(timer)
+    try:
+        yield timer
+    finally:
+        _current_timer.reset(reset_token)
+
+
+async def mark_response_headers(response):
+    """httpx 异步客户端的 response 事件钩子：记录当前任务的请求收到响应头的时间"""
+    timer = _current_timer.get()
+    if timer is not None:
+        timer.mark_headers()
+
+
+def _db_path():
+    return os.path.join(src.config.config.DATA_DIR, "metrics.sqlite3")
+
+
+def _connect():
+    global _connection
+    path = _db_path()
+    if _connection and _connection[0] == path:
+        return _connection[1]
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    # 在多个工作线程中使用，访问由 _lock 串行化
+    conn = sqlite3.connect(path, check_same_thread=False)
+    conn.execute(
+        "CREATE TABLE IF NOT EXISTS latency ("
+        " id INTEGER PRIMARY KEY AUTOINCREMENT,"
+        " created_at REAL NOT NULL,"
+        " provider TEXT NOT NULL,"
+        " model TEXT NOT NULL,"
+        " connect_ms REAL,"
+        " ttft_ms REAL,"
+        " tokens_per_sec REAL,"
+        " total_ms REAL NOT NULL)"
+    )
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_latency_model ON latency (model, id)")
+    conn.execute(
+        "CREATE TABLE IF NOT EXISTS draft_refine ("
+        " id INTEGER PRIMARY KEY AUTOINCREMENT,"
+        " created_at REAL NOT NULL,"
+        " draft_model TEXT NOT NULL,"
+        " model TEXT NOT NULL,"
+        " swap TEXT NOT NULL,"
+        " draft_ttft_ms REAL,"
+        " draft_total_ms REAL,"
+        " ttft_ms REAL,"
+        " total_ms REAL)"
+    )
+    conn.commit()
+    _connection = (path, conn)
+    return conn
+
+
+def record_latency(result):
+    """保存一次请求的耗时指标"""
+    provider_info = get_provider_info(result["model"] or "")
+    try:
+        with _lock:
+            conn = _connect()
+            conn.execute(
+                "INSERT INTO latency (created_at, provider, model, connect_ms, ttft_ms, tokens_per_sec, total_ms)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (
+                    time.time(),
+                    provider_info.name if provider_info else "unknown",
+                    result["model"],
+                    result["connect_ms"],
+                    result["ttft_ms"],
+                    result["tokens_per_sec"],
+                    result["total_ms"],
+                )
+            )
+            conn.commit()
+    except sqlite3.Error:
+        # 统计失败不影响正常请求
+        pass
+
+
+def record_draft_refine(result):
+    """
+    保存一次草稿-正式回答请求中两路请求的耗时
+
+    参数:
+    - result: dict，包含 draft_model、model、swap 以及两路请求的 ttft_ms / total_ms，
+      草稿被替换而提前停止时 draft_total_ms 为 None
+    """
+    try:
+        with _lock:
+            conn = _connect()
+            conn.execute(
+                "INSERT INTO draft_refine"
+                " (created_at, draft_model, model, swap, draft_ttft_ms, draft_total_ms, ttft_ms, total_ms)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (
+                    time.time(),
+                    result["draft_model"],
+                    result["model"],
+                    result["swap"],
+                    result["draft_ttft_ms"],
+                    result["draft_total_ms"],
+                    result["ttft_ms"],
+                    result["total_ms"],
+                )
+            )
+            conn.commit()
+    except sqlite3.Error:
+        pass
+
+
+def _percentile(values, fraction):
+    """最近秩法计算分位数"""
+    ordered = sorted(values)
+    index = max(0, min(len(ordered) - 1, math.ceil(fraction * len(ordered)) - 1))
+    return ordered[index]
+
+
+def rolling_percentiles(model_name):
+    """
+    计算模型最近 METRICS_WINDOW 次请求的 p50/p95
+
+    返回:
+    - dict: {指标名: (p50, p95)}，没有数据的指标不包含在内
+    """
+    with _lock:
+        rows = _connect().execute(
+            "SELECT connect_ms, ttft_ms, tokens_per_sec, total_ms FROM latency"
+            " WHERE model = ? ORDER BY id DESC LIMIT ?",
+            (model_name, src.config.config.METRICS_WINDOW)
+        ).fetchall()
+    stats = {}
+    for index, name in enumerate(("connect_ms", "ttft_ms", "tokens_per_sec", "total_ms")):
+        values = [row[index] for row in rows if row[index] is not None]
+        if values:
+            stats[name] = (_percentile(values, 0.5), _percentile(values, 0.95))
+    return stats
+
+
+def finish_request(timer, completion_tokens, content_area, prompt_tokens=0, cached_tokens=0, note=None):
+    """
+    结束计时、保存指标，并在状态栏显示本次与滚动分位数
+
+    参数:
+    - timer: RequestTimer 计时器
+    - completion_tokens: 输出 token 数
+    - content_area: 输出对象
+    - prompt_tokens: 输入 token 数
+    - cached_tokens: 命中提供商缓存的输入 token 数，大于 0 时一并显示
+    - note: 可选的附加说明，显示在最前面
+    """
+    result = timer.finish(completion_tokens)
+    record_latency(result)
+    lang = getattr(content_area, 'current_lang', 'zh')
+    parts = [note] if note else []
+    if src.config.config.SHOW_LATENCY_STATUS:
+        try:
+            stats = rolling_percentiles(result["model"])
+        except sqlite3.Error:
+            stats = {}
+        parts.append(format_latency(result, stats, lang))
+    if cached_tokens and prompt_tokens:
+        parts.append(STRINGS[lang]['cached_tokens_summary'].format(
+            cached_tokens, prompt_tokens, cached_tokens / prompt_tokens
+        ))
+    if parts:
+        content_area.set_status(" | ".join(parts))
+
+
+def format_latency(result, stats, lang):
+    """生成状态栏显示的耗时摘要"""
+    def ms(value):
+        return f"{value:.0f}" if value is not None else "-"
+
+    ttft_p50, ttft_p95 = stats.get("ttft_ms", (None, None))
+    rate = result["tokens_per_sec"]
+    return STRINGS[lang]['latency_summary'].format(
+        ms(result["ttft_ms"]),
+        ms(ttft_p50),
+        ms(ttft_p95),
+        f"{rate:.0f}" if rate is not None else "-",
+        result["total_ms"] / 1000,
+        ms(result["connect_ms"]),
+    )
+
+
+if __name__ == "__main__":
+    # 用法: python -m src.api.metrics  输出每个模型最近 METRICS_WINDOW 次请求的分位数
+    with _lock:
+        models = [row[0] for row in _connect().execute("SELECT DISTINCT model FROM latency ORDER BY model")]
+    if not models:
+        print("No latency recorded yet.")
+    for model_name in models:
+        stats = rolling_percentiles(model_name)
+        parts = []
+        for name in ("connect_ms", "ttft_ms", "tokens_per_sec", "total_ms"):
+            if name in stats:
+                p50, p95 = stats[name]
+                parts.append(f"{name} p50={p50:.0f} p95={p95:.0f}")
+        print(f"{model_name:<50} " + "  ".join(parts))
@@ -0,0 +1,122 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from src.config.config import get_provider_info
+import src.config.config
+from src.api.cancellation import CancelToken, StreamCancelled
+from src.api.client_pool import get_async_http_client, get_gemini_client
+from src.api.engine import engine
+
+
+class Prewarmer:
+    """
+    在后台预热模型提供商的连接
+
+    选择模型后先等待一段防抖时间，再解析 DNS 并建立到该提供商 base_url 的
+    TLS 连接，连接随后保留在连接池中，供真正的请求直接复用。
+    - 快速切换模型时只有最后一次选择会真正执行
+    - 同一提供商在 PREWARM_MIN_INTERVAL 秒内只预热一次
+    - 预热串行执行，同一时间最多只有一个预热请求
+    - 真正的请求开始或窗口关闭时取消预热，正在执行的预热请求也会随之关闭
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._timer = None
+        self._generation = 0
+        self._last_warmed = {}
+        # 正在执行的预热请求的取消令牌
+        self._token = None
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="prewarm")
+
+    def schedule(self, model_name):
+        """安排预热指定模型的提供商连接，会取消之前尚未执行的预热"""
+        if not src.config.config.ENABLE_PREWARM or not get_provider_info(model_name or ""):
+            return
+
+        with self._lock:
+            self._cancel_locked()
+            generation = self._generation
+            self._timer = threading.Timer(
+                src.config.config.PREWARM_DEBOUNCE_SECONDS,
+                self._submit,
+                args=(model_name, generation)
+            )
+            self._timer.daemon = True
+            self._timer.start()
+
+    def cancel(self):
+        """取消尚未完成的预热"""
+        with self._lock:
+            self._cancel_locked()
+
+    def _cancel_locked(self):
+        self._generation += 1
+        if self._timer:
+            self._timer.cancel()
+            self._timer = None
+        if self._token:
+            self._token.cancel()
+            self._token = None
+
+    def _is_current(self, generation):
+        with self._lock:
+            return generation == self._generation
+
+    def _submit(self, model_name, generation):
+        if self._is_current(generation):
+            self._executor.submit(self._warm, model_name, generation)
+
+    def _warm(self, model_name, generation):
+        provider_info = get_provider_info(model_name)
+        now = time.monotonic()
+        token = CancelToken()
+        with self._lock:
+            # 排队期间被取消或已被新的选择替代
+            if generation != self._generation:
+                return
+            last = self._last_warmed.get(provider_info.name)
+            if last is not None and now - last < src.config.config.PREWARM_MIN_INTERVAL:
+                return
+            self._last_warmed[provider_info.name] = now
+            self._token = token
+
+        try:
+            if provider_info.name == "Gemini":
+                # Gemini 使用原生 SDK，通过查询模型信息在其连接池中建立连接
+                clean_model_name = model_name[model_name.index("]") + 2:]
+                engine.run(get_gemini_client().aio.models.get(model=clean_model_name), token)
+            else:
+                engine.run(self._warm_async(model_name), token)
+        except StreamCancelled:
+            # 被取消的预热不计入间隔，之后可以重新预热
+            with self._lock:
+                if self._last_warmed.get(provider_info.name) == now:
+                    del self._last_warmed[provider_info.name]
+        except Exception:
+            # 预热失败不影响正常请求；失败同样计入间隔，避免反复请求不可用的端点
+            pass
+        finally:
+            with self._lock:
+                if self._token is token:
+                    self._token = None
+
+    @staticmethod
+    async def _warm_async(model_name):
+        # 在 provider engine 的事件循环中预热，连接留在真正请求所用的异步连接池中；
+        # 任意响应（包括 401/404）都会在连接池中留下已完成握手的连接
+        http_client, base_url = get_async_http_client(model_name)
+        await http_client.head(base_url, timeout=src.config.config.PREWARM_TIMEOUT)
+
+
+_prewarmer = Prewarmer()
+
+
+def schedule_prewarm(model_name):
+    """安排预热模型提供商的连接"""
+    _prewarmer.schedule(model_name)
+
+
+def cancel_prewarm():
+    """取消尚未完成或正在执行的预热，在真正的请求开始前与退出时调用"""
+    _prewarmer.cancel()
@@ -0,0 +1,42 @@
+import src.config.config
+import src.gui.prefix
+from src.api.gemini_api import get_auxiliary_mode_prompt
+
+
+def layout_enabled():
+    """是否按提示缓存友好的顺序组织请求（PREFIX_CACHE_FRIENDLY_LAYOUT）"""
+    return src.config.config.PREFIX_CACHE_FRIENDLY_LAYOUT
+
+
+def stable_system_prompt(base_system=""):
+    """
+    拼接请求之间保持不变的系统提示
+
+    顺序为：基础系统提示、预定义前缀（get_original_prefix）、附加模式提示词。
+    这部分放在请求最前面，OpenAI 兼容接口的自动提示缓存与本地 llama.cpp/Ollama
+    的 KV 复用才能命中。
+
+    参数:
+    - base_system: 基础系统提示
+
+    返回:
+    - str: 系统提示，各部分均为空时返回空字符串
+    """
+    parts = [base_system]
+    if src.config.config.USE_PREDEFINED_PREFIX:
+        parts.append(src.gui.prefix.get_original_prefix().strip())
+    parts.append(get_auxiliary_mode_prompt(src.config.config.CURRENT_AUXILIARY_MODE))
+    return "\n\n".join(part for part in parts if part)
+
+
+def assemble_user_prompt(prefix_text, transcript, suffix_text, ocr_text):
+    """
+    按从稳定到易变的顺序拼接用户消息
+
+    用户前缀在前，转录文本（只在末尾增长）居中，用户后缀与 OCR 文本每次都可能变化，放在最后。
+
+    返回:
+    - str: 用户消息
+    """
+    parts = [prefix_text, transcript, suffix_text, ocr_text]
+    return "\n".join(part for part in parts if part).strip()
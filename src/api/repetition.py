@@ -0,0 +1,78 @@
+import src.config.config
+
+_BASE = 257
+_MOD = (1 << 61) - 1
+
+
+class RepetitionDetector:
+    """
+    在线检测流式回复末尾的循环重复
+
+    对已接收文本的每个长度为 REPETITION_NGRAM_CHARS 的字符 n-gram 计算滚动哈希，
+    当前 n-gram 与之前某处相同时，两处的距离即为候选周期 p；
+    之后每个新字符都与 p 个字符之前比较，连续相同的长度（run）覆盖至少
+    REPETITION_MIN_REPEATS 个周期且不少于 REPETITION_MIN_CHARS 个字符时判定为重复。
+    """
+
+    def __init__(self, ngram=None, min_repeats=None, min_chars=None):
+        self.ngram = ngram or src.config.config.REPETITION_NGRAM_CHARS
+        self.min_repeats = min_repeats or src.config.config.REPETITION_MIN_REPEATS
+        self.min_chars = min_chars or src.config.config.REPETITION_MIN_CHARS
+        self._chars = []
+        self._hash = 0
+        # _BASE^(ngram-1)，用于从滚动哈希中移除窗口最左侧的字符
+        self._high = pow(_BASE, self.ngram - 1, _MOD)
+        # n-gram 哈希 -> 最近一次出现时的结束位置
+        self._seen = {}
+        self._period = 0
+        self._run = 0
+        # 检测到重复时重复部分的起始位置
+        self._cut = None
+
+    @property
+    def repeated_chars(self):
+        """末尾重复部分的长度，去掉后保留重复内容的第一次出现"""
+        if self._cut is None:
+            return 0
+        return len(self._chars) - self._cut
+
+    def feed(self, text):
+        """
+        追加新接收的文本
+
+        返回:
+        - bool: 是否检测到重复
+        """
+        if self._cut is not None:
+            self._chars.extend(text)
+            return True
+        chars = self._chars
+        for offset, char in enumerate(text):
+            index = len(chars)
+            chars.append(char)
+            if index >= self.ngram:
+                self._hash = (self._hash - ord(chars[index - self.ngram]) * self._high) % _MOD
+            self._hash = (self._hash * _BASE + ord(char)) % _MOD
+            if index + 1 < self.ngram:
+                continue
+
+            # 当前周期仍然成立时延长重复长度，否则根据 n-gram 的上一次出现选择新的周期
+            if self._period and chars[index - self._period] == char:
+                self._run += 1
+            else:
+                previous = self._seen.get(self._hash)
+                if previous is not None and chars[previous - self.ngram + 1:previous + 1] == chars[-self.ngram:]:
+                    self._period = index - previous
+                    self._run = self.ngram
+                else:
+                    self._period = 0
+                    self._run = 0
+            self._seen[self._hash] = index
+
+            if (self._period and self._run >= self.min_chars
+                    and self._run >= (self.min_repeats - 1) * self._period):
+                self._cut = index + 1 - self._run
+                # 本段文本中剩余的字符同样属于重复部分
+                chars.extend(text[offset + 1:])
+                return True
+        return False
@@ -0,0 +1,183 @@
+import hashlib
+import json
+import os
+import sqlite3
+import sys
+import threading
+import time
+import src.config.config
+
+_lock = threading.Lock()
+# (数据库路径, 连接)，DATA_DIR 变化时重新打开
+_connection = None
+
+
+def _db_path():
+    return os.path.join(src.config.config.DATA_DIR, "response_cache.sqlite3")
+
+
+def _connect():
+    global _connection
+    path = _db_path()
+    if _connection and _connection[0] == path:
+        return _connection[1]
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    # 在多个工作线程中使用，访问由 _lock 串行化
+    conn = sqlite3.connect(path, check_same_thread=False)
+    conn.execute(
+        "CREATE TABLE IF NOT EXISTS responses ("
+        " key TEXT PRIMARY KEY,"
+        " model TEXT NOT NULL,"
+        " response TEXT NOT NULL,"
+        " size INTEGER NOT NULL,"
+        " created_at REAL NOT NULL,"
+        " last_used REAL NOT NULL)"
+    )
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_responses_last_used ON responses (last_used)")
+    conn.commit()
+    _connection = (path, conn)
+    return conn
+
+
+def _normalize_text(text):
+    """统一换行符并去掉首尾及行尾空白，避免无意义的差异导致缓存未命中"""
+    lines = (text or "").replace("\r\n", "\n").replace("\r", "\n").strip().split("\n")
+    return "\n".join(line.rstrip() for line in lines)
+
+
+def _file_hash(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(65536), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def make_cache_key(model_name, temperature, messages, image_paths=None):
+    """
+    生成响应缓存的键
+
+    参数:
+    - model_name: 模型名称
+    - temperature: 温度参数
+    - messages: 对话消息 [(role, content), ...]
+    - image_paths: 可选的图片路径列表，按文件内容计算哈希
+
+    返回:
+    - str: 缓存键；未启用缓存或温度不为 0（结果不确定）时返回 None
+    """
+    if not src.config.config.ENABLE_RESPONSE_CACHE:
+        return None
+    try:
+        if float(temperature) != 0:
+            return None
+    except (TypeError, ValueError):
+        return None
+
+    if isinstance(image_paths, str):
+        image_paths = [image_paths]
+    image_hashes = [_file_hash(path) for path in (image_paths or []) if path and os.path.exists(path)]
+
+    payload = {
+        "model": model_name,
+        "temperature": 0.0,
+        "messages": [[role, _normalize_text(content)] for role, content in messages],
+        "images": image_hashes,
+        "auxiliary_mode": src.config.config.CURRENT_AUXILIARY_MODE,
+        # Gemini 搜索的结果随时间变化，单独区分
+        "search": bool("[Gemini]" in model_name and src.config.config.ENABLE_GEMINI_SEARCH),
+    }
+    return hashlib.sha256(json.dumps(payload, ensure_ascii=False, sort_keys=True).encode("utf-8")).hexdigest()
+
+
+def lookup_response(key):
+    """
+    查询缓存的回复
+
+    返回:
+    - str: 缓存的回复文本，未命中或已过期时返回 None
+    """
+    if not key:
+        return None
+    now = time.time()
+    try:
+        with _lock:
+            conn = _connect()
+            row = conn.execute("SELECT response, created_at FROM responses WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            if now - row[1] > src.config.config.RESPONSE_CACHE_TTL:
+                conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+                conn.commit()
+                return None
+            conn.execute("UPDATE responses SET last_used = ? WHERE key = ?", (now, key))
+            conn.commit()
+            return row[0]
+    except sqlite3.Error:
+        # 缓存不可用时按未命中处理，不影响正常请求
+        return None
+
+
+def store_response(key, model_name, response):
+    """保存回复，并按最近使用时间淘汰超出 RESPONSE_CACHE_MAX_SIZE_MB 的旧条目"""
+    if not key or not response:
+        return
+    now = time.time()
+    size = len(response.encode("utf-8"))
+    try:
+        with _lock:
+            conn = _connect()
+            conn.execute(
+                "INSERT OR REPLACE INTO responses (key, model, response, size, created_at, last_used)"
+                " VALUES (?, ?, ?, ?, ?, ?)",
+                (key, model_name, response, size, now, now)
+            )
+            _evict(conn, now)
+            conn.commit()
+    except sqlite3.Error:
+        pass
+
+
+def _evict(conn, now):
+    conn.execute("DELETE FROM responses WHERE created_at < ?", (now - src.config.config.RESPONSE_CACHE_TTL,))
+    max_size = src.config.config.RESPONSE_CACHE_MAX_SIZE_MB * 1024 * 1024
+    total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+    if total <= max_size:
+        return
+    stale = []
+    for key, size in conn.execute("SELECT key, size FROM responses ORDER BY last_used ASC"):
+        if total <= max_size:
+            break
+        stale.append((key,))
+        total -= size
+    conn.executemany("DELETE FROM responses WHERE key = ?", stale)
+
+
+def clear_cache():
+    """清空响应缓存"""
+    try:
+        with _lock:
+            conn = _connect()
+            conn.execute("DELETE FROM responses")
+            conn.commit()
+    except sqlite3.Error:
+        pass
+
+
+def cache_stats():
+    """
+    返回:
+    - (条目数, 总字节数)
+    """
+    with _lock:
+        conn = _connect()
+        return conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM responses").fetchone()
+
+
+if __name__ == "__main__":
+    # 用法: python -m src.api.response_cache [--clear]
+    if "--clear" in sys.argv[1:]:
+        clear_cache()
+        print("Response cache cleared.")
+    count, total = cache_stats()
+    print(f"{count} cached responses, {total / 1024:.1f} KiB ({_db_path()})")
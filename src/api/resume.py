@@ -0,0 +1,109 @@
+import src.config.config
+from src.api.cancellation import StreamCancelled
+from src.api.errors import StreamInterrupted, is_provider_failure
+from src.gui.lang import STRINGS
+
+# 续传的回复开头与已输出内容至少重叠这么多字符时才视为重复并去掉，避免误删
+_MIN_OVERLAP = 8
+
+
+class _ResumeSink:
+    """
+    转发到真正的输出对象，并记录已输出的全部文本
+
+    续传时先缓存新回复的开头，去掉与已输出内容末尾重复的部分后再输出，
+    使两段回复在输出区域中无缝衔接。
+    """
+
+    def __init__(self, content_area):
+        self.content_area = content_area
+        self.current_lang = getattr(content_area, 'current_lang', 'zh')
+        self.text = ""
+        # 本次续传开始前已输出的文本，清空输出时只清除本次续传的内容
+        self._base = ""
+        self._buffer = None
+
+    def begin_resume(self):
+        self._base = self.text
+        self._buffer = ""
+
+    def append_text(self, text):
+        if not text:
+            return
+        if self._buffer is None:
+            self._emit(text)
+            return
+        self._buffer += text
+        if len(self._buffer) >= src.config.config.STREAM_RESUME_OVERLAP_WINDOW:
+            self.flush()
+
+    def flush(self):
+        """去掉续传开头与已输出内容重复的部分，输出缓存的文本"""
+        if self._buffer is None:
+            return
+        buffer, self._buffer = self._buffer, None
+        tail = self.text[-len(buffer):] if buffer else ""
+        overlap = 0
+        for size in range(min(len(buffer), len(tail)), _MIN_OVERLAP - 1, -1):
+            if tail.endswith(buffer[:size]):
+                overlap = size
+                break
+        self._emit(buffer[overlap:])
+
+    def _emit(self, text):
+        if text:
+            self.text += text
+            self.content_area.append_text(text)
+
+    def clear_output(self):
+        self.content_area.clear_output()
+        self.text = ""
+        self._emit(self._base)
+        if self._buffer is not None:
+            # 续传中清空后重新输出的内容仍需与之前的内容去重
+            self._buffer = ""
+
+    def set_status(self, message, is_error=False):
+        self.content_area.set_status(message, is_error)
+
+
+def stream_with_resume(model_name, stream_fn, content_area, cancel_token=None):
+    """
+    执行流式请求，输出部分内容后连接中断时自动续传
+
+    续传请求在原消息之后附加已输出的部分回复与 STREAM_RESUME_PROMPT，
+    由 stream_fn 决定使用原模型或转移到其他提供商；最多续传 STREAM_RESUME_MAX_ATTEMPTS 次。
+
+    参数:
+    - model_name: 所选模型
+    - stream_fn: stream_fn(model_name, partial, content_area, cancel_token) -> (text, used_model)，
+      partial 为已输出的部分回复，首次请求时为空字符串
+    - content_area: 输出对象
+    - cancel_token: 可选的取消令牌
+
+    返回:
+    - (full_response, used_model)
+
+    尚未输出内容时的错误原样抛出；输出部分内容后无法续传时抛出 StreamInterrupted，
+    其 partial 为已输出的内容。
+    """
+    lang = getattr(content_area, 'current_lang', 'zh')
+    max_attempts = src.config.config.STREAM_RESUME_MAX_ATTEMPTS
+    sink = _ResumeSink(content_area)
+    attempt = 0
+    while True:
+        try:
+            _, used_model = stream_fn(model_name, sink.text, sink, cancel_token)
+            sink.flush()
+            return sink.text, used_model
+        except StreamCancelled:
+            raise
+        except Exception as e:
+            sink.flush()
+            if not sink.text:
+                raise
+            if not is_provider_failure(e) or attempt >= max_attempts:
+                raise StreamInterrupted(sink.text, e) from e
+        attempt += 1
+        content_area.set_status(STRINGS[lang]['stream_resuming'].format(attempt, max_attempts))
+        sink.begin_resume()
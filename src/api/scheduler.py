@@ -0,0 +1,170 @@
+import random
+import threading
+import time
+import src.config.config
+from src.api.cancellation import StreamCancelled
+from src.api.errors import RateLimitExceeded, is_provider_failure, retry_after_seconds
+from src.api.sinks import TrackingSink
+from src.gui.lang import STRINGS
+
+
+class TokenBucket:
+    """
+    令牌桶：容量为每分钟的配额，按配额 / 60 的速率持续补充
+
+    reserve() 采用预约方式扣减，令牌可以为负，返回值为需要等待的秒数；
+    这样并发请求会按到达顺序依次排队，而不会在令牌恢复时同时放行。
+    """
+
+    def __init__(self, per_minute):
+        self.capacity = float(per_minute)
+        self.rate = self.capacity / 60.0
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+
+    def _refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def reserve(self, amount, now):
+        # 单次请求超过桶容量时按容量计算，否则永远无法放行
+        amount = min(float(amount), self.capacity)
+        self._refill(now)
+        self.tokens -= amount
+        return max(0.0, -self.tokens / self.rate)
+
+    def refund(self, amount):
+        self.tokens = min(self.capacity, self.tokens + min(float(amount), self.capacity))
+
+
+class ProviderLimiter:
+    """单个提供商的速率限制：RPM 与 TPM 两个令牌桶，以及 Retry-After 指定的暂停时间"""
+
+    def __init__(self, name, rpm=None, tpm=None):
+        self.name = name
+        self.rpm = rpm
+        self.tpm = tpm
+        self._lock = threading.Lock()
+        self._request_bucket = TokenBucket(rpm) if rpm else None
+        self._token_bucket = TokenBucket(tpm) if tpm else None
+        self._blocked_until = 0.0
+
+    def acquire(self, estimated_tokens):
+        """
+        预约一次请求的配额
+
+        参数:
+        - estimated_tokens: 请求预计消耗的 token 数
+
+        返回:
+        - float: 发送请求前需要等待的秒数
+
+        需要等待的时间超过 RATE_LIMIT_MAX_WAIT 时退还配额并抛出 RateLimitExceeded。
+        """
+        with self._lock:
+            now = time.monotonic()
+            waits = [self._blocked_until - now]
+            if self._request_bucket:
+                waits.append(self._request_bucket.reserve(1, now))
+            if self._token_bucket:
+                waits.append(self._token_bucket.reserve(estimated_tokens, now))
+            wait = max(0.0, *waits)
+            if wait > src.config.config.RATE_LIMIT_MAX_WAIT:
+                if self._request_bucket:
+                    self._request_bucket.refund(1)
+                if self._token_bucket:
+                    self._token_bucket.refund(estimated_tokens)
+                raise RateLimitExceeded(self.name, wait)
+            return wait
+
+    def block_for(self, seconds):
+        """按服务端的 Retry-After 暂停该提供商的所有请求"""
+        with self._lock:
+            self._blocked_until = max(self._blocked_until, time.monotonic() + seconds)
+
+
+_limiters = {}
+_limiters_lock = threading.Lock()
+
+
+def get_limiter(provider_name):
+    """
+    获取提供商的速率限制器
+
+    返回:
+    - ProviderLimiter，提供商未配置 RPM/TPM 时返回 None
+    """
+    provider = src.config.config.PROVIDERS_CONFIG.get(provider_name)
+    rpm = getattr(provider, "rpm", None)
+    tpm = getattr(provider, "tpm", None)
+    if not rpm and not tpm:
+        return None
+    with _limiters_lock:
+        limiter = _limiters.get(provider_name)
+        # 配置修改后重新创建
+        if limiter is None or limiter.rpm != rpm or limiter.tpm != tpm:
+            limiter = _limiters[provider_name] = ProviderLimiter(provider_name, rpm, tpm)
+        return limiter
+
+
+def _backoff_delay(attempt):
+    """指数退避加完全抖动：在 [0, min(上限, 基数 * 2^attempt)] 中随机取值"""
+    ceiling = min(src.config.config.RETRY_BACKOFF_MAX, src.config.config.RETRY_BACKOFF_BASE * (2 ** attempt))
+    return random.uniform(0, ceiling)
+
+
+def _sleep(seconds, cancel_token):
+    if cancel_token:
+        if cancel_token.wait(seconds):
+            raise StreamCancelled()
+    else:
+        time.sleep(seconds)
+
+
+def run_scheduled(provider_name, estimated_tokens, request_fn, content_area, cancel_token=None):
+    """
+    在速率限制与重试策略下执行一次流式请求
+
+    参数:
+    - provider_name: 提供商名称，未知提供商不做速率限制，但仍会重试
+    - estimated_tokens: 请求预计消耗的 token 数
+    - request_fn: request_fn(content_area) -> str，执行实际请求
+    - content_area: 输出对象
+    - cancel_token: 可选的取消令牌
+
+    返回:
+    - request_fn 的返回值
+
+    发送前按令牌桶等待配额；超时、连接错误、429 与 5xx 在尚未输出文本时重试，
+    优先按 Retry-After 等待，否则按指数退避加抖动等待。
+    """
+    lang = getattr(content_area, 'current_lang', 'zh')
+    limiter = get_limiter(provider_name)
+    attempts = max(1, src.config.config.RETRY_MAX_ATTEMPTS)
+
+    for attempt in range(attempts):
+        if limiter:
+            wait = limiter.acquire(estimated_tokens)
+            if wait > 0:
+                content_area.set_status(STRINGS[lang]['rate_limit_waiting'].format(provider_name, wait))
+                _sleep(wait, cancel_token)
+
+        sink = TrackingSink(content_area)
+        try:
+            return request_fn(sink)
+        except StreamCancelled:
+            raise
+        except Exception as e:
+            if sink.has_output or not is_provider_failure(e) or attempt == attempts - 1:
+                raise
+            retry_after = retry_after_seconds(e)
+            if retry_after is not None and retry_after > src.config.config.RATE_LIMIT_MAX_WAIT:
+                raise
+            content_area.set_status(
+                STRINGS[lang]['request_retrying'].format(provider_name or "", attempt + 1, attempts - 1)
+            )
+            if retry_after is not None and limiter:
+                # 暂停该提供商的所有请求，下一次 acquire 会等待到 Retry-After 结束
+                limiter.block_for(retry_after)
+            else:
+                _sleep(retry_after if retry_after is not None else _backoff_delay(attempt), cancel_token)
@@ -0,0 +1,43 @@
+class TrackingSink:
+    """
+    转发到真正的输出对象，并记录是否已经输出过文本
+
+    重试与故障转移只在尚未输出任何文本时进行，避免把两次回复拼接在一起。
+    """
+
+    def __init__(self, content_area):
+        self.content_area = content_area
+        self.current_lang = getattr(content_area, 'current_lang', 'zh')
+        self.has_output = False
+
+    def append_text(self, text):
+        if text:
+            self.has_output = True
+        self.content_area.append_text(text)
+
+    def clear_output(self):
+        self.content_area.clear_output()
+
+    def set_status(self, message, is_error=False):
+        self.content_area.set_status(message, is_error)
+
+
+class CollectingSink:
+    """收集输出文本而不显示到界面，用于后台请求"""
+
+    def __init__(self, current_lang='zh'):
+        self.current_lang = current_lang
+        self.parts = []
+
+    @property
+    def text(self):
+        return "".join(self.parts)
+
+    def append_text(self, text):
+        self.parts.append(text)
+
+    def clear_output(self):
+        self.parts = []
+
+    def set_status(self, message, is_error=False):
+        pass
@@ -0,0 +1,132 @@
+import queue
+from PyQt6.QtCore import QThread, pyqtSignal
+import src.config.config
+from src.api.cancellation import CancelToken, StreamCancelled
+
+
+class StreamSink:
+    """
+    工作线程中代替 OutputArea 的输出对象
+
+    API 函数照常调用 append_text / clear_output / set_status，
+    这里把这些调用放入有界队列，由 GUI 线程取出后再更新界面。
+    队列已满时 put 会阻塞工作线程，从而对网络读取形成背压。
+    """
+
+    def __init__(self, notify, current_lang='zh', max_size=None):
+        self.queue = queue.Queue(maxsize=max_size or src.config.config.STREAM_QUEUE_MAX_SIZE)
+        self.notify = notify
+        self.current_lang = current_lang
+        self.closed = False
+
+    def _put(self, kind, payload=None):
+        if self.closed:
+            # 请求已取消，后续输出直接中止流式循环
+            raise StreamCancelled()
+        self.queue.put((kind, payload))
+        self.notify()
+
+    def close(self):
+        """停止接收输出，并清空队列以唤醒可能因队列已满而阻塞的工作线程"""
+        self.closed = True
+        while True:
+            try:
+                self.queue.get_nowait()
+            except queue.Empty:
+                break
+
+    def append_text(self, text):
+        """追加增量文本"""
+        if text:
+            self._put("append", text)
+
+    def clear_output(self):
+        """清空输出区域"""
+        self._put("clear")
+
+    def set_status(self, message, is_error=False):
+        """设置状态消息"""
+        self._put("status", (message, is_error))
+
+
+class StreamWorker(QThread):
+    """
+    在后台线程中执行流式 API 调用
+
+    参数:
+    - target: 要执行的 API 函数，第二个位置参数必须是输出对象（content_area）
+    - args: 传递给 target 的其余位置参数（不含 content_area）
+    - kwargs: 传递给 target 的关键字参数，会自动加入 cancel_token
+    - current_lang: 当前界面语言，供错误消息使用
+    """
+
+    # 队列中有新数据时发出，跨线程连接时自动以排队方式投递到 GUI 线程
+    data_ready = pyqtSignal()
+    # 调用结束时发出，携带完整回复文本
+    result_ready = pyqtSignal(str)
+
+    def __init__(self, target, args=(), kwargs=None, current_lang='zh', parent=None):
+        super().__init__(parent)
+        self.target = target
+        self.args = args
+        self.kwargs = kwargs or {}
+        self.cancel_token = CancelToken()
+        self.sink = StreamSink(self.data_ready.emit, current_lang)
+        self._draining = False
+
+    def run(self):
+        prompt, rest = self.args[0], self.args[1:]
+        try:
+            result = self.target(prompt, self.sink, *rest, cancel_token=self.cancel_token, **self.kwargs)
+        except StreamCancelled:
+            result = ""
+        self.result_ready.emit(result if isinstance(result, str) else "")
+
+    def cancel(self):
+        """取消请求：关闭底层 HTTP 响应，并丢弃尚未显示的输出"""
+        self.cancel_token.cancel()
+        self.sink.close()
+
+    def is_cancelled(self):
+        return self.cancel_token.is_cancelled
+
+    def drain_into(self, output_area):
+        """
+        在 GUI 线程中取出队列中的所有事件并应用到 OutputArea
+
+        连续的增量文本会合并后一次性追加，以减少重复渲染。
+        渲染过程中可能处理事件并再次触发本方法，此时直接返回，
+        剩余事件由外层循环继续处理，避免重入导致文本错乱。
+        """
+        if self._draining:
+            return
+        self._draining = True
+        try:
+            self._drain(output_area)
+        finally:
+            self._draining = False
+
+    def _drain(self, output_area):
+        while not self.sink.queue.empty():
+            pending_text = []
+            while True:
+                try:
+                    kind, payload = self.sink.queue.get_nowait()
+                except queue.Empty:
+                    break
+
+                if kind == "append":
+                    pending_text.append(payload)
+                    continue
+
+                if pending_text:
+                    output_area.append_text("".join(pending_text))
+                    pending_text = []
+
+                if kind == "clear":
+                    output_area.clear_output()
+                elif kind == "status":
+                    output_area.set_status(*payload)
+
+            if pending_text:
+                output_area.append_text("".join(pending_text))
@@ -0,0 +1,127 @@
+import functools
+import re
+import src.config.config
+
+# CJK 统一表意文字、假名、谚文及全角标点：常见分词器中大约每个字符一个 token
+_CJK_PATTERN = re.compile(
+    "[\u1100-\u11ff\u3000-\u30ff\u3100-\u31ff\u3400-\u4dbf\u4e00-\u9fff"
+    "\uac00-\ud7af\uf900-\ufaff\uff00-\uffef]"
+)
+
+
+@functools.lru_cache(maxsize=4096)
+def _estimate_cached(text):
+    cjk = len(_CJK_PATTERN.findall(text))
+    # 其余文本按约 4 个字符一个 token 计算
+    return cjk + (len(text) - cjk) // 4 + 1
+
+
+def estimate_tokens(text):
+    """
+    快速估算文本的 token 数，不依赖具体模型的分词器
+
+    CJK 字符按每字一个 token，其余字符按约 4 个一个 token 计算。
+    对话历史中的同一条消息会被反复估算，结果按文本缓存。
+    """
+    return _estimate_cached(text or "")
+
+
+def context_limit(model_name):
+    """模型的上下文窗口（输入与输出合计的 token 数），未在 MODEL_CONTEXT_LIMITS 中配置时使用 DEFAULT_CONTEXT_LIMIT"""
+    return src.config.config.MODEL_CONTEXT_LIMITS.get(model_name, src.config.config.DEFAULT_CONTEXT_LIMIT)
+
+
+def input_limit(model_name):
+    """上下文窗口扣除为回复预留的 OUTPUT_TOKEN_RESERVE 后，输入最多可用的 token 数"""
+    return max(0, context_limit(model_name) - src.config.config.OUTPUT_TOKEN_RESERVE)
+
+
+def request_budget(model_name):
+    """
+    单次请求输入的 token 预算
+
+    返回:
+    - int: MAX_TOKEN_PER_REQUEST 与模型可用输入的较小值；MAX_TOKEN_PER_REQUEST 为 None 时只受模型限制
+    """
+    limit = input_limit(model_name)
+    max_tokens = src.config.config.MAX_TOKEN_PER_REQUEST
+    return min(max_tokens, limit) if max_tokens else limit
+
+
+def history_reserve(history, budget):
+    """
+    连续对话中为对话历史预留的 token 数
+
+    转录文本按预算裁剪之前先扣除这部分，避免长转录文本占满预算后历史被全部删除。
+
+    参数:
+    - history: 对话历史 [(role, content), ...]
+    - budget: 转录文本与历史共用的 token 预算
+
+    返回:
+    - int: 历史实际所需与预算的 HISTORY_BUDGET_SHARE 比例中的较小值
+    """
+    needed = sum(estimate_tokens(content) for _, content in history or [])
+    return max(0, min(needed, int(budget * src.config.config.HISTORY_BUDGET_SHARE)))
+
+
+def trim_transcript(transcript, max_tokens):
+    """
+    把转录文本裁剪到 token 预算以内，保留最新的部分
+
+    按行从开头删除较早的内容；只剩一行仍然超出时从该行开头截断。
+
+    参数:
+    - transcript: 转录文本
+    - max_tokens: token 预算
+
+    返回:
+    - (裁剪后的文本, 省略的 token 数)
+    """
+    total = estimate_tokens(transcript)
+    if not transcript or total <= max_tokens:
+        return transcript, 0
+    if max_tokens <= 0:
+        return "", total
+
+    lines = transcript.split("\n")
+    kept = []
+    used = 0
+    for line in reversed(lines):
+        cost = estimate_tokens(line)
+        if used + cost > max_tokens:
+            if not kept:
+                # 单行超出预算：按比例保留行尾
+                keep_chars = max(0, len(line) * max_tokens // cost)
+                kept.append(line[len(line) - keep_chars:])
+            break
+        kept.append(line)
+        used += cost
+    text = "\n".join(reversed(kept))
+    return text, total - estimate_tokens(text)
+
+
+def trim_history(history, max_tokens):
+    """
+    从最早的消息开始删除对话历史，直到不超过 token 预算
+
+    开头的系统消息始终保留；删除后不以助手消息开头，保持一问一答的顺序。
+
+    参数:
+    - history: 对话历史 [(role, content), ...]
+    - max_tokens: token 预算
+
+    返回:
+    - (保留的历史, 删除的消息条数)
+    """
+    head = list(history[:1]) if history and history[0][0] == "system" else []
+    body = list(history[len(head):])
+    used = sum(estimate_tokens(content) for _, content in head + body)
+    dropped = 0
+    while body and used > max_tokens:
+        used -= estimate_tokens(body.pop(0)[1])
+        dropped += 1
+    while body and body[0][0] == "assistant":
+        body.pop(0)
+        dropped += 1
+    return head + body, dropped
@@ -0,0 +1,158 @@
+import argparse
+import datetime
+import os
+import sqlite3
+import threading
+import time
+import src.config.config
+from src.config.config import get_provider_info
+
+_lock = threading.Lock()
+# (数据库路径, 连接)，DATA_DIR 变化时重新打开
+_connection = None
+
+# 汇总维度对应的列
+GROUP_COLUMNS = {
+    "day": "day",
+    "provider": "provider",
+    "model": "model",
+    "mode": "auxiliary_mode",
+}
+
+
+def _db_path():
+    return os.path.join(src.config.config.DATA_DIR, "usage.sqlite3")
+
+
+def _connect():
+    global _connection
+    path = _db_path()
+    if _connection and _connection[0] == path:
+        return _connection[1]
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    # 在多个工作线程中使用，访问由 _lock 串行化
+    conn = sqlite3.connect(path, check_same_thread=False)
+    conn.execute(
+        "CREATE TABLE IF NOT EXISTS usage ("
+        " id INTEGER PRIMARY KEY AUTOINCREMENT,"
+        " created_at REAL NOT NULL,"
+        " day TEXT NOT NULL,"
+        " provider TEXT NOT NULL,"
+        " model TEXT NOT NULL,"
+        " auxiliary_mode TEXT NOT NULL,"
+        " prompt_tokens INTEGER NOT NULL,"
+        " completion_tokens INTEGER NOT NULL,"
+        " cached_tokens INTEGER NOT NULL,"
+        " cost REAL)"
+    )
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_usage_day ON usage (day)")
+    conn.commit()
+    _connection = (path, conn)
+    return conn
+
+
+def estimate_cost(model_name, prompt_tokens, completion_tokens, cached_tokens=0):
+    """
+    按 MODEL_PRICES 计算费用（美元）
+
+    返回:
+    - float: 费用，未配置价格的模型返回 None
+    """
+    prices = src.config.config.MODEL_PRICES.get(model_name)
+    if not prices:
+        return None
+    input_price = prices.get("input", 0.0)
+    cached_price = prices.get("cached_input", input_price)
+    output_price = prices.get("output", 0.0)
+    uncached = max(0, prompt_tokens - cached_tokens)
+    return (uncached * input_price + cached_tokens * cached_price + completion_tokens * output_price) / 1_000_000
+
+
+def record_usage(model_name, prompt_tokens, completion_tokens, cached_tokens=0):
+    """
+    记录一次请求的 token 用量
+
+    参数:
+    - model_name: 带提供商前缀的模型名称
+    - prompt_tokens: 输入 token 数（包含命中缓存的部分）
+    - completion_tokens: 输出 token 数
+    - cached_tokens: 命中提供商提示缓存的输入 token 数
+    """
+    provider_info = get_provider_info(model_name or "")
+    provider_name = provider_info.name if provider_info else "unknown"
+    prompt_tokens = int(prompt_tokens or 0)
+    completion_tokens = int(completion_tokens or 0)
+    cached_tokens = int(cached_tokens or 0)
+    now = time.time()
+    try:
+        with _lock:
+            conn = _connect()
+            conn.execute(
+                "INSERT INTO usage (created_at, day, provider, model, auxiliary_mode,"
+                " prompt_tokens, completion_tokens, cached_tokens, cost)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (
+                    now,
+                    datetime.date.fromtimestamp(now).isoformat(),
+                    provider_name,
+                    model_name,
+                    src.config.config.CURRENT_AUXILIARY_MODE,
+                    prompt_tokens,
+                    completion_tokens,
+                    cached_tokens,
+                    estimate_cost(model_name, prompt_tokens, completion_tokens, cached_tokens),
+                )
+            )
+            conn.commit()
+    except sqlite3.Error:
+        # 统计失败不影响正常请求
+        pass
+
+
+def summarize(group_by="day", days=None):
+    """
+    按维度汇总 token 用量与费用
+
+    参数:
+    - group_by: 汇总维度，可选 day / provider / model / mode
+    - days: 只统计最近若干天，None 表示全部
+
+    返回:
+    - list: [(key, requests, prompt_tokens, completion_tokens, cached_tokens, cost), ...]
+    """
+    column = GROUP_COLUMNS[group_by]
+    where, args = "", ()
+    if days:
+        since = (datetime.date.today() - datetime.timedelta(days=days - 1)).isoformat()
+        where, args = "WHERE day >= ?", (since,)
+    with _lock:
+        conn = _connect()
+        return conn.execute(
+            f"SELECT {column}, COUNT(*), SUM(prompt_tokens), SUM(completion_tokens),"
+            f" SUM(cached_tokens), SUM(cost) FROM usage {where}"
+            f" GROUP BY {column} ORDER BY {column}",
+            args
+        ).fetchall()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Summarize token usage and cost")
+    parser.add_argument("--by", default="day", choices=list(GROUP_COLUMNS.keys()))
+    parser.add_argument("--days", type=int, default=None, help="Only include the last N days")
+    args = parser.parse_args()
+
+    rows = summarize(args.by, args.days)
+    if not rows:
+        print("No usage recorded yet.")
+        return
+    print(f"{args.by:<45} {'requests':>9} {'prompt':>12} {'cached':>12} {'cached %':>9} {'completion':>12} {'cost ($)':>10}")
+    for key, requests, prompt_tokens, completion_tokens, cached_tokens, cost in rows:
+        cost_text = f"{cost:.4f}" if cost is not None else "-"
+        # 命中提供商提示缓存的输入比例，只统计报告了缓存用量的提供商
+        ratio_text = f"{cached_tokens / prompt_tokens:.1%}" if prompt_tokens else "-"
+        print(f"{key:<45} {requests:>9} {prompt_tokens:>12} {cached_tokens:>12} {ratio_text:>9} {completion_tokens:>12} {cost_text:>10}")
+
+
+if __name__ == "__main__":
+    # 用法: python -m src.api.usage --by provider --days 7
+    main()
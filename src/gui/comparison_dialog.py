@@ -0,0 +1,450 @@
+from PyQt6.QtWidgets import (QDialog, QWidget, QVBoxLayout, QHBoxLayout, QLabel, QPushButton,
+                           QListWidget, QListWidgetItem, QScrollArea, QTextBrowser, QSplitter)
+from PyQt6.QtCore import Qt, QTimer
+import os
+import json
+import time
+import datetime
+import src.config.config
+import src.api.api
+from src.api.stream_worker import StreamWorker
+from src.api.token_budget import estimate_tokens
+from src.gui.lang import STRINGS
+from src.gui.markdown_viewer import display_text, RenderScheduler
+
+
+class ComparisonPane(QWidget):
+    """对比模式中单个模型的输出窗格，提供与 OutputArea 相同的 append_text / clear_output / set_status"""
+
+    def __init__(self, parent, model_name):
+        super().__init__(parent)
+        self.parent = parent
+        self.model_name = model_name
+        self.raw_output_text = ""
+        self.started_at = None
+        self.first_token_at = None
+        self.finished_at = None
+        self.last_status = ""
+        self.render_scheduler = RenderScheduler(self, self.render_output)
+        self.init_ui()
+
+    def init_ui(self):
+        layout = QVBoxLayout(self)
+        layout.setContentsMargins(0, 0, 0, 0)
+        layout.setSpacing(4)
+
+        self.model_label = QLabel(self.model_name)
+        self.model_label.setObjectName("paneModelLabel")
+        layout.addWidget(self.model_label)
+
+        self.stats_label = QLabel()
+        self.stats_label.setObjectName("paneStatsLabel")
+        layout.addWidget(self.stats_label)
+
+        self.output_text = QTextBrowser()
+        self.output_text.setObjectName("paneOutput")
+        self.output_text.setOpenExternalLinks(True)
+        layout.addWidget(self.output_text)
+
+        self.status_label = QLabel()
+        self.status_label.setObjectName("paneStatusLabel")
+        self.status_label.setWordWrap(True)
+        layout.addWidget(self.status_label)
+
+        self.setMinimumWidth(src.config.config.COMPARISON_PANE_MIN_WIDTH)
+
+    def start(self):
+        """开始计时"""
+        self.started_at = time.perf_counter()
+        self.update_stats()
+
+    def finish(self):
+        """请求结束，停止计时并完成最后一次渲染"""
+        self.finished_at = time.perf_counter()
+        # 即使没有新文本也重新渲染，为流式输出期间未猜测语言的代码块补上高亮
+        self.render_scheduler.cancel()
+        self.render_output()
+
+    @property
+    def is_running(self):
+        return self.started_at is not None and self.finished_at is None
+
+    def append_text(self, text):
+        if not text:
+            return
+        if self.first_token_at is None:
+            self.first_token_at = time.perf_counter()
+        self.raw_output_text += text
+        self.render_scheduler.request()
+
+    def render_output(self):
+        display_text(
+            self.output_text, self.raw_output_text, True,
+            self.parent.main_window.current_theme == "dark", self.is_running
+        )
+        self.update_stats()
+
+    def clear_output(self):
+        self.render_scheduler.cancel()
+        self.output_text.clear()
+        self.raw_output_text = ""
+
+    def set_status(self, message, is_error=False):
+        self.last_status = message
+        self.status_label.setText(message)
+        theme = src.config.config.THEMES[self.parent.main_window.current_theme]
+        self.status_label.setStyleSheet(f"color: {theme['status_error' if is_error else 'status_success']};")
+
+    def stats(self):
+        """
+        当前的耗时与 token 统计，请求进行中时为实时值
+
+        返回:
+        - dict: ttft_ms、tokens_per_sec、completion_tokens、total_ms，尚未产生的指标为 None
+        """
+        if self.started_at is None:
+            return {"ttft_ms": None, "tokens_per_sec": None, "completion_tokens": 0, "total_ms": None}
+        now = self.finished_at or time.perf_counter()
+        tokens = estimate_tokens(self.raw_output_text) if self.raw_output_text else 0
+        tokens_per_sec = None
+        if self.first_token_at is not None and now > self.first_token_at:
+            tokens_per_sec = tokens / (now - self.first_token_at)
+        return {
+            "ttft_ms": (self.first_token_at - self.started_at) * 1000 if self.first_token_at is not None else None,
+            "tokens_per_sec": tokens_per_sec,
+            "completion_tokens": tokens,
+            "total_ms": (now - self.started_at) * 1000,
+        }
+
+    def update_stats(self):
+        stats = self.stats()
+        if stats["total_ms"] is None:
+            self.stats_label.setText("")
+            return
+        self.stats_label.setText(STRINGS[self.parent.main_window.current_lang]['comparison_stats'].format(
+            f"{stats['ttft_ms']:.0f}" if stats["ttft_ms"] is not None else "-",
+            f"{stats['tokens_per_sec']:.0f}" if stats["tokens_per_sec"] is not None else "-",
+            stats["completion_tokens"],
+            stats["total_ms"] / 1000
+        ))
+
+    def to_record(self):
+        """导出用的结果记录"""
+        return dict(self.stats(), model=self.model_name, output=self.raw_output_text, status=self.last_status)
+
+
+class ComparisonDialog(QDialog):
+    """
+    多模型对比：把同一提示同时发送给多个模型，各模型在独立窗格中流式输出
+
+    每个窗格实时显示首个 token 耗时、输出速率与 token 数，结果可导出为一条 JSON 记录。
+    """
+
+    def __init__(self, main_window):
+        super().__init__(main_window)
+        self.main_window = main_window
+        self.panes = []
+        # 正在执行的工作线程 {worker: pane}
+        self.workers = {}
+        # 已取消但线程尚未退出的工作线程
+        self.retired_workers = []
+        self.prompt = ""
+        self.temperature = None
+        self.image_paths = []
+        self.started_at = None
+        self.setWindowTitle(STRINGS[self.main_window.current_lang]['comparison_title'])
+        self.resize(1000, 640)
+        self.setup_ui()
+        self.apply_theme()
+
+        # 请求进行中时定时刷新各窗格的统计
+        self.stats_timer = QTimer(self)
+        self.stats_timer.setInterval(200)
+        self.stats_timer.timeout.connect(self.refresh_stats)
+
+    def setup_ui(self):
+        lang = self.main_window.current_lang
+        layout = QVBoxLayout(self)
+        spacing = int(src.config.config.UI_SPACING.replace("px", ""))
+        padding = int(src.config.config.UI_PADDING_NORMAL.replace("px", ""))
+        layout.setSpacing(spacing)
+        layout.setContentsMargins(padding, padding, padding, padding)
+
+        splitter = QSplitter(Qt.Orientation.Horizontal)
+
+        # 左侧：模型选择与操作按钮
+        side = QWidget()
+        side_layout = QVBoxLayout(side)
+        side_layout.setContentsMargins(0, 0, 0, 0)
+        self.models_label = QLabel(STRINGS[lang]['comparison_select_models'].format(src.config.config.COMPARISON_MAX_MODELS))
+        self.models_label.setWordWrap(True)
+        side_layout.addWidget(self.models_label)
+
+        self.model_list = QListWidget()
+        self.model_list.setObjectName("comparisonModelList")
+        self.populate_models(src.config.config.COMPARISON_MODELS)
+        side_layout.addWidget(self.model_list)
+
+        self.run_button = QPushButton(STRINGS[lang]['comparison_run'])
+        self.run_button.clicked.connect(self.run_comparison)
+        side_layout.addWidget(self.run_button)
+
+        self.stop_button = QPushButton(STRINGS[lang]['stop_generation'])
+        self.stop_button.setEnabled(False)
+        self.stop_button.clicked.connect(self.stop_comparison)
+        side_layout.addWidget(self.stop_button)
+
+        self.export_button = QPushButton(STRINGS[lang]['comparison_export'])
+        self.export_button.setEnabled(False)
+        self.export_button.clicked.connect(self.export_comparison)
+        side_layout.addWidget(self.export_button)
+
+        splitter.addWidget(side)
+
+        # 右侧：各模型的输出窗格，横向排列，超出宽度时滚动
+        self.panes_widget = QWidget()
+        self.panes_layout = QHBoxLayout(self.panes_widget)
+        self.panes_layout.setContentsMargins(0, 0, 0, 0)
+        self.panes_layout.setSpacing(spacing)
+        scroll_area = QScrollArea()
+        scroll_area.setWidgetResizable(True)
+        scroll_area.setWidget(self.panes_widget)
+        splitter.addWidget(scroll_area)
+        splitter.setSizes([240, 760])
+        layout.addWidget(splitter)
+
+        self.status_label = QLabel()
+        self.status_label.setWordWrap(True)
+        layout.addWidget(self.status_label)
+
+    def populate_models(self, checked_models=None):
+        """
+        按当前的 AVAILABLE_MODELS 重建模型列表（刷新模型列表后本地模型可能变化）
+
+        参数:
+        - checked_models: 需要勾选的模型，默认保留当前的勾选
+        """
+        if checked_models is None:
+            checked_models = self.selected_models()
+        self.model_list.clear()
+        for model_name in src.config.config.AVAILABLE_MODELS:
+            item = QListWidgetItem(model_name)
+            item.setFlags(item.flags() | Qt.ItemFlag.ItemIsUserCheckable)
+            checked = model_name in checked_models
+            item.setCheckState(Qt.CheckState.Checked if checked else Qt.CheckState.Unchecked)
+            self.model_list.addItem(item)
+
+    def selected_models(self):
+        return [
+            self.model_list.item(i).text()
+            for i in range(self.model_list.count())
+            if self.model_list.item(i).checkState() == Qt.CheckState.Checked
+        ]
+
+    def set_status(self, message, is_error=False):
+        self.status_label.setText(message)
+        theme = src.config.config.THEMES[self.main_window.current_theme]
+        self.status_label.setStyleSheet(f"color: {theme['status_error' if is_error else 'status_success']};")
+
+    def run_comparison(self):
+        """组装提示并同时向所选模型发送请求"""
+        lang = self.main_window.current_lang
+        models = self.selected_models()
+        if len(models) < 2:
+            self.set_status(STRINGS[lang]['comparison_too_few'], True)
+            return
+        if len(models) > src.config.config.COMPARISON_MAX_MODELS:
+            self.set_status(STRINGS[lang]['comparison_select_models'].format(src.config.config.COMPARISON_MAX_MODELS), True)
+            return
+
+        content_area = self.main_window.content_area
+        try:
+            prompt = content_area.assemble_comparison_prompt(models)
+        except Exception as e:
+            self.set_status(f"{STRINGS[lang]['read_file_error']}{e}", True)
+            return
+        if not prompt:
+            self.set_status(STRINGS[lang]['no_files_available'], True)
+            return
+
+        self.stop_comparison()
+        for pane in self.panes:
+            self.panes_layout.removeWidget(pane)
+            pane.deleteLater()
+        self.panes = []
+
+        self.prompt = prompt
+        self.temperature = content_area.settings_tab.get_temperature()
+        self.image_paths = list(content_area.input_tab.get_image_paths())
+        self.started_at = datetime.datetime.now()
+        for model_name in models:
+            pane = ComparisonPane(self, model_name)
+            self.apply_pane_theme(pane)
+            self.panes_layout.addWidget(pane)
+            self.panes.append(pane)
+            worker = StreamWorker(
+                src.api.api.fetch_model_response,
+                (prompt, model_name, self.temperature, self.image_paths),
+                {"comparison": True},
+                current_lang=lang,
+                parent=self
+            )
+            worker.data_ready.connect(lambda w=worker: self.on_stream_data(w), Qt.ConnectionType.QueuedConnection)
+            worker.finished.connect(lambda w=worker: self.on_stream_finished(w), Qt.ConnectionType.QueuedConnection)
+            self.workers[worker] = pane
+        # 所有窗格创建完成后再同时启动，各模型的计时起点一致
+        for worker, pane in self.workers.items():
+            pane.start()
+            worker.start()
+
+        self.stats_timer.start()
+        self.stop_button.setEnabled(True)
+        self.export_button.setEnabled(False)
+        self.set_status(STRINGS[lang]['comparison_running'].format(len(models)))
+
+    def on_stream_data(self, worker):
+        pane = self.workers.get(worker)
+        if pane is not None:
+            worker.drain_into(pane)
+
+    def on_stream_finished(self, worker):
+        pane = self.workers.pop(worker, None)
+        if pane is not None:
+            worker.drain_into(pane)
+            pane.finish()
+        elif worker in self.retired_workers:
+            self.retired_workers.remove(worker)
+        worker.deleteLater()
+        if not self.workers:
+            self.on_all_finished()
+
+    def on_all_finished(self):
+        self.stats_timer.stop()
+        self.stop_button.setEnabled(False)
+        self.export_button.setEnabled(bool(self.panes))
+        if self.panes:
+            self.set_status(STRINGS[self.main_window.current_lang]['comparison_finished'])
+
+    def refresh_stats(self):
+        for pane in self.panes:
+            if pane.is_running:
+                pane.update_stats()
+
+    def stop_comparison(self):
+        """取消所有仍在进行的请求"""
+        if not self.workers:
+            return
+        for worker, pane in self.workers.items():
+            worker.cancel()
+            pane.finish()
+            self.retired_workers.append(worker)
+        self.workers = {}
+        self.on_all_finished()
+
+    def export_comparison(self):
+        """把本次对比的输入与各模型的结果导出为一条 JSON 记录"""
+        lang = self.main_window.current_lang
+        history_dir = os.path.join(os.getcwd(), "history")
+        os.makedirs(history_dir, exist_ok=True)
+        timestamp = self.started_at.strftime("%Y%m%d_%H%M%S")
+        filepath = os.path.join(history_dir, f"comparison_{timestamp}.json")
+        record = {
+            "started_at": self.started_at.isoformat(timespec="seconds"),
+            "auxiliary_mode": src.config.config.CURRENT_AUXILIARY_MODE,
+            "temperature": self.temperature,
+            "prompt": self.prompt,
+            "images": [os.path.basename(path) for path in self.image_paths],
+            "results": [pane.to_record() for pane in self.panes],
+        }
+        try:
+            with open(filepath, 'w', encoding='utf-8') as f:
+                json.dump(record, f, ensure_ascii=False, indent=2)
+            self.set_status(f"{STRINGS[lang]['comparison_exported']}\n{STRINGS[lang]['file_path']}{filepath}")
+        except Exception as e:
+            self.set_status(f"{STRINGS[lang]['export_error']}{e}", True)
+
+    def shutdown(self, timeout_ms=2000):
+        """取消所有请求并等待工作线程结束"""
+        self.stop_comparison()
+        for worker in list(self.retired_workers):
+            worker.wait(timeout_ms)
+
+    def closeEvent(self, event):
+        self.stop_comparison()
+        super().closeEvent(event)
+
+    def update_texts(self):
+        """更新界面上的文本为当前语言"""
+        lang = self.main_window.current_lang
+        self.setWindowTitle(STRINGS[lang]['comparison_title'])
+        self.models_label.setText(STRINGS[lang]['comparison_select_models'].format(src.config.config.COMPARISON_MAX_MODELS))
+        self.run_button.setText(STRINGS[lang]['comparison_run'])
+        self.stop_button.setText(STRINGS[lang]['stop_generation'])
+        self.export_button.setText(STRINGS[lang]['comparison_export'])
+        for pane in self.panes:
+            pane.update_stats()
+
+    def apply_pane_theme(self, pane):
+        theme = src.config.config.THEMES[self.main_window.current_theme]
+        pane.setStyleSheet(f"""
+            #paneModelLabel {{
+                color: {theme['text']};
+                font-weight: bold;
+            }}
+            #paneStatsLabel {{
+                color: {theme['text_secondary']};
+            }}
+            #paneOutput {{
+                font-size: {src.config.config.UI_FONT_SIZE_NORMAL};
+                padding: {src.config.config.UI_PADDING_SMALL};
+                border: 1px solid {theme['input_border']};
+                border-radius: {src.config.config.UI_BORDER_RADIUS};
+                background-color: {theme['input_bg']};
+                color: {theme['text']};
+            }}
+        """)
+
+    def apply_theme(self):
+        theme = src.config.config.THEMES[self.main_window.current_theme]
+        font_family = src.config.config.UI_FONT_FAMILY
+        font_size = src.config.config.UI_FONT_SIZE_NORMAL
+        border_radius = src.config.config.UI_BORDER_RADIUS
+
+        self.setStyleSheet(f"""
+            QDialog {{
+                background-color: {theme['dialog_bg']};
+                border-radius: {border_radius};
+                font-family: {font_family};
+            }}
+            QLabel {{
+                color: {theme['text']};
+                font-size: {font_size};
+            }}
+            QListWidget {{
+                color: {theme['text']};
+                background-color: {theme['input_bg']};
+                border: 1px solid {theme['input_border']};
+                border-radius: {border_radius};
+                font-size: {font_size};
+            }}
+            QScrollArea {{
+                border: none;
+                background-color: transparent;
+            }}
+            QPushButton {{
+                background-color: {theme['button_bg']};
+                color: {theme['button_text']};
+                border-radius: {border_radius};
+                padding: 5px;
+                font-size: {font_size};
+            }}
+            QPushButton:hover {{
+                background-color: {theme['button_hover']};
+            }}
+            QPushButton:disabled {{
+                background-color: {theme['input_border']};
+                color: {theme['text_secondary']};
+            }}
+        """)
+        for pane in self.panes:
+            self.apply_pane_theme(pane)
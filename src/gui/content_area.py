@@ -6,7 +6,12 @@ import src.config.config
 from src.gui.lang import STRINGS
 import src.gui.utils
 import src.api.api
+import src.api.prompt_layout
+import src.api.token_budget
+import src.api.map_reduce
 import src.gui.prefix
+from src.api.stream_worker import StreamWorker
+from src.api.prewarm import cancel_prewarm
 from src.gui.settings_tab import SettingsTab
 from src.gui.input_tab import InputTab
 from src.gui.output_area import OutputArea
@@ -19,6 +24,12 @@ class ContentArea(QWidget):
         self.parent = parent
         # 初始化对话历史记录
         self.dialogue_history = []
+        # 连续对话中依次发送过的转录文本，与 dialogue_history 一同重置
+        self.dialogue_transcript = []
+        # 当前正在执行的流式请求工作线程
+        self.stream_worker = None
+        # 已取消但线程尚未退出的工作线程，保留引用直到线程结束
+        self.retired_workers = []
         self.init_ui()
 
     def init_ui(self):
@@ -67,6 +78,7 @@ class ContentArea(QWidget):
         # 连接信号
         self.output_area.copy_button.clicked.connect(self.copy_and_get_answer)
         self.output_area.export_requested.connect(self.export_conversation)
+        self.output_area.stop_requested.connect(self.stop_stream)
         
     def apply_theme(self):
         """应用主题样式"""
@@ -198,6 +210,33 @@ class ContentArea(QWidget):
                         self.output_area.set_status(f"{STRINGS[self.parent.current_lang]['read_file_error']}{e}", True)
                         return
             
+            # 转录文本超出 token 预算时省略较早的部分，前缀、后缀与 OCR 文本保持完整
+            # 单次对话的总结类模式改为分段汇总，完整处理长转录文本（不含图片）
+            trim_note = ""
+            use_map_reduce = False
+            if transcript_content:
+                reserved_tokens = sum(
+                    src.api.token_budget.estimate_tokens(text)
+                    for text in (src.api.prompt_layout.stable_system_prompt(), prefix_text, suffix_text, ocr_text)
+                )
+                use_map_reduce = (
+                    not src.config.config.ENABLE_CONTINUOUS_DIALOGUE
+                    and not self.input_tab.get_image_paths()
+                    and src.api.map_reduce.should_map_reduce(
+                        self.settings_tab.get_selected_model(), transcript_content, reserved_tokens
+                    )
+                )
+            if transcript_content and not use_map_reduce:
+                transcript_budget = src.api.token_budget.request_budget(self.settings_tab.get_selected_model()) - reserved_tokens
+                if src.config.config.ENABLE_CONTINUOUS_DIALOGUE:
+                    # 连续对话：先为对话历史预留一部分预算，转录文本使用其余部分
+                    transcript_budget -= src.api.token_budget.history_reserve(self.dialogue_history, transcript_budget)
+                transcript_content, dropped_tokens = src.api.token_budget.trim_transcript(
+                    transcript_content, transcript_budget
+                )
+                if dropped_tokens:
+                    trim_note = "\n" + STRINGS[self.parent.current_lang]['transcript_trimmed'].format(dropped_tokens)
+            
             # 确定是否有任何输入内容可用于对话
             has_input_content = bool(transcript_content) or bool(ocr_text) or bool(prefix_text) or bool(suffix_text)
             
@@ -234,6 +273,9 @@ class ContentArea(QWidget):
                 combined_content = "\n".join(prompt_parts)
                 
                 # 如果没有任何新增内容但有历史记录，允许用户继续对话
+                if transcript_content:
+                    self.dialogue_transcript.append(transcript_content)
+
                 if not combined_content and self.dialogue_history:
                     # 使用一个特殊提示告知模型继续前面的对话
                     combined_content = "Please continue analyzing based on our previous conversation."
@@ -242,6 +284,7 @@ class ContentArea(QWidget):
                 status_message = context_msg
                 if latest_file:
                     status_message += f"\n{STRINGS[self.parent.current_lang]['copied_success']}\n{STRINGS[self.parent.current_lang]['file_path']}{latest_file}"
+                status_message += trim_note
                 
                 # 只在有内容时复制到剪贴板
                 if combined_content:
@@ -263,43 +306,153 @@ class ContentArea(QWidget):
                     return
                     
                 src.gui.utils.copy_to_clipboard(combined_content)
+
+                # 预定义前缀随系统提示放在请求最前面，用户消息中不再重复
+                if src.api.prompt_layout.layout_enabled():
+                    combined_content = src.api.prompt_layout.assemble_user_prompt(
+                        prefix_text, transcript_content, suffix_text, ocr_text
+                    ) or combined_content
                 
                 if latest_file:
-                    self.output_area.set_status(f"{STRINGS[self.parent.current_lang]['copied_success']}\n{STRINGS[self.parent.current_lang]['file_path']}{latest_file}")
+                    self.output_area.set_status(f"{STRINGS[self.parent.current_lang]['copied_success']}\n{STRINGS[self.parent.current_lang]['file_path']}{latest_file}{trim_note}")
                 else:
-                    self.output_area.set_status(f"{STRINGS[self.parent.current_lang]['copied_success']}")
+                    self.output_area.set_status(f"{STRINGS[self.parent.current_lang]['copied_success']}{trim_note}")
 
-            self.output_area.copy_button.setEnabled(False)
+            # 如果上一个回答仍在生成，取消它并由新请求替代
+            if self.stream_worker is not None:
+                self.cancel_stream()
+                self.output_area.set_status(STRINGS[self.parent.current_lang]['generation_superseded'])
             
             # 清空旧内容
             self.output_area.clear_output()
             
-            # 使用API获取回答
+            # 使用API获取回答（在工作线程中执行，避免阻塞界面）
             if src.config.config.ENABLE_CONTINUOUS_DIALOGUE:
                 # 连续对话模式：传递对话历史和新内容
-                src.api.api.fetch_model_response_with_history(
-                    combined_content, 
-                    self.output_area,
-                    self.settings_tab.get_selected_model(), 
+                self.start_stream(
+                    src.api.api.fetch_model_response_with_history,
+                    combined_content,
+                    self.settings_tab.get_selected_model(),
                     self.settings_tab.get_temperature(),
                     self.dialogue_history,
-                    self.input_tab.get_image_paths()
+                    list(self.input_tab.get_image_paths()),
+                    transcript_parts=list(self.dialogue_transcript)
+                )
+            elif use_map_reduce:
+                # 分段汇总：转录文本单独传递，其余输入随汇总请求发送
+                self.start_stream(
+                    src.api.api.fetch_map_reduce_response,
+                    transcript_content,
+                    self.settings_tab.get_selected_model(),
+                    self.settings_tab.get_temperature(),
+                    "\n".join(text for text in (prefix_text, suffix_text, ocr_text) if text)
                 )
             else:
                 # 传统模式：直接传递完整内容
-                src.api.api.fetch_model_response(
-                    combined_content, 
-                    self.output_area,
-                    self.settings_tab.get_selected_model(), 
+                self.start_stream(
+                    src.api.api.fetch_model_response,
+                    combined_content,
+                    self.settings_tab.get_selected_model(),
                     self.settings_tab.get_temperature(),
-                    self.input_tab.get_image_paths()
+                    list(self.input_tab.get_image_paths())
                 )
-            
-            self.output_area.copy_button.setEnabled(True)
 
         except Exception as e:
             self.output_area.set_status(f"{STRINGS[self.parent.current_lang]['read_file_error']}{e}", True)
-            self.output_area.copy_button.setEnabled(True)
+
+    def assemble_comparison_prompt(self, models):
+        """
+        组装多模型对比使用的提示，内容与单次对话相同（读取完整的转录文本）
+
+        转录文本按所选模型中最小的 token 预算裁剪，保证各模型收到相同的输入。
+
+        参数:
+        - models: 参与对比的模型列表
+
+        返回:
+        - str: 提示文本，没有任何输入时返回空字符串
+        """
+        latest_file = src.gui.utils.get_latest_file(self.settings_tab.get_folder_path())
+        original_prefix = src.gui.prefix.get_original_prefix() if src.config.config.USE_PREDEFINED_PREFIX else ""
+        prefix_text = self.input_tab.get_prefix_text()
+        suffix_text = self.input_tab.get_suffix_text()
+        ocr_text = self.input_tab.get_ocr_text()
+
+        transcript_content = ""
+        if src.config.config.USE_TRANSCRIPT_TEXT and latest_file:
+            with open(latest_file, 'r', encoding='utf-8') as file:
+                transcript_content = file.read()
+        if transcript_content:
+            reserved_tokens = sum(
+                src.api.token_budget.estimate_tokens(text)
+                for text in (src.api.prompt_layout.stable_system_prompt(), prefix_text, suffix_text, ocr_text)
+            )
+            budget = min(src.api.token_budget.request_budget(model) for model in models) - reserved_tokens
+            transcript_content, _ = src.api.token_budget.trim_transcript(transcript_content, budget)
+
+        combined_content = f"{original_prefix}\n{prefix_text}\n{transcript_content}\n{suffix_text}\n{ocr_text}".strip()
+        if combined_content and src.api.prompt_layout.layout_enabled():
+            combined_content = src.api.prompt_layout.assemble_user_prompt(
+                prefix_text, transcript_content, suffix_text, ocr_text
+            ) or combined_content
+        return combined_content
+
+    def start_stream(self, target, prompt, *args, **kwargs):
+        """
+        在工作线程中启动流式请求
+
+        参数:
+        - target: API 函数，如 fetch_model_response
+        - prompt: 提示文本
+        - args: 除 content_area 外的其余位置参数
+        - kwargs: 其余关键字参数
+        """
+        # 预热请求不再需要，避免与真正的请求争用连接与并发
+        cancel_prewarm()
+        worker = StreamWorker(target, (prompt,) + args, kwargs, current_lang=self.parent.current_lang, parent=self)
+        worker.data_ready.connect(lambda: self.on_stream_data(worker), Qt.ConnectionType.QueuedConnection)
+        worker.finished.connect(lambda: self.on_stream_finished(worker), Qt.ConnectionType.QueuedConnection)
+        self.stream_worker = worker
+        self.output_area.set_streaming(True)
+        worker.start()
+
+    def on_stream_data(self, worker):
+        """把工作线程的输出应用到输出区域，已取消的请求不再显示"""
+        if worker is self.stream_worker:
+            worker.drain_into(self.output_area)
+
+    def cancel_stream(self):
+        """取消当前的流式请求，立即关闭其 HTTP 响应"""
+        worker = self.stream_worker
+        if worker is None:
+            return
+        worker.cancel()
+        self.retired_workers.append(worker)
+        self.stream_worker = None
+        self.output_area.set_streaming(False)
+
+    def stop_stream(self):
+        """响应停止按钮"""
+        if self.stream_worker is not None:
+            self.cancel_stream()
+            self.output_area.set_status(STRINGS[self.parent.current_lang]['generation_stopped'])
+
+    def shutdown(self, timeout_ms=2000):
+        """退出前取消所有请求并等待工作线程结束"""
+        self.cancel_stream()
+        for worker in list(self.retired_workers):
+            worker.wait(timeout_ms)
+
+    def on_stream_finished(self, worker):
+        """流式请求结束后的处理"""
+        if worker is self.stream_worker:
+            # 取出队列中剩余的内容
+            worker.drain_into(self.output_area)
+            self.stream_worker = None
+            self.output_area.set_streaming(False)
+        elif worker in self.retired_workers:
+            self.retired_workers.remove(worker)
+        worker.deleteLater()
 
     def export_conversation(self):
         """导出当前对话"""
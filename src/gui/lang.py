@@ -98,6 +98,35 @@ STRINGS = {
         'auxiliary_mode_sentiment_analyzer': "会议-情感分析",
         'auxiliary_mode_question_generator': "会议-问题生成",
         'auxiliary_mode_changed': "附加模式已更改为: {0}",
+        
+        # 流式请求控制相关文本
+        'stop_generation': "停止生成",
+        'generation_stopped': "已停止生成",
+        'generation_superseded': "已取消上一个回答，正在获取新的回答",
+        'hedge_winner': "对冲请求由 {0} 胜出\n胜率: {1}",
+        'draft_streaming': "正在显示 {0} 的草稿，等待 {1} 的回答…",
+        'draft_refined': "草稿 {0} 首个 token {1} ms，回答 {2} 首个 token {3} ms，用时 {4:.1f} s",
+        'failover_switched': "{0} 不可用，已自动切换到 {1}",
+        'rate_limit_waiting': "{0} 达到速率限制，等待 {1:.1f} 秒",
+        'request_retrying': "{0} 请求失败，正在重试 ({1}/{2})",
+        'response_cache_hit': "已使用本地缓存的回复（未调用模型）",
+        'latency_summary': "首 token {0} ms（p50 {1} / p95 {2}） · {3} token/s · 总耗时 {4:.1f} s · 连接 {5} ms",
+        'cached_tokens_summary': "缓存命中 {0}/{1} 输入 token（{2:.0%}）",
+        'transcript_trimmed': "转录文本超出 token 预算，已省略较早的约 {0} 个 token",
+        'history_trimmed': "对话历史超出 token 预算，本次请求省略了较早的 {0} 条消息",
+        'map_reduce_progress': "分段处理中：{0}/{1}（其中 {2} 段使用缓存结果）",
+        'map_reduce_reducing': "正在汇总 {0} 段结果……",
+        'stream_resuming': "连接中断，正在续传回复（第 {0}/{1} 次）",
+        'repetition_aborted': "检测到回复重复，已停止生成并删除重复部分",
+        'comparison_title': "多模型对比",
+        'comparison_select_models': "选择要对比的模型（2 至 {0} 个）：",
+        'comparison_run': "发送到所选模型",
+        'comparison_export': "导出对比结果",
+        'comparison_too_few': "请至少选择两个模型",
+        'comparison_running': "正在对比 {0} 个模型…",
+        'comparison_finished': "对比完成",
+        'comparison_exported': "对比结果已导出到 history 文件夹！",
+        'comparison_stats': "首个 token {0} ms · {1} tok/s · {2} tokens · {3:.1f} s",
     },
     'en': {
         'window_title': "Transcript companion",
@@ -198,5 +227,34 @@ Sidebar Features:
         'auxiliary_mode_sentiment_analyzer': "Meeting - Sentiment Analysis",
         'auxiliary_mode_question_generator': "Meeting - Question Generation",
         'auxiliary_mode_changed': "Auxiliary mode changed to: {0}",
+        
+        # 流式请求控制相关文本
+        'stop_generation': "Stop",
+        'generation_stopped': "Generation stopped",
+        'generation_superseded': "Previous answer cancelled, fetching a new one",
+        'hedge_winner': "Hedged request won by {0}\nWin rates: {1}",
+        'draft_streaming': "Showing a draft from {0} while waiting for {1}…",
+        'draft_refined': "Draft {0} first token {1} ms, answer {2} first token {3} ms, total {4:.1f} s",
+        'failover_switched': "{0} is unavailable, switched to {1}",
+        'rate_limit_waiting': "{0} rate limit reached, waiting {1:.1f}s",
+        'request_retrying': "{0} request failed, retrying ({1}/{2})",
+        'response_cache_hit': "Served from the local response cache (no model call)",
+        'latency_summary': "TTFT {0} ms (p50 {1} / p95 {2}) · {3} tok/s · total {4:.1f} s · connect {5} ms",
+        'cached_tokens_summary': "{0}/{1} input tokens from cache ({2:.0%})",
+        'transcript_trimmed': "Transcript exceeds the token budget; omitted about {0} earlier tokens",
+        'history_trimmed': "Dialogue history exceeds the token budget; omitted {0} earlier messages from this request",
+        'map_reduce_progress': "Processing transcript chunks: {0}/{1} ({2} from cache)",
+        'map_reduce_reducing': "Combining {0} chunk results...",
+        'stream_resuming': "Connection lost, resuming the answer (attempt {0}/{1})",
+        'repetition_aborted': "Repetitive output detected; generation stopped and the repeated text removed",
+        'comparison_title': "Model Comparison",
+        'comparison_select_models': "Select the models to compare (2 to {0}):",
+        'comparison_run': "Send to Selected Models",
+        'comparison_export': "Export Comparison",
+        'comparison_too_few': "Select at least two models",
+        'comparison_running': "Comparing {0} models…",
+        'comparison_finished': "Comparison finished",
+        'comparison_exported': "Comparison exported to the history folder!",
+        'comparison_stats': "TTFT {0} ms · {1} tok/s · {2} tokens · {3:.1f} s",
     }
 }
\ No newline at end of file
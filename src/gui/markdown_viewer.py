@@ -1,11 +1,295 @@
 import markdown
-from markdown.extensions.codehilite import CodeHiliteExtension
+from markdown.extensions.codehilite import CodeHilite, CodeHiliteExtension
 from markdown.extensions.fenced_code import FencedCodeExtension
-from PyQt6.QtWidgets import QApplication
+from markdown.extensions import Extension
+from markdown.postprocessors import Postprocessor
+from PyQt6.QtCore import QTimer
 import src.config.config
+from html import escape, unescape
+import functools
 import re
+import time
+import weakref
 
-def render_markdown(text_browser, text, is_dark_theme=False):
+# 围栏代码块的起始行，与 fenced_code 扩展的正则一致
+_FENCE_OPEN_RE = re.compile(r'^(?P<fence>~{3,}|`{3,})[ ]*((\{[^\n]*\})|(\.?[\w#.+-]*[ ]*)?(hl_lines=("|\').*?\6[ ]*)?)$')
+# 链接引用定义会影响文档中任意位置的链接，出现时不使用分块缓存
+_REFERENCE_RE = re.compile(r'^[ ]{0,3}\[[^\]]+\]:[ ]*\S', re.MULTILINE)
+# 下一块以这些内容开头时可能与上一块属于同一个列表、引用或缩进代码块，不能作为分块边界
+_CONTINUATION_RE = re.compile(r'^([ \t]|[*+-]([ \t]|$)|\d+[.)]([ \t]|$)|>|<)')
+# 转换后尚未高亮的代码块：围栏代码块带有 language- 类，缩进代码块没有
+_CODE_BLOCK_RE = re.compile(r'<pre><code(?: class="language-([^"]*)")?>(.*?)</code></pre>', re.DOTALL)
+
+# 与 codehilite 扩展处理围栏代码块时使用的配置一致
+_CODEHILITE_CONFIG = CodeHiliteExtension(
+    noclasses=False,  # 使用CSS类而非内联样式
+    linenums=False,   # 默认不显示行号
+    guess_lang=True   # 自动检测语言
+).getConfigs()
+
+
+# markdown 会去除输出末尾的空白（包括最后一个块元素之后的换行）；
+# 分块转换时需要保留，拼接后才与整篇转换一致
+_END_MARKER = "\x00"
+
+
+class _EndMarkerPostprocessor(Postprocessor):
+    def run(self, text):
+        return text + _END_MARKER
+
+
+@functools.lru_cache(maxsize=256)
+def _highlight(code, lang):
+    """
+    用 Pygments 高亮一个代码块，未标注语言时自动猜测
+
+    结果按 (语言, 代码) 缓存，代码块在每次重新渲染中只需高亮一次。
+    """
+    config = dict(_CODEHILITE_CONFIG)
+    style = config.pop('pygments_style')
+    return CodeHilite(code, lang=lang, style=style, **config).hilite(shebang=False)
+
+
+class _HighlightPostprocessor(Postprocessor):
+    """
+    高亮转换结果中的代码块
+
+    guess_lang 为 False（流式输出期间）时不猜测未标注语言的代码块，保持纯文本，
+    并设置 deferred，由调用方在输出结束后重新转换。
+    """
+
+    def __init__(self, md):
+        super().__init__(md)
+        self.guess_lang = True
+        self.deferred = False
+
+    def run(self, text):
+        return _CODE_BLOCK_RE.sub(self._highlight_block, text)
+
+    def _highlight_block(self, match):
+        lang = unescape(match.group(1)) if match.group(1) else None
+        if lang is None and not self.guess_lang:
+            self.deferred = True
+            return match.group(0)
+        return _highlight(unescape(match.group(2)), lang)
+
+
+class _HighlightExtension(Extension):
+    def extendMarkdown(self, md):
+        # 在原始 HTML（围栏代码块）还原之后执行
+        md.postprocessors.register(_HighlightPostprocessor(md), 'highlight', 10)
+
+
+class _EndMarkerExtension(Extension):
+    def extendMarkdown(self, md):
+        # 优先级最低，在其余后处理之后执行
+        md.postprocessors.register(_EndMarkerPostprocessor(md), 'end_marker', 0)
+
+
+# 长期复用的 Markdown 转换器，只在 GUI 线程中使用
+_converter = None
+
+
+def _build_converter():
+    """
+    创建 Markdown 转换器，配置表格、围栏代码块、换行与代码高亮扩展
+
+    围栏代码块不交给 codehilite 扩展处理，而是由 _HighlightPostprocessor 高亮并缓存。
+    """
+    return markdown.Markdown(
+        extensions=[
+            'tables', 
+            FencedCodeExtension(),
+            'nl2br',  # 将换行符转换为<br>标签
+            _HighlightExtension(),
+            _EndMarkerExtension()
+        ]
+    )
+
+
+def _get_converter():
+    """
+    返回共享的 Markdown 转换器，首次调用时创建
+
+    创建 Markdown 实例需要构建全部扩展与处理器，逐次调用 markdown.markdown()
+    的开销在流式渲染中每帧都会出现，因此只创建一次，每篇文档转换前 reset()。
+    """
+    global _converter
+    if _converter is None:
+        _converter = _build_converter()
+    return _converter
+
+
+def _markdown_to_html(text, streaming=False):
+    """
+    把一段 Markdown 转换为 HTML 片段（含代码语言标签）
+
+    返回的 HTML 保留末尾空白，多段拼接后再 strip() 即与整段转换的结果相同。
+
+    参数:
+    - text: Markdown 文本
+    - streaming: 是否正在流式输出，此时不猜测未标注语言的代码块的语言
+
+    返回:
+    - (HTML 片段, 是否有代码块因 streaming 而未高亮)
+    """
+    converter = _get_converter()
+    highlighter = converter.postprocessors['highlight']
+    highlighter.guess_lang = not streaming
+    highlighter.deferred = False
+    # 将 Markdown 转换为 HTML，reset() 清除上一篇文档留下的状态
+    html = converter.reset().convert(text)
+
+    # 处理代码语言标签；补回最后一个块元素之后的换行
+    html = process_language_tags(html[:-len(_END_MARKER)])
+    return (html + "\n" if html else html), highlighter.deferred
+
+
+def _split_open_fence(text):
+    """
+    查找末尾尚未闭合的围栏代码块
+
+    返回:
+    - (代码块之前的文本, 已接收的代码)，没有未闭合的围栏代码块时返回 None
+    """
+    fence = None
+    position = 0
+    while True:
+        end = text.find("\n", position)
+        line = text[position:] if end < 0 else text[position:end]
+        if fence is None:
+            # 起始行需完整接收后才能确定
+            match = _FENCE_OPEN_RE.match(line) if end >= 0 else None
+            if match:
+                fence = match.group("fence")
+                fence_start = position
+                code_start = end + 1
+        elif line.rstrip(" ") == fence:
+            fence = None
+        if end < 0:
+            break
+        position = end + 1
+    if fence is None:
+        return None
+    return text[:fence_start], text[code_start:]
+
+
+def _convert_tail(text, streaming=False):
+    """
+    转换末尾尚未结束的文本：流式输出期间未闭合的围栏代码块显示为纯文本 <pre>，闭合后再高亮；
+    输出结束后按整篇转换处理，结果与整篇转换相同
+
+    返回:
+    - (HTML 片段, 是否有代码块因 streaming 而未高亮)
+    """
+    open_block = _split_open_fence(text) if streaming else None
+    if open_block is None:
+        return _markdown_to_html(text, streaming)
+    before, code = open_block
+    html, deferred = _markdown_to_html(before, streaming)
+    return html + f"<pre><code>{escape(code)}</code></pre>\n", deferred
+
+
+def _split_closed_blocks(text):
+    """
+    在文本中查找已经结束的块
+
+    空行之后、围栏代码块之外，且下一行不是列表项、引用、缩进或 HTML 时，
+    之前的内容不会再受后续文本影响，可以单独转换。下一行需完整接收后才能判断。
+
+    返回:
+    - (已结束的块的源文本列表, 剩余的未结束文本)
+    """
+    blocks = []
+    block_start = 0
+    position = 0
+    fence = None
+    previous_blank = False
+    has_content = False
+    while True:
+        end = text.find("\n", position)
+        if end < 0:
+            break
+        line = text[position:end]
+        if fence is not None:
+            if line.rstrip(" ") == fence:
+                fence = None
+        elif not line.strip():
+            previous_blank = has_content
+        else:
+            if previous_blank and not _CONTINUATION_RE.match(line):
+                blocks.append(text[block_start:position])
+                block_start = position
+            elif line.startswith("<"):
+                # 原始 HTML 块可能跨越空行，之后不再分块
+                break
+            previous_blank = False
+            has_content = True
+            match = _FENCE_OPEN_RE.match(line)
+            if match:
+                fence = match.group("fence")
+            elif line.startswith(("```", "~~~")):
+                # 无法确定是否为围栏代码块，之后不再分块
+                break
+        position = end + 1
+    return blocks, text[block_start:]
+
+
+class IncrementalMarkdownRenderer:
+    """
+    流式输出的增量 Markdown 渲染
+
+    已经结束的块（段落、列表、表格、围栏代码块等）的 HTML 被缓存，
+    每次只重新转换末尾尚未结束的块，结果与整篇转换完全相同；
+    流式输出期间末尾尚未闭合的围栏代码块显示为纯文本，闭合后才高亮。
+    流式输出期间不猜测未标注语言的代码块，输出结束后的渲染再补上高亮。
+    文本不是上一次的延续（如清空后重新输出）时自动重置缓存。
+    """
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        # 已结束的块的源文本，以及每个块的 [源文本, HTML, 是否有延后高亮的代码块]
+        self._closed_source = ""
+        self._closed_blocks = []
+
+    def render(self, text, streaming=False):
+        """
+        参数:
+        - text: 当前的完整文本
+        - streaming: 是否正在流式输出
+
+        返回:
+        - str: 整篇文本的 HTML 片段
+        """
+        if not text.startswith(self._closed_source):
+            self.reset()
+        tail = text[len(self._closed_source):]
+        if _REFERENCE_RE.search(tail):
+            return _convert_tail(text, streaming)[0].strip()
+
+        blocks, tail = _split_closed_blocks(tail)
+        for block in blocks:
+            self._closed_source += block
+            self._closed_blocks.append([block, *_markdown_to_html(block, streaming)])
+        if not streaming:
+            for entry in self._closed_blocks:
+                if entry[2]:
+                    entry[1:] = _markdown_to_html(entry[0])
+        html = "".join(entry[1] for entry in self._closed_blocks) + _convert_tail(tail, streaming)[0]
+        return html.strip()
+
+
+# 每个 QTextBrowser 对应一个增量渲染器
+_renderers = weakref.WeakKeyDictionary()
+# 每个 QTextBrowser 当前安装的默认样式表
+_installed_stylesheets = weakref.WeakKeyDictionary()
+# (主题, 字体, 圆角) -> 样式表
+_stylesheets = {}
+
+
+def render_markdown(text_browser, text, is_dark_theme=False, streaming=False):
     """
     将 Markdown 文本渲染为 HTML 并显示在 QTextBrowser 中
     
@@ -13,77 +297,96 @@ def render_markdown(text_browser, text, is_dark_theme=False):
         text_browser: QTextBrowser 实例
         text: Markdown 格式的文本
         is_dark_theme: 是否使用暗色主题
+        streaming: 是否正在流式输出，此时不猜测代码块的语言
     """
     if not text:
         return
         
     try:
-        # 配置代码高亮扩展
-        codehilite_extension = CodeHiliteExtension(
-            noclasses=False,  # 使用CSS类而非内联样式
-            linenums=False,   # 默认不显示行号
-            guess_lang=True   # 自动检测语言
-        )
-
-        # 将 Markdown 转换为 HTML
-        html = markdown.markdown(
-            text,
-            extensions=[
-                'tables', 
-                codehilite_extension, 
-                FencedCodeExtension(),
-                'nl2br'  # 将换行符转换为<br>标签
-            ]
-        )
-        
-        # 处理代码语言标签
-        html = process_language_tags(html)
-        
-        # 根据主题选择适当的样式
-        if is_dark_theme:
-            styled_html = generate_dark_html(html)
-        else:
-            styled_html = generate_light_html(html)
+        renderer = _renderers.get(text_browser)
+        if renderer is None:
+            renderer = _renderers[text_browser] = IncrementalMarkdownRenderer()
+        html = renderer.render(text, streaming)
         
-        # 设置 HTML 内容
-        text_browser.setHtml(styled_html)
+        # 样式表按主题只生成一次，作为文档的默认样式表安装，每次渲染只提供正文 HTML
+        stylesheet = theme_stylesheet(is_dark_theme)
+        if _installed_stylesheets.get(text_browser) is not stylesheet:
+            text_browser.document().setDefaultStyleSheet(stylesheet)
+            _installed_stylesheets[text_browser] = stylesheet
         
-        # 处理 Qt 事件循环，确保 UI 及时更新
-        QApplication.processEvents()
+        # 设置 HTML 内容（body 规则只作用于显式的 body 元素）
+        text_browser.setHtml(f"<html><body>{html}</body></html>")
     except Exception as e:
         text_browser.setPlainText(f"Markdown 渲染错误: {str(e)}\n\n{text}")
 
-def append_markdown_text(text_browser, current_text, new_text, is_markdown_mode, is_dark_theme=False):
+def display_text(text_browser, text, is_markdown_mode, is_dark_theme=False, streaming=False):
     """
-    追加文本到输出区域，根据模式决定是否渲染为 Markdown
+    显示完整的输出文本，根据模式决定是否渲染为 Markdown，并滚动到底部
     
     Args:
         text_browser: QTextBrowser 实例
-        current_text: 当前已有的原始文本
-        new_text: 要追加的新文本
+        text: 当前的完整原始文本
         is_markdown_mode: 是否启用 Markdown 模式
         is_dark_theme: 是否使用暗色主题
-    
-    Returns:
-        updated_text: 更新后的原始文本
+        streaming: 是否正在流式输出
     """
-    updated_text = current_text + new_text
-    
     if is_markdown_mode:
         # 更新 Markdown 渲染
-        render_markdown(text_browser, updated_text, is_dark_theme)
+        render_markdown(text_browser, text, is_dark_theme, streaming)
     else:
         # 直接显示文本
-        text_browser.setPlainText(updated_text)
+        text_browser.setPlainText(text)
     
     # 滚动到底部
     sb = text_browser.verticalScrollBar()
     sb.setValue(sb.maximum())
-    
-    # 处理 Qt 事件循环，确保 UI 及时更新
-    QApplication.processEvents()
-    
-    return updated_text
+
+class RenderScheduler:
+    """
+    限制流式输出的渲染频率
+
+    收到新文本时调用 request()，渲染最多每秒执行 OUTPUT_MAX_FPS 次，
+    期间到达的文本合并到下一次渲染；流结束时调用 flush() 立即完成最后一次渲染。
+    渲染在 Qt 事件循环中执行，不再需要在每个增量之后调用 processEvents()。
+    """
+
+    def __init__(self, parent, render):
+        """
+        Args:
+            parent: 定时器的父对象
+            render: 渲染函数，不带参数
+        """
+        self.render = render
+        self.pending = False
+        self.last_render_at = 0.0
+        self.timer = QTimer(parent)
+        self.timer.setSingleShot(True)
+        self.timer.timeout.connect(self._on_timeout)
+
+    def request(self):
+        """请求一次渲染；距离上一次渲染不足一帧时延后执行"""
+        self.pending = True
+        if self.timer.isActive():
+            return
+        interval = 1.0 / max(1, src.config.config.OUTPUT_MAX_FPS)
+        delay = max(0.0, interval - (time.perf_counter() - self.last_render_at))
+        self.timer.start(int(delay * 1000))
+
+    def flush(self):
+        """立即执行尚未完成的渲染"""
+        self.timer.stop()
+        if self.pending:
+            self._on_timeout()
+
+    def cancel(self):
+        """丢弃尚未完成的渲染"""
+        self.timer.stop()
+        self.pending = False
+
+    def _on_timeout(self):
+        self.pending = False
+        self.last_render_at = time.perf_counter()
+        self.render()
 
 def process_language_tags(html):
     """
@@ -126,15 +429,11 @@ def process_language_tags(html):
     
     return re.sub(pattern, add_language_label, html)
 
-def generate_light_html(html_content):
-    """生成带有亮色主题样式的 HTML"""
+def _light_stylesheet(font_family, border_radius):
+    """生成亮色主题的样式表"""
     theme = src.config.config.THEMES["light"]
-    font_family = src.config.config.UI_FONT_FAMILY
     
     return f"""
-    <html>
-    <head>
-    <style>
         body {{ 
             font-family: {font_family};
             color: {theme['text']};
@@ -153,13 +452,13 @@ def generate_light_html(html_content):
         code {{ 
             background-color: {theme['md_code_bg']};
             padding: 2px 4px;
-            border-radius: {src.config.config.UI_BORDER_RADIUS};
+            border-radius: {border_radius};
             font-family: Consolas, "Courier New", monospace;
         }}
         pre {{ 
             background-color: {theme['md_code_bg']};
             padding: 0;
-            border-radius: {src.config.config.UI_BORDER_RADIUS};
+            border-radius: {border_radius};
             overflow-x: auto;
             margin: 16px 0;
             border: 1px solid #E2E8F0;
@@ -280,21 +579,13 @@ def generate_light_html(html_content):
         .codehilite .vi {{ color: #bb60d5 }}
         .codehilite .vm {{ color: #bb60d5 }}
         .codehilite .il {{ color: #40a070 }}
-    </style>
-    </head>
-    <body>{html_content}</body>
-    </html>
     """
 
-def generate_dark_html(html_content):
-    """生成带有暗色主题样式的 HTML"""
+def _dark_stylesheet(font_family, border_radius):
+    """生成暗色主题的样式表"""
     theme = src.config.config.THEMES["dark"]
-    font_family = src.config.config.UI_FONT_FAMILY
     
     return f"""
-    <html>
-    <head>
-    <style>
         body {{ 
             font-family: {font_family};
             color: {theme['text']};
@@ -314,13 +605,13 @@ def generate_dark_html(html_content):
             background-color: {theme['md_code_bg']};
             color: {theme['text']};
             padding: 2px 4px;
-            border-radius: {src.config.config.UI_BORDER_RADIUS};
+            border-radius: {border_radius};
             font-family: Consolas, "Courier New", monospace;
         }}
         pre {{ 
             background-color: {theme['md_code_bg']};
             padding: 0;
-            border-radius: {src.config.config.UI_BORDER_RADIUS};
+            border-radius: {border_radius};
             overflow-x: auto;
             margin: 16px 0;
             border: 1px solid #3E4C5A;
@@ -443,8 +734,22 @@ def generate_dark_html(html_content):
         .codehilite .vi {{ color: #f8f8f2 }}
         .codehilite .vm {{ color: #f8f8f2 }}
         .codehilite .il {{ color: #ae81ff }}
-    </style>
-    </head>
-    <body>{html_content}</body>
-    </html>
-    """
\ No newline at end of file
+    """
+
+def theme_stylesheet(is_dark_theme=False):
+    """
+    返回 Markdown 显示使用的样式表
+
+    样式表按主题、字体与圆角配置缓存，只在这些配置变化时重新生成。
+
+    Args:
+        is_dark_theme: 是否使用暗色主题
+    """
+    font_family = src.config.config.UI_FONT_FAMILY
+    border_radius = src.config.config.UI_BORDER_RADIUS
+    key = ("dark" if is_dark_theme else "light", font_family, border_radius)
+    stylesheet = _stylesheets.get(key)
+    if stylesheet is None:
+        build = _dark_stylesheet if is_dark_theme else _light_stylesheet
+        stylesheet = _stylesheets[key] = build(font_family, border_radius)
+    return stylesheet
@@ -7,17 +7,21 @@ import src.config.config
 from src.gui.lang import STRINGS
 import src.gui.utils
 import src.gui.prefix
-from src.gui.markdown_viewer import render_markdown, append_markdown_text
+from src.gui.markdown_viewer import render_markdown, display_text, RenderScheduler
 
 class OutputArea(QWidget):
     """输出区域，用于显示和导出模型回答"""
     
     export_requested = pyqtSignal()
+    stop_requested = pyqtSignal()
     
     def __init__(self, parent):
         super().__init__(parent)
         self.parent = parent
         self.raw_output_text = ""
+        self.is_streaming = False
+        # 合并流式增量，按 OUTPUT_MAX_FPS 限制渲染频率
+        self.render_scheduler = RenderScheduler(self, self.render_output)
         self.init_ui()
         
     def init_ui(self):
@@ -76,6 +80,13 @@ class OutputArea(QWidget):
         self.copy_button.setObjectName("copyButton")
         buttons_layout.addWidget(self.copy_button)
         
+        # 停止生成按钮，仅在流式输出期间可用
+        self.stop_button = QPushButton(STRINGS[self.parent.current_lang]['stop_generation'])
+        self.stop_button.setObjectName("stopButton")
+        self.stop_button.setEnabled(False)
+        self.stop_button.clicked.connect(self.stop_requested.emit)
+        buttons_layout.addWidget(self.stop_button)
+        
         # 导出按钮
         self.export_button = QPushButton(STRINGS[self.parent.current_lang]['export_conversation'])
         self.export_button.setObjectName("exportButton")
@@ -85,32 +96,50 @@ class OutputArea(QWidget):
         return buttons_layout
     
     def append_text(self, text):
-        """API调用将使用此方法来添加文本"""
-        self.raw_output_text = append_markdown_text(
+        """API调用将使用此方法来添加文本，显示在下一次渲染时更新"""
+        if not text:
+            return
+        self.raw_output_text += text
+        self.render_scheduler.request()
+
+    def render_output(self):
+        """把当前的完整文本显示到输出区域"""
+        display_text(
             self.output_text,
             self.raw_output_text,
-            text,
             self.toggle_markdown_button.isChecked(),
-            self.parent.current_theme == "dark"
+            self.parent.current_theme == "dark",
+            self.is_streaming
         )
 
     def clear_output(self):
         """清空输出区域"""
+        self.render_scheduler.cancel()
         self.output_text.clear()
         self.raw_output_text = ""
 
     def toggle_markdown_display(self):
         """切换Markdown和纯文本显示模式"""
+        self.render_scheduler.cancel()
         is_markdown = self.toggle_markdown_button.isChecked()
         if is_markdown:
             self.toggle_markdown_button.setText("Markdown")
             # 将原始文本转换为HTML并显示
-            render_markdown(self.output_text, self.raw_output_text, self.parent.current_theme == "dark")
+            render_markdown(self.output_text, self.raw_output_text, self.parent.current_theme == "dark", self.is_streaming)
         else:
             self.toggle_markdown_button.setText(STRINGS[self.parent.current_lang]['show_source'])
             # 显示原始文本
             self.output_text.setPlainText(self.raw_output_text)
 
+    def set_streaming(self, is_streaming):
+        """根据是否正在流式输出更新停止按钮状态，结束时完成最后一次渲染"""
+        self.stop_button.setEnabled(is_streaming)
+        self.is_streaming = is_streaming
+        if not is_streaming:
+            # 即使没有新文本也重新渲染，为流式输出期间未猜测语言的代码块补上高亮
+            self.render_scheduler.cancel()
+            self.render_output()
+
     def export_conversation(self, folder_path="", prefix_text="", suffix_text="", image_path=None, ocr_text=""):
         """导出当前对话"""
         self.export_requested.emit()
@@ -126,6 +155,7 @@ class OutputArea(QWidget):
         """更新界面上的文本为当前语言"""
         self.output_label.setText(STRINGS[self.parent.current_lang]['output_result'])
         self.copy_button.setText(STRINGS[self.parent.current_lang]['copy_and_get_answer'])
+        self.stop_button.setText(STRINGS[self.parent.current_lang]['stop_generation'])
         self.export_button.setText(STRINGS[self.parent.current_lang]['export_conversation'])
         
         # 更新Markdown切换按钮文本
@@ -172,7 +202,7 @@ class OutputArea(QWidget):
             #markdownToggleButton:hover {{
                 background-color: {theme['button_hover']};
             }}
-            #copyButton, #exportButton {{
+            #copyButton, #stopButton, #exportButton {{
                 background-color: {theme['button_bg']};
                 color: {theme['button_text']};
                 padding: {padding_normal};
@@ -180,9 +210,19 @@ class OutputArea(QWidget):
                 font-size: {font_size_large};
                 min-height: 36px;
             }}
-            #copyButton:hover, #exportButton:hover {{
+            #copyButton:hover, #stopButton:hover, #exportButton:hover {{
                 background-color: {theme['button_hover']};
             }}
+            #stopButton {{
+                background-color: {theme['button_danger_bg']};
+            }}
+            #stopButton:hover {{
+                background-color: {theme['button_danger_hover']};
+            }}
+            #stopButton:disabled {{
+                background-color: {theme['input_border']};
+                color: {theme['text_secondary']};
+            }}
             #exportButton {{
                 background-color: {theme['button_success_bg']};
             }}
@@ -5,12 +5,15 @@ from PyQt6.QtCore import Qt, QPoint, QEvent
 import src.config.config
 import src.gui.utils
 import src.api.api
+from src.api.engine import shutdown_engine
+from src.api.prewarm import cancel_prewarm
 from src.gui.lang import STRINGS
 import src.gui.prefix
 from src.gui.title_bar import TitleBar
 from src.gui.sidebar import Sidebar
 from src.gui.content_area import ContentArea
 from src.gui.settings_dialog import SettingsDialog
+from src.gui.comparison_dialog import ComparisonDialog
 
 class MainWindow(QMainWindow):
     def __init__(self):
@@ -18,6 +21,8 @@ class MainWindow(QMainWindow):
         self.old_pos = None  # 用于窗口拖动
         self.current_lang = 'zh'
         self.current_theme = src.config.config.DEFAULT_THEME
+        # 多模型对比窗口，首次打开时创建，关闭后保留结果
+        self.comparison_dialog = None
         
         # 启用窗口透明度
         self.setAttribute(Qt.WidgetAttribute.WA_TranslucentBackground)
@@ -76,6 +81,8 @@ class MainWindow(QMainWindow):
         self.title_bar.apply_theme()
         self.sidebar.apply_theme()
         self.content_area.apply_theme()
+        if self.comparison_dialog is not None:
+            self.comparison_dialog.apply_theme()
         
         # 设置主窗口样式
         self.setStyleSheet(f"""
@@ -172,6 +179,15 @@ class MainWindow(QMainWindow):
         self.sidebar.lang_button.setText("🀄" if self.current_lang == 'zh' else "🔤")
         self.update_texts()
 
+    def closeEvent(self, event):
+        # 关闭窗口前停止正在进行的流式请求与预热，并关闭 provider engine 的事件循环与连接
+        cancel_prewarm()
+        self.content_area.shutdown()
+        if self.comparison_dialog is not None:
+            self.comparison_dialog.shutdown()
+        shutdown_engine()
+        super().closeEvent(event)
+
     def mousePressEvent(self, event):
         if event.button() == Qt.MouseButton.LeftButton:
             self.old_pos = event.globalPosition().toPoint()
@@ -189,6 +205,8 @@ class MainWindow(QMainWindow):
     def update_texts(self):
         self.title_bar.update_title()
         self.content_area.update_texts()
+        if self.comparison_dialog is not None:
+            self.comparison_dialog.update_texts()
 
     def show_help(self):
         help_text = STRINGS[self.current_lang]['help_text']
@@ -235,6 +253,16 @@ class MainWindow(QMainWindow):
         dialog = SettingsDialog(self)
         dialog.exec()
 
+    def show_comparison(self):
+        """打开多模型对比窗口（非模态，可与主窗口同时使用）"""
+        if self.comparison_dialog is None:
+            self.comparison_dialog = ComparisonDialog(self)
+        else:
+            self.comparison_dialog.populate_models()
+        self.comparison_dialog.show()
+        self.comparison_dialog.raise_()
+        self.comparison_dialog.activateWindow()
+
     def clear_content(self):
         # 清除输出区域
         self.content_area.output_area.clear_output()
@@ -2,6 +2,7 @@ from PyQt6.QtWidgets import QDialog, QVBoxLayout, QCheckBox, QPushButton, QHBoxL
 from PyQt6.QtCore import Qt
 from src.gui.lang import STRINGS
 import src.config.config
+from src.api.gemini_cache import clear_context_cache
 
 class SettingsDialog(QDialog):
     def __init__(self, parent=None):
@@ -146,6 +147,9 @@ class SettingsDialog(QDialog):
             # 清空对话历史记录
             if hasattr(self.parent.content_area, 'dialogue_history'):
                 self.parent.content_area.dialogue_history = []
+                self.parent.content_area.dialogue_transcript = []
+            # 删除服务端的对话上下文缓存
+            clear_context_cache()
             
             # 设置状态消息
             self.parent.content_area.output_area.set_status(STRINGS[self.parent.current_lang]['reset_dialogue_context'])
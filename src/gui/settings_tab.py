@@ -3,6 +3,7 @@ from PyQt6.QtWidgets import (QWidget, QVBoxLayout, QHBoxLayout, QLabel, QLineEdi
 from PyQt6.QtCore import pyqtSignal, Qt
 import src.config.config
 from src.gui.lang import STRINGS
+from src.api.prewarm import schedule_prewarm
 
 class SettingsTab(QWidget):
     """设置选项卡，用于管理文件夹、模型选择等基本设置"""
@@ -111,8 +112,12 @@ class SettingsTab(QWidget):
         # 连接信号
         self.folder_button.clicked.connect(self.select_folder)
         self.provider_combo.currentTextChanged.connect(self.on_provider_changed)
+        self.model_combo.currentTextChanged.connect(self.on_model_changed)
         self.aux_mode_combo.currentIndexChanged.connect(self.on_auxiliary_mode_changed)
         
+        # 启动时预热默认模型的连接
+        schedule_prewarm(self.get_selected_model())
+        
     def update_model_list(self, include_local=False):
         """更新模型列表"""
         current_model = self.model_combo.currentText() if self.model_combo.count() > 0 else ""
@@ -136,6 +141,11 @@ class SettingsTab(QWidget):
         self.update_model_list(self.provider_combo.currentText() in ["LMstudio", "Kobold", "Ollama"])
         self.provider_changed.emit(provider)
         
+    def on_model_changed(self, model_name):
+        """处理模型选择变更，在后台预热该模型提供商的连接"""
+        if model_name:
+            schedule_prewarm(model_name)
+        
     def on_auxiliary_mode_changed(self, index):
         """处理附加模式选择变更"""
         mode_key = self.aux_mode_combo.itemData(index)
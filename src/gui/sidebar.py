@@ -41,6 +41,7 @@ class Sidebar(QWidget):
             ("🌙" if self.parent.current_theme == "light" else "☀️", "themeButton", self.parent.toggle_theme, "切换主题"),
             ("❓", "helpButton", self.parent.show_help, "帮助"),
             ("⚙️", "settingsButton", self.parent.show_settings, "设置"),
+            ("⚖️", "compareButton", self.parent.show_comparison, "模型对比"),
             ("🗑️", "clearButton", self.parent.clear_content, "清除内容"),
             ("🔄", "refreshButton", lambda: self.parent.update_model_list(True), "刷新模型列表"),
         ]
@@ -81,7 +82,7 @@ class Sidebar(QWidget):
                 border-bottom-left-radius: {border_radius};
                 border-right: none;
             }}
-            #pinButton, #langButton, #themeButton, #helpButton, #settingsButton, #clearButton, #refreshButton {{
+            #pinButton, #langButton, #themeButton, #helpButton, #settingsButton, #compareButton, #clearButton, #refreshButton {{
                 background-color: transparent;
                 border: none;
                 color: {theme['text']};
@@ -90,7 +91,7 @@ class Sidebar(QWidget):
                 margin: 2px;
                 border-radius: 12px;
             }}
-            #pinButton:hover, #langButton:hover, #themeButton:hover, #helpButton:hover, #settingsButton:hover {{
+            #pinButton:hover, #langButton:hover, #themeButton:hover, #helpButton:hover, #settingsButton:hover, #compareButton:hover {{
                 background-color: rgba(255, 255, 255, 0.15);
                 border-radius: 12px;
             }}